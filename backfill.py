@@ -0,0 +1,194 @@
+"""
+Módulo de Relleno de Huecos (backfill).
+
+La sincronización normal solo avanza desde el último ID guardado, así que los huecos
+que dejan los lotes fallidos nunca se reparan, y archivar un canal grande desde cero es
+un único recorrido en serie. El backfill:
+
+1.  Calcula los rangos de IDs que faltan en la colección hasta el último ID guardado
+    (o hasta el mensaje más reciente del canal si la colección está vacía), descontando
+    los segmentos que ya se rellenaron en ejecuciones anteriores.
+2.  Agrupa esos rangos en segmentos de como mucho BACKFILL_SEGMENT_SIZE IDs.
+3.  Recorre BACKFILL_CONCURRENCY segmentos a la vez con `iter_messages(min_id, max_id)`,
+    guardando solo los mensajes que faltaban, con el mismo pipeline de descargas y el
+    mismo escritor por lotes que la sincronización normal.
+4.  Registra cada segmento terminado sin errores en el estado del canal, para no volver
+    a pedirlo (los IDs de mensajes borrados o de servicio siempre serán "huecos").
+"""
+import asyncio
+
+from telethon.tl.types import Message
+
+import db
+import downloader
+import engine
+import ratelimit
+import schema
+import settings
+import tuning
+from writer import MessageWriter
+
+
+def missing_ranges(stored_ids, upper, done=()):
+    """
+    Rangos [lo, hi] (inclusivos) de IDs entre 1 y `upper` que no están en `stored_ids`
+    (un iterable ordenado de forma ascendente) ni dentro de los rangos de `done`.
+    """
+    ranges = []
+    expected = 1
+    for message_id in stored_ids:
+        if message_id > upper:
+            break
+        if message_id > expected:
+            ranges.append((expected, message_id - 1))
+        expected = max(expected, message_id + 1)
+    if expected <= upper:
+        ranges.append((expected, upper))
+    return subtract_ranges(ranges, done)
+
+
+def subtract_ranges(ranges, done):
+    """Quita de `ranges` (ordenados y disjuntos) los IDs cubiertos por los rangos de `done`."""
+    for done_lo, done_hi in sorted(done):
+        result = []
+        for lo, hi in ranges:
+            if hi < done_lo or lo > done_hi:
+                result.append((lo, hi))
+                continue
+            if lo < done_lo:
+                result.append((lo, done_lo - 1))
+            if hi > done_hi:
+                result.append((done_hi + 1, hi))
+        ranges = result
+    return ranges
+
+
+def split_segments(ranges, segment_size=None):
+    """
+    Agrupa los rangos que faltan en segmentos de como mucho `segment_size` IDs.
+    Devuelve una lista de (lo, hi, rangos) donde `rangos` son los huecos dentro del segmento.
+    """
+    segment_size = segment_size or settings.BACKFILL_SEGMENT_SIZE
+    segments = []
+    current = None
+    for lo, hi in ranges:
+        while lo <= hi:
+            if current is None or lo > current[0] + segment_size - 1:
+                current = (lo, lo + segment_size - 1, [])
+                segments.append(current)
+            end = min(hi, current[1])
+            current[2].append((lo, end))
+            lo = end + 1
+    # El segmento termina en su último hueco, no en el límite teórico
+    return [(seg_lo, gaps[-1][1], gaps) for seg_lo, _, gaps in segments]
+
+
+def _in_ranges(message_id, ranges):
+    return any(lo <= message_id <= hi for lo, hi in ranges)
+
+
+async def find_segments(client, channel_name, collection_name, segment_size=None, log=print):
+    """Calcula los segmentos que faltan de un canal (ver `split_segments`)."""
+    upper = await db.run(db.get_latest_message_id, collection_name)
+    if not upper:
+        # Colección vacía: el historial completo, hasta el mensaje más reciente del canal
+        latest = await ratelimit.default_controller().call(
+            client.get_messages, channel_name, limit=1, log=log
+        )
+        upper = latest[0].id if latest else 0
+    done = await db.run(db.get_backfilled_segments, collection_name)
+
+    def scan():
+        return missing_ranges(db.iter_message_ids(collection_name), upper, done)
+
+    ranges = await db.run(scan)
+    log(f"Found {sum(hi - lo + 1 for lo, hi in ranges)} missing message IDs "
+        f"in {len(ranges)} gaps up to ID {upper}")
+    return split_segments(ranges, segment_size)
+
+
+async def backfill_channel(client, channel_name, log=print, progress=None, concurrency=None,
+                           segment_size=None, is_running=None, resumed=None):
+    """
+    Rellena los huecos de un canal recorriendo sus segmentos en paralelo con `client`
+    (ya iniciado). `is_running` es un callable opcional; si devuelve False, el backfill
+    se detiene sin registrar los segmentos a medias; mientras el `asyncio.Event` opcional
+    `resumed` esté sin activar, los segmentos pausan su lectura del historial. Devuelve el
+    `db.FlushResult` total.
+    """
+    is_running = is_running or (lambda: True)
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+    collection_name = engine.collection_name_for(channel_name)
+
+    segments = await find_segments(client, channel_name, collection_name, segment_size, log=log)
+    if not segments:
+        log("No gaps to backfill.")
+        return db.FlushResult.EMPTY
+    log(f"Backfilling {len(segments)} segments, {concurrency} at a time...")
+
+    totals = db.FlushResult.EMPTY
+    semaphore = asyncio.Semaphore(concurrency)
+    # Un único ajuste para todos los segmentos del canal
+    tuner = tuning.SyncTuner(collection_name, log=log)
+    pipeline = downloader.MediaDownloadPipeline(collection_name, log=log)
+    pipeline.start()
+
+    def on_flush(batch, result):
+        if progress is not None:
+            media = sum(1 for m in batch if 'saved_media_path' in m)
+            progress.add(messages=result.inserted, media=media)
+
+    async def run_segment(lo, hi, gaps):
+        nonlocal totals
+        async with semaphore:
+            if not is_running():
+                return
+            writer = MessageWriter(collection_name, log=log, on_flush=on_flush, tuner=tuner)
+            writer.start()
+            stopped = False
+            try:
+                # min_id y max_id son exclusivos
+                async for message in ratelimit.iter_messages(
+                    client, channel_name, min_id=lo - 1, max_id=hi + 1, log=log, tuner=tuner,
+                    channel=collection_name,
+                ):
+                    if resumed is not None:
+                        await resumed.wait()
+                    if not is_running():
+                        stopped = True
+                        break
+                    if not isinstance(message, Message) or not _in_ranges(message.id, gaps):
+                        continue
+                    msg_dict = schema.message_document(message)
+                    pending = None
+                    if message.media:
+                        pending = await pipeline.submit(message, msg_dict)
+                    await writer.add(msg_dict, pending=pending)
+            finally:
+                await writer.close(discard=stopped or not is_running())
+            totals += writer.totals
+
+            if stopped or not is_running():
+                return
+            if writer.totals.failed:
+                log(f"Segment {lo}-{hi}: {writer.totals.failed} messages failed, "
+                    f"it will be retried on the next backfill")
+                return
+            await db.run(db.add_backfilled_segment, collection_name, lo, hi)
+            log(f"Segment {lo}-{hi} done: {writer.totals.inserted} messages recovered")
+
+    try:
+        results = await asyncio.gather(
+            *(run_segment(lo, hi, gaps) for lo, hi, gaps in segments), return_exceptions=True
+        )
+        # Un segmento fallido no detiene al resto; se reintentará en el próximo backfill
+        for (lo, hi, _), result in zip(segments, results):
+            if isinstance(result, Exception):
+                log(f"Segment {lo}-{hi} failed: {result}")
+    finally:
+        await pipeline.close(cancel=not is_running())
+
+    log(f"Backfill completed: {totals.inserted} messages recovered "
+        f"({totals.duplicates} duplicates, {totals.failed} failed)")
+    log(tuner.summary())
+    return totals
@@ -0,0 +1,4 @@
+"""
+Benchmarks de la aplicación. Se ejecutan desde la raíz del repositorio como módulos,
+p. ej. `python -m benchmarks.schema`.
+"""
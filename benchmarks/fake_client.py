@@ -0,0 +1,105 @@
+"""
+Cliente de Telegram falso para los benchmarks.
+
+`FakeTelegramClient` sirve un canal sintético (`benchmarks.synthetic`) con la parte de la
+API de Telethon que usa el motor: `get_messages` (páginas del historial), `download_media`
+y `iter_download` (descargas de multimedia). Los mensajes se generan al pedir cada página,
+así que el canal no ocupa memoria, y se puede simular:
+
+- `latency`: segundos de ida y vuelta de cada petición.
+- `bandwidth`: MB/s de cada descarga (0 = sin límite, solo el coste de escribir a disco).
+- `flood_every` / `flood_seconds`: un `FloodWaitError` de `flood_seconds` cada
+  `flood_every` peticiones.
+"""
+import asyncio
+import os
+
+from telethon.errors import FloodWaitError
+
+from benchmarks.synthetic import synthetic_message
+
+# Bloque de relleno de los archivos descargados (cada archivo empieza por su ID para que
+# el almacén deduplicado no los confunda)
+_FILLER = bytes(range(256)) * 4096
+
+
+class FakeTelegramClient:
+    """
+    Atributos:
+        requests (int): Peticiones recibidas (páginas y descargas).
+        flood_waits (int): FloodWaits lanzados.
+        bytes_served (int): Bytes de multimedia servidos.
+    """
+    def __init__(self, count, media_ratio=0.4, media_size=2 * 1024 * 1024, latency=0.0,
+                 bandwidth=0.0, flood_every=0, flood_seconds=1):
+        self.count = count
+        self.media_ratio = media_ratio
+        self.media_size = media_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.requests = 0
+        self.flood_waits = 0
+        self.bytes_served = 0
+        self.flood_sleep_threshold = 0
+
+    async def _request(self):
+        self.requests += 1
+        if self.flood_every and self.requests % self.flood_every == 0:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_messages(self, entity, limit=100, min_id=0, max_id=0, reverse=False):
+        await self._request()
+        upper = min(self.count, max_id - 1) if max_id else self.count
+        if reverse:
+            ids = range(min_id + 1, min(upper, min_id + limit) + 1)
+        else:
+            ids = range(upper, max(min_id, upper - limit), -1)
+        messages = []
+        for message_id in ids:
+            message = synthetic_message(message_id, media_ratio=self.media_ratio,
+                                        media_size=self.media_size)
+            message._client = self
+            messages.append(message)
+        return messages
+
+    async def _transfer(self, size):
+        if self.bandwidth:
+            await asyncio.sleep(size / (self.bandwidth * 1024 * 1024))
+        self.bytes_served += size
+
+    async def download_media(self, message, file=None, **kwargs):
+        await self._request()
+        size = message.file.size
+        await self._transfer(size)
+        name = message.file.name or f"{message.id}{message.file.ext or ''}"
+        path = os.path.join(file, name) if file and os.path.isdir(file) else file or name
+        # La escritura a disco es parte del coste real de una descarga
+        with open(path, "wb") as f:
+            f.write(f"{message.id}:".encode())
+            remaining = size - f.tell()
+            while remaining > 0:
+                block = _FILLER[:remaining]
+                f.write(block)
+                remaining -= len(block)
+        return path
+
+    async def iter_download(self, document, offset=0, request_size=128 * 1024, limit=None,
+                            file_size=None, **kwargs):
+        size = file_size or document.size
+        served = 0
+        while offset < size and (limit is None or served < limit):
+            await self._request()
+            length = min(request_size, size - offset)
+            await self._transfer(length)
+            chunk = (_FILLER * (length // len(_FILLER) + 1))[:length]
+            if offset == 0:
+                prefix = f"{document.id}:".encode()
+                chunk = prefix + chunk[len(prefix):]
+            yield chunk
+            offset += length
+            served += 1
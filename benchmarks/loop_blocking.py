@@ -0,0 +1,111 @@
+"""
+Benchmark del bloqueo del bucle asyncio por las llamadas a MongoDB.
+
+Reproduce las llamadas a la BD que hace una sincronización (checkpoint al empezar, un
+upsert por lote, consultas al índice de multimedia y el resumen final) sobre una colección
+temporal que se borra al terminar, de dos formas:
+
+- `direct`: llamando a pymongo desde el propio bucle, como se hacía antes.
+- `executor`: con `await db.run(...)`, como hace ahora el motor.
+
+Mientras tanto, una tarea "latido" duerme TICK segundos una y otra vez y mide cuánto
+se retrasa cada despertar: ese retraso es el tiempo en que el bucle no pudo atender la red
+de Telethon ni las descargas. Se informa del bloqueo total, el peor bloqueo y el p99.
+
+Necesita un MongoDB accesible (MONGO_URI).
+
+    python -m benchmarks.loop_blocking --count 20000 --batch-size 100
+"""
+import argparse
+import asyncio
+import time
+
+import db
+import schema
+import settings
+from benchmarks.synthetic import synthetic_channel
+
+TICK = 0.005
+
+
+async def heartbeat(lags, stop):
+    """Anota en `lags` el retraso de cada despertar respecto a lo pedido."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - started - TICK))
+
+
+async def persist(mode, collection_name, documents, batch_size):
+    """Las llamadas a la BD de una sincronización de `documents`, por lotes."""
+    if mode == "direct":
+        async def call(func, *args, **kwargs):
+            return func(*args, **kwargs)
+    else:
+        call = db.run
+
+    await call(db.get_sync_state, collection_name)
+    await call(db.get_latest_message_id, collection_name)
+    for i in range(0, len(documents), batch_size):
+        batch = documents[i:i + batch_size]
+        for msg in batch:
+            if msg.get("media_kind"):
+                await call(db.find_media, f"document:{msg['id']}")
+        await call(db.upsert_messages, collection_name, batch)
+        await call(db.save_sync_checkpoint, collection_name, batch[-1]["id"])
+        # Ceder el turno como lo hace el bucle real entre mensajes
+        await asyncio.sleep(0)
+    await call(db.save_sync_run, collection_name, {"state": "done"})
+
+
+async def measure(mode, documents, batch_size):
+    collection_name = f"_bench_loop_{mode}"
+    database = db.get_db()
+    database.drop_collection(collection_name)
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    try:
+        await persist(mode, collection_name, documents, batch_size)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        await monitor
+        database.drop_collection(collection_name)
+        database[settings.SYNC_STATE_COLLECTION].delete_one({"_id": collection_name})
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    return {
+        "messages_per_sec": len(documents) / elapsed,
+        "blocked": sum(lags),
+        "blocked_ratio": sum(lags) / elapsed,
+        "max_stall": lags[-1] if lags else 0.0,
+        "p99": p99,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure event-loop blocking by MongoDB calls.")
+    parser.add_argument("--count", type=int, default=10000, help="synthetic messages")
+    parser.add_argument("--media-ratio", type=float, default=0.4,
+                        help="fraction of messages with media")
+    parser.add_argument("--batch-size", type=int, default=100, help="messages per insert")
+    args = parser.parse_args(argv)
+
+    documents = [schema.message_document(message)
+                 for message in synthetic_channel(args.count, media_ratio=args.media_ratio)]
+    print(f"{args.count} synthetic messages, batches of {args.batch_size}")
+    print(f"{'mode':<10}{'msg/s':>10}{'blocked s':>12}{'blocked %':>11}"
+          f"{'max stall ms':>14}{'p99 ms':>9}")
+    for mode in ("direct", "executor"):
+        result = asyncio.run(measure(mode, documents, args.batch_size))
+        print(f"{mode:<10}{result['messages_per_sec']:>10.0f}{result['blocked']:>12.2f}"
+              f"{result['blocked_ratio']:>11.1%}{result['max_stall'] * 1000:>14.1f}"
+              f"{result['p99'] * 1000:>9.1f}")
+
+    db.close_client()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Sustituto en memoria de MongoDB para los benchmarks.
+
+`MemoryDB` implementa las funciones de `db` que usan una sincronización y un backfill
+(mensajes, checkpoint, índice de multimedia y segmentos rellenados) sobre diccionarios.
+Cada documento se codifica a BSON al insertarlo, como haría el driver, para que el coste
+de serializar siga contando.
+
+    with MemoryDB().installed():
+        await engine.sync_channel(client, "canal")
+"""
+import contextlib
+import threading
+
+import bson
+
+import db
+
+
+class MemoryDB:
+    """
+    Atributos:
+        collections (dict): {colección: {id: documento en BSON}}.
+        stored_bytes (int): Bytes de BSON insertados.
+    """
+    FUNCTIONS = (
+        "ensure_indexes", "upsert_messages", "get_latest_message_id", "get_sync_state",
+        "save_sync_checkpoint", "save_sync_run", "find_media", "register_media",
+        "iter_message_ids", "get_backfilled_segments", "add_backfilled_segment",
+    )
+
+    def __init__(self):
+        self.collections = {}
+        self.sync_state = {}
+        self.media_index = {}
+        self.stored_bytes = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Sustituye las funciones de `db` por las de este objeto mientras dure el bloque."""
+        originals = {name: getattr(db, name) for name in self.FUNCTIONS}
+        for name in self.FUNCTIONS:
+            setattr(db, name, getattr(self, name))
+        try:
+            yield self
+        finally:
+            for name, function in originals.items():
+                setattr(db, name, function)
+
+    def ensure_indexes(self, collection_name):
+        pass
+
+    def upsert_messages(self, collection_name, messages):
+        inserted = duplicates = 0
+        with self._lock:
+            collection = self.collections.setdefault(collection_name, {})
+            for message in messages:
+                if message["id"] in collection:
+                    duplicates += 1
+                    continue
+                encoded = bson.encode(message)
+                collection[message["id"]] = encoded
+                self.stored_bytes += len(encoded)
+                inserted += 1
+        return db.FlushResult(inserted, duplicates, 0)
+
+    def get_latest_message_id(self, collection_name):
+        return max(self.collections.get(collection_name) or [0])
+
+    def get_sync_state(self, collection_name):
+        return self.sync_state.get(collection_name)
+
+    def save_sync_checkpoint(self, collection_name, committed_id):
+        with self._lock:
+            state = self.sync_state.setdefault(collection_name, {"_id": collection_name})
+            state["last_committed_id"] = max(state.get("last_committed_id", 0), committed_id)
+
+    def save_sync_run(self, collection_name, stats):
+        with self._lock:
+            state = self.sync_state.setdefault(collection_name, {"_id": collection_name})
+            state["last_run"] = stats
+
+    def find_media(self, key):
+        return self.media_index.get(key)
+
+    def register_media(self, keys, path, size, sha256):
+        with self._lock:
+            for key in keys:
+                self.media_index.setdefault(key, {"_id": key, "path": path, "size": size,
+                                                  "sha256": sha256})
+
+    def iter_message_ids(self, collection_name):
+        with self._lock:
+            ids = sorted(self.collections.get(collection_name) or [])
+        return iter(ids)
+
+    def get_backfilled_segments(self, collection_name):
+        state = self.sync_state.get(collection_name) or {}
+        return [tuple(segment) for segment in state.get("backfilled_segments", [])]
+
+    def add_backfilled_segment(self, collection_name, lo, hi):
+        with self._lock:
+            state = self.sync_state.setdefault(collection_name, {"_id": collection_name})
+            segments = state.setdefault("backfilled_segments", [])
+            if [lo, hi] not in segments:
+                segments.append([lo, hi])
@@ -0,0 +1,72 @@
+"""
+Benchmark de los esquemas de almacenamiento (`schema.STORAGE_SCHEMAS`).
+
+Para cada esquema mide, sobre un canal sintético, el tamaño medio del documento en BSON,
+el tiempo de construirlo a partir del `Message` y, si hay un MongoDB accesible, el ritmo
+de inserción con `db.upsert_messages` en una colección temporal que se borra al terminar.
+Como referencia incluye `to_dict` (el documento que se guardaba antes).
+
+    python -m benchmarks.schema --count 20000
+    python -m benchmarks.schema --no-insert
+"""
+import argparse
+import time
+
+import bson
+
+import db
+import schema
+from benchmarks.synthetic import synthetic_channel
+
+
+def build_documents(messages, mode):
+    if mode == "to_dict":
+        return [message.to_dict() for message in messages]
+    return [schema.message_document(message, mode) for message in messages]
+
+
+def measure_insert(mode, documents, batch_size):
+    collection_name = f"_bench_schema_{mode}"
+    database = db.get_db()
+    database.drop_collection(collection_name)
+    started = time.perf_counter()
+    try:
+        for i in range(0, len(documents), batch_size):
+            db.upsert_messages(collection_name, documents[i:i + batch_size])
+        elapsed = time.perf_counter() - started
+        storage_size = database.command("collstats", collection_name).get("storageSize", 0)
+    finally:
+        database.drop_collection(collection_name)
+    return len(documents) / elapsed, storage_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare message storage schemas.")
+    parser.add_argument("--count", type=int, default=10000, help="synthetic messages")
+    parser.add_argument("--media-ratio", type=float, default=0.4,
+                        help="fraction of messages with media")
+    parser.add_argument("--batch-size", type=int, default=100, help="messages per insert")
+    parser.add_argument("--no-insert", action="store_true", help="skip the MongoDB insert test")
+    args = parser.parse_args(argv)
+
+    messages = list(synthetic_channel(args.count, media_ratio=args.media_ratio))
+    print(f"{args.count} synthetic messages, {args.media_ratio:.0%} with media")
+    print(f"{'schema':<10}{'avg bytes':>12}{'build ms':>12}{'insert msg/s':>15}{'storage KB':>13}")
+
+    for mode in ("to_dict",) + schema.STORAGE_SCHEMAS:
+        started = time.perf_counter()
+        documents = build_documents(messages, mode)
+        build_ms = (time.perf_counter() - started) * 1000
+        avg_size = sum(len(bson.encode(doc)) for doc in documents) / len(documents)
+
+        insert_rate, storage = "-", "-"
+        if not args.no_insert:
+            rate, storage_size = measure_insert(mode, documents, args.batch_size)
+            insert_rate, storage = f"{rate:.0f}", f"{storage_size / 1024:.0f}"
+        print(f"{mode:<10}{avg_size:>12.0f}{build_ms:>12.1f}{insert_rate:>15}{storage:>13}")
+
+    db.close_client()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Benchmark del bucle de sincronización completo, sin Telegram.
+
+Pasa un canal sintético por `engine.sync_channel` con un cliente falso
+(`benchmarks.fake_client`), descargando el multimedia a una carpeta temporal y guardando
+en un MongoDB en memoria (`benchmarks.memory_db`) o, con `--mongo`, en el MongoDB de
+MONGO_URI (colecciones `_bench_*` que se borran al terminar). Informa de:
+
+- mensajes/s y MB/s de multimedia de la sincronización completa;
+- el pico de memoria residente (RSS) del proceso;
+- el tiempo pasado en el camino caliente: construir los documentos (`to_dict` /
+  `schema.message_document`), las descargas y las inserciones (`db.upsert_messages`).
+  Las descargas e inserciones corren en paralelo, así que su tiempo puede superar al total.
+
+Con `--json` guarda el resultado para comparar ejecuciones y detectar regresiones, y con
+`--profile` perfila la sincronización con `profiling.SyncProfiler` (en PROFILE_DIR).
+
+    python -m benchmarks.sync --count 20000 --media-ratio 0.3 --media-size-kb 512
+    python -m benchmarks.sync --latency 0.05 --bandwidth 20 --flood-every 200
+    python -m benchmarks.sync --mongo --schema raw --json raw.json
+    python -m benchmarks.sync --count 50000 --profile
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import db
+import downloader
+import engine
+import media_store
+import profiling
+import ratelimit
+import schema
+import scheduler
+import settings
+from benchmarks.fake_client import FakeTelegramClient
+from benchmarks.memory_db import MemoryDB
+
+CHANNEL = "_bench_sync"
+
+# Funciones del camino caliente que se cronometran: (objeto, atributo, etiqueta)
+HOT_PATH = (
+    (schema, "message_document", "to_dict"),
+    (downloader.MediaDownloadPipeline, "_download", "downloads"),
+    (db, "upsert_messages", "inserts"),
+)
+
+
+class HotPathTimer:
+    """Acumula el tiempo y las llamadas de funciones cronometradas desde cualquier hilo."""
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, label, seconds):
+        with self._lock:
+            self.seconds[label] = self.seconds.get(label, 0.0) + seconds
+            self.calls[label] = self.calls.get(label, 0) + 1
+
+    def wrap(self, stack, owner, name, label):
+        """Cronometra `owner.name` hasta que se cierre `stack`."""
+        original = getattr(owner, name)
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.add(label, time.perf_counter() - started)
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.add(label, time.perf_counter() - started)
+        _patch(stack, owner, name, timed)
+
+
+def _patch(stack, owner, name, value):
+    original = getattr(owner, name)
+    setattr(owner, name, value)
+    stack.callback(setattr, owner, name, original)
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _drop_mongo_collections():
+    database = db.get_db()
+    for name in (CHANNEL, settings.SYNC_STATE_COLLECTION, settings.MEDIA_INDEX_COLLECTION):
+        database.drop_collection(name)
+    db._indexed_collections.discard(CHANNEL)
+
+
+async def run_benchmark(args):
+    client = FakeTelegramClient(
+        args.count, media_ratio=args.media_ratio, media_size=args.media_size_kb * 1024,
+        latency=args.latency, bandwidth=args.bandwidth, flood_every=args.flood_every,
+        flood_seconds=args.flood_seconds,
+    )
+    timer = HotPathTimer()
+    progress = scheduler.ChannelProgress(CHANNEL)
+    log = print if args.verbose else (lambda text: None)
+
+    with contextlib.ExitStack() as stack:
+        workdir = tempfile.mkdtemp(prefix="bench_sync_")
+        stack.callback(shutil.rmtree, workdir, ignore_errors=True)
+        _patch(stack, settings, "STORAGE_ROOT", workdir)
+        _patch(stack, settings, "DOWNLOADS_DIR", workdir)
+        _patch(stack, settings, "MEDIA_STORE_DIR", f"{workdir}/store")
+        _patch(stack, settings, "STORAGE_SCHEMA", args.schema)
+        _patch(stack, settings, "HISTORY_PAGE_SIZE", args.page_size)
+        _patch(stack, settings, "HISTORY_PAGE_DELAY", args.page_delay)
+        # Almacén y controlador de ritmo propios del benchmark
+        _patch(stack, media_store, "_default_store", None)
+        _patch(stack, ratelimit, "_default_controller",
+               ratelimit.RateController(rate=args.rate, max_rate=args.rate, log=log))
+
+        if args.mongo:
+            _patch(stack, settings, "SYNC_STATE_COLLECTION", "_bench_sync_state")
+            _patch(stack, settings, "MEDIA_INDEX_COLLECTION", "_bench_media_index")
+            _drop_mongo_collections()
+            stack.callback(_drop_mongo_collections)
+        else:
+            stack.enter_context(MemoryDB().installed())
+        # Después de instalar la BD en memoria, para cronometrar la que se usa
+        for owner, name, label in HOT_PATH:
+            timer.wrap(stack, owner, name, label)
+
+        rss_before = peak_rss_mb()
+        profiler = profiling.SyncProfiler() if args.profile else None
+        started = time.perf_counter()
+        sync = engine.sync_channel(client, CHANNEL, log=log, progress=progress)
+        result = await (profiler.run(sync) if profiler else sync)
+        elapsed = time.perf_counter() - started
+        if profiler:
+            profiler.save()
+
+    megabytes = progress.bytes / (1024 * 1024)
+    return {
+        "state": result.state,
+        "messages": result.totals.inserted,
+        "media": result.media,
+        "elapsed": elapsed,
+        "messages_per_sec": result.totals.inserted / elapsed,
+        "megabytes": megabytes,
+        "mb_per_sec": megabytes / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_before_mb": rss_before,
+        "requests": client.requests,
+        "flood_waits": client.flood_waits,
+        "hot_path": {
+            label: {"seconds": timer.seconds.get(label, 0.0), "calls": timer.calls.get(label, 0)}
+            for _, _, label in HOT_PATH
+        },
+        "options": vars(args),
+    }
+
+
+def print_report(report):
+    print(f"{report['messages']} messages ({report['state']}) in {report['elapsed']:.2f}s: "
+          f"{report['messages_per_sec']:.0f} msg/s")
+    print(f"{report['media']} media files, {report['megabytes']:.1f} MB: "
+          f"{report['mb_per_sec']:.1f} MB/s")
+    if report["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB "
+              f"({report['peak_rss_before_mb']:.0f} MB before the sync)")
+    print(f"Telegram requests: {report['requests']}, flood waits: {report['flood_waits']}")
+    print(f"{'hot path':<12}{'seconds':>10}{'calls':>10}{'% of total':>12}")
+    for label, timing in report["hot_path"].items():
+        share = timing["seconds"] / report["elapsed"] if report["elapsed"] else 0.0
+        print(f"{label:<12}{timing['seconds']:>10.2f}{timing['calls']:>10}{share:>12.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sync loop with a fake Telegram client.")
+    parser.add_argument("--count", type=int, default=5000, help="synthetic messages")
+    parser.add_argument("--media-ratio", type=float, default=0.3,
+                        help="fraction of messages with media")
+    parser.add_argument("--media-size-kb", type=int, default=256, help="size of each media file")
+    parser.add_argument("--schema", choices=schema.STORAGE_SCHEMAS, default=settings.STORAGE_SCHEMA)
+    parser.add_argument("--page-size", type=int, default=100, help="messages per history page")
+    parser.add_argument("--page-delay", type=float, default=0.0,
+                        help="pause between history pages (seconds)")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="Telegram requests per second allowed by the rate controller")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated round trip of each request (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=0.0,
+                        help="simulated MB/s of each download (0 = unlimited)")
+    parser.add_argument("--flood-every", type=int, default=0,
+                        help="raise a FloodWait every N requests (0 = never)")
+    parser.add_argument("--flood-seconds", type=int, default=1, help="seconds of each FloodWait")
+    parser.add_argument("--mongo", action="store_true",
+                        help="write to the MongoDB at MONGO_URI instead of memory")
+    parser.add_argument("--json", metavar="PATH", help="also save the report as JSON")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profile the sync (saved to {settings.PROFILE_DIR})")
+    parser.add_argument("--verbose", action="store_true", help="print the sync log")
+    args = parser.parse_args(argv)
+
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        db.close_client()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Mensajes sintéticos de Telethon para los benchmarks.
+
+Construye objetos `Message` reales (con fotos, documentos, entidades y respuestas) sin
+conectar con Telegram, para que `to_dict()`, `message.file` y compañía se comporten
+igual que durante una sincronización.
+"""
+import datetime
+import random
+
+from telethon.tl import types
+
+WORDS = ("telegram archive channel message photo video update news link post "
+         "mongo sync backup media forward reply album").split()
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _photo(rng, media_id, size):
+    return types.MessageMediaPhoto(photo=types.Photo(
+        id=media_id,
+        access_hash=rng.getrandbits(63),
+        file_reference=rng.randbytes(32),
+        date=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        sizes=[
+            types.PhotoStrippedSize(type="i", bytes=rng.randbytes(64)),
+            types.PhotoSize(type="m", w=320, h=240, size=size // 10),
+            types.PhotoSizeProgressive(type="y", w=1280, h=960, sizes=[size // 4, size // 2, size]),
+        ],
+        dc_id=2,
+    ))
+
+
+def _video(rng, media_id, size):
+    return types.MessageMediaDocument(document=types.Document(
+        id=media_id,
+        access_hash=rng.getrandbits(63),
+        file_reference=rng.randbytes(32),
+        date=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        mime_type="video/mp4",
+        size=size,
+        dc_id=2,
+        attributes=[
+            types.DocumentAttributeVideo(duration=rng.randint(5, 600), w=1280, h=720,
+                                         supports_streaming=True),
+            types.DocumentAttributeFilename(file_name=f"video_{media_id}.mp4"),
+        ],
+        thumbs=[types.PhotoSize(type="m", w=320, h=180, size=size // 100)],
+    ))
+
+
+def synthetic_message(message_id, rng=None, media_ratio=0.4, media_size=2 * 1024 * 1024):
+    """
+    Devuelve un `Message` de canal con texto, entidades y, con probabilidad `media_ratio`,
+    una foto o un vídeo de `media_size` bytes.
+    """
+    rng = rng or random.Random(message_id)
+    text = _text(rng, rng.randint(5, 80))
+    media = None
+    if rng.random() < media_ratio:
+        make = _photo if rng.random() < 0.6 else _video
+        media = make(rng, rng.getrandbits(62), media_size)
+
+    return types.Message(
+        id=message_id,
+        peer_id=types.PeerChannel(channel_id=1234567890),
+        date=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        + datetime.timedelta(minutes=message_id),
+        message=text,
+        post=True,
+        views=rng.randint(100, 100000),
+        forwards=rng.randint(0, 500),
+        media=media,
+        grouped_id=rng.getrandbits(62) if media and rng.random() < 0.2 else None,
+        reply_to=types.MessageReplyHeader(reply_to_msg_id=message_id - 1)
+        if message_id > 1 and rng.random() < 0.1 else None,
+        entities=[
+            types.MessageEntityBold(offset=0, length=min(5, len(text))),
+            types.MessageEntityTextUrl(offset=0, length=min(5, len(text)),
+                                       url=f"https://example.org/{message_id}"),
+        ],
+    )
+
+
+def synthetic_channel(count, start_id=1, **kwargs):
+    """Genera `count` mensajes sintéticos con IDs consecutivos desde `start_id`."""
+    for message_id in range(start_id, start_id + count):
+        yield synthetic_message(message_id, **kwargs)
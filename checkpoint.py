@@ -0,0 +1,96 @@
+"""
+Módulo de Checkpoints de Sincronización.
+
+Cada canal tiene un documento en la colección SYNC_STATE_COLLECTION con:
+
+- `last_committed_id`: el ID más alto tal que todos los mensajes recorridos hasta él
+  están escritos en la BD (el prefijo contiguo confirmado). La siguiente ejecución
+  reanuda justo desde ahí.
+- `last_run`: estadísticas de la última ejecución.
+
+El checkpoint se actualiza en el mismo hilo que escribe cada lote, inmediatamente después
+de escribirlo, así que nunca afirma más de lo que está en la BD: si el proceso muere entre
+las dos escrituras, la siguiente ejecución vuelve a recorrer ese lote (los upserts son
+idempotentes).
+
+Las descargas en curso no hace falta guardarlas: sus mensajes siempre están por encima del
+ID confirmado (un lote no se escribe hasta que terminan sus descargas), así que la
+siguiente ejecución los vuelve a recorrer y reanuda sus descargas (sidecar
+`.partial.json`, archivo ya completo en disco o almacén deduplicado).
+"""
+from datetime import datetime, timezone
+
+import db
+
+
+class SyncCheckpoint:
+    """
+    Checkpoint de la sincronización de un canal.
+
+    Uso:
+        checkpoint = SyncCheckpoint(collection_name)
+        min_id = await checkpoint.load()
+        writer = MessageWriter(collection_name, checkpoint=checkpoint)
+        ...
+        await checkpoint.finish("done", writer.totals, media)
+
+    Atributos:
+        committed_id (int): Último ID del prefijo contiguo confirmado.
+    """
+    def __init__(self, collection_name):
+        self.collection_name = collection_name
+        self.committed_id = 0
+        self.started_at = None
+        # Tras un mensaje que no se pudo escribir el prefijo deja de ser contiguo:
+        # el checkpoint ya no avanza en esta ejecución
+        self._broken = False
+
+    async def load(self, log=print):
+        """
+        Lee el checkpoint del canal y devuelve el ID desde el que reanudar. Si el canal no
+        tiene checkpoint (sincronizado con una versión anterior), usa el último ID guardado.
+        """
+        self.started_at = datetime.now(timezone.utc)
+        state = await db.run(db.get_sync_state, self.collection_name)
+        if state and "last_committed_id" in state:
+            self.committed_id = state["last_committed_id"]
+        else:
+            self.committed_id = await db.run(db.get_latest_message_id, self.collection_name)
+        return self.committed_id
+
+    def commit(self, batch, result):
+        """
+        Avanza el checkpoint tras escribir `batch` (en orden de ID) con resultado `result`.
+        Se llama desde el hilo de escritura, justo después de escribir el lote.
+        """
+        if self._broken or not batch:
+            return
+        failed = set(result.failed_ids)
+        committed = self.committed_id
+        for msg in batch:
+            if msg["id"] in failed:
+                self._broken = True
+                break
+            committed = msg["id"]
+        if committed > self.committed_id:
+            db.save_sync_checkpoint(self.collection_name, committed)
+            self.committed_id = committed
+
+    def abort(self):
+        """Deja de avanzar el checkpoint en esta ejecución (un lote no se pudo escribir)."""
+        self._broken = True
+
+    async def finish(self, state, totals, media=0):
+        """Guarda las estadísticas de la ejecución ('done', 'stopped' o 'failed')."""
+        finished_at = datetime.now(timezone.utc)
+        await db.run(db.save_sync_run, self.collection_name, stats={
+            "state": state,
+            "started_at": self.started_at,
+            "finished_at": finished_at,
+            "elapsed": (finished_at - self.started_at).total_seconds() if self.started_at else 0.0,
+            "inserted": totals.inserted,
+            "duplicates": totals.duplicates,
+            "failed": totals.failed,
+            "media": media,
+            "last_committed_id": self.committed_id,
+        })
@@ -4,13 +4,162 @@ Módulo de Interacción con Base de Datos.
 Este módulo maneja todas las interacciones con la base de datos MongoDB.
 Proporciona funciones para conectar a la BD, recuperar el último ID de mensaje sincronizado
 e insertar nuevos mensajes.
+
+Todo el proceso comparte un único `MongoClient` (y por tanto un único pool de conexiones),
+creado de forma perezosa en la primera llamada a `get_client()` y liberado con `close_client()`.
+
+Las funciones son síncronas (pymongo). El código asíncrono no las llama directamente: usa
+`await db.run(func, ...)`, que las ejecuta en un pool de hilos propio con la cola acotada,
+para que una escritura o una consulta lenta nunca detenga el bucle asyncio (ni la red de
+Telethon ni las descargas).
 """
-from pymongo import MongoClient, ASCENDING, DESCENDING
+import asyncio
+import functools
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, ReplaceOne, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, OperationFailure
+import schema
 import settings
 
+
+class _ConnectionCounter(monitoring.ConnectionPoolListener):
+    """
+    Listener de pymongo que cuenta las conexiones abiertas y cerradas por el pool.
+    Permite saber cuántas conexiones reales se han abierto durante una sincronización.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.closed = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.opened += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    # El resto de eventos del pool no nos interesan
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+_client = None
+_client_lock = threading.Lock()
+_connection_counter = _ConnectionCounter()
+
+
+def get_client():
+    """
+    Devuelve el `MongoClient` compartido del proceso, creándolo la primera vez.
+    El cliente es thread-safe y mantiene su propio pool de conexiones.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    settings.MONGO_URI,
+                    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+                    event_listeners=[_connection_counter],
+                )
+    return _client
+
+
+def close_client():
+    """
+    Cierra el cliente compartido y su pool, después de terminar las llamadas pendientes
+    del pool de hilos de `run()`. Una llamada posterior a `get_client()` creará uno nuevo.
+    """
+    global _client, _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def connections_opened():
+    """
+    Devuelve el número total de conexiones abiertas por el pool desde el inicio del proceso.
+    Para saber las abiertas durante una sincronización basta con restar dos lecturas.
+    """
+    return _connection_counter.opened
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Un semáforo por bucle asyncio: un asyncio.Semaphore no se puede compartir entre bucles
+_executor_slots = weakref.WeakKeyDictionary()
+
+
+def get_executor():
+    """Pool de hilos compartido para las llamadas a MongoDB desde código asíncrono."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="mongo",
+                )
+    return _executor
+
+
+async def run(func, *args, **kwargs):
+    """
+    Ejecuta `func(*args, **kwargs)` (una llamada bloqueante a MongoDB) en el pool de hilos
+    de la BD y devuelve su resultado sin bloquear el bucle asyncio.
+
+    Como mucho DB_EXECUTOR_QUEUE llamadas de cada bucle están en cola o en curso; las
+    demás esperan aquí su turno, así que si MongoDB va lento la cola no crece sin límite.
+    """
+    loop = asyncio.get_running_loop()
+    slots = _executor_slots.get(loop)
+    if slots is None:
+        slots = _executor_slots[loop] = asyncio.Semaphore(settings.DB_EXECUTOR_QUEUE)
+    async with slots:
+        return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
 def get_db():
-    client = MongoClient(settings.MONGO_URI)
-    return client[settings.DB_NAME]
+    return get_client()[settings.DB_NAME]
 
 def get_latest_message_id(collection_name):
     """
@@ -27,37 +176,251 @@ def get_latest_message_id(collection_name):
         return latest.get("id", 0)
     return 0
 
-def insert_messages(collection_name, messages):
+class FlushResult(namedtuple("FlushResult", ["inserted", "duplicates", "failed", "failed_ids"],
+                             defaults=[()])):
     """
-    Inserta una lista de mensajes en la colección.
-    Espera que los mensajes sean una lista de diccionarios.
+    Resultado de escribir un lote: mensajes nuevos, ya existentes y fallidos, más los IDs
+    de los fallidos (una tupla, que al sumar resultados se concatena).
     """
-    if not messages:
+    __slots__ = ()
+
+    def __add__(self, other):
+        return FlushResult(*(a + b for a, b in zip(self, other)))
+
+
+FlushResult.EMPTY = FlushResult(0, 0, 0)
+
+# Colecciones cuyos índices ya se han creado en este proceso
+_indexed_collections = set()
+_search_indexed_collections = set()
+_indexed_lock = threading.Lock()
+
+# Índices de la búsqueda local (`search.py`): los compuestos con `id` sirven al filtro y al
+# orden/paginación de los resultados
+SEARCH_INDEXES = (
+    [("date", DESCENDING)],
+    [("sender_id", ASCENDING), ("id", DESCENDING)],
+    [("media_kind", ASCENDING), ("id", DESCENDING)],
+    [("grouped_id", ASCENDING)],
+)
+
+
+def ensure_indexes(collection_name):
+    """
+    Crea el índice único por `id` de una colección de mensajes, una sola vez por proceso.
+    Crear un índice que ya existe no hace nada, así que basta con llamarla antes de escribir.
+    """
+    if collection_name in _indexed_collections:
         return
+    with _indexed_lock:
+        if collection_name in _indexed_collections:
+            return
+        # Asegurar unicidad estricta por si acaso, aunque min_id debería manejarlo
+        get_db()[collection_name].create_index([("id", ASCENDING)], unique=True)
+        _indexed_collections.add(collection_name)
+
+
+def ensure_search_indexes(collection_name, log=None):
+    """
+    Crea los índices de la búsqueda local (SEARCH_INDEXES y el de texto sobre `text`), una
+    sola vez por proceso. Se llama desde la búsqueda y desde `main_search.py
+    --build-indexes`, nunca al escribir: en una colección grande el primer índice de texto
+    tarda, y no debe frenar la sincronización. Una vez creados, MongoDB los mantiene con
+    cada escritura. Si faltan índices y se pasa `log`, avisa antes de crearlos.
+    """
+    ensure_indexes(collection_name)
+    if collection_name in _search_indexed_collections:
+        return
+    with _indexed_lock:
+        if collection_name in _search_indexed_collections:
+            return
+        collection = get_db()[collection_name]
+        existing = collection.index_information().values()
+        keys = [list(index["key"]) for index in existing]
+        missing = [index for index in SEARCH_INDEXES if index not in keys]
+        has_text = any(index.get("weights") for index in existing)
+        if (missing or not has_text) and log:
+            log(f"Building search indexes for {collection_name} "
+                f"({collection.estimated_document_count()} documents), this can take a while...")
+        for index in missing:
+            collection.create_index(index)
+        if not has_text:
+            try:
+                collection.create_index([("text", TEXT)], default_language=settings.SEARCH_LANGUAGE)
+            except OperationFailure as e:
+                # Solo puede haber un índice de texto: si ya existe con otras opciones
+                # (p. ej. otro SEARCH_LANGUAGE) se conserva el existente
+                if e.code not in (85, 86):
+                    raise
+        _search_indexed_collections.add(collection_name)
+
+
+# Documentos de antes de STORAGE_SCHEMA: el `to_dict()` tal cual (ver `schema.is_legacy`)
+LEGACY_FILTER = {"_": {"$exists": True}, "raw": {"$exists": False}}
+
+
+def has_legacy_documents(collection_name):
+    """Indica si la colección aún tiene documentos con el formato antiguo."""
+    return get_db()[collection_name].find_one(LEGACY_FILTER, {"_id": 1}) is not None
+
+
+def migrate_legacy_documents(collection_name, batch_size=1000, log=print):
+    """
+    Reescribe los documentos antiguos de una colección con `schema.upgrade_legacy` (campos
+    compactos y el `to_dict()` original comprimido en `raw`), por lotes. Se puede
+    interrumpir y repetir: solo toca lo que aún no está migrado. Devuelve cuántos migró.
+    """
+    collection = get_db()[collection_name]
+    migrated = 0
+    batch = []
+
+    def flush():
+        nonlocal migrated
+        if batch:
+            collection.bulk_write(batch, ordered=False)
+            migrated += len(batch)
+            log(f"Migrated {migrated} documents of {collection_name}...")
+            batch.clear()
+
+    for document in collection.find(LEGACY_FILTER, batch_size=batch_size):
+        upgraded = schema.upgrade_legacy(document)
+        upgraded["_id"] = document["_id"]
+        batch.append(ReplaceOne({"_id": document["_id"]}, upgraded))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return migrated
+
+
+def list_channel_collections():
+    """Colecciones de mensajes de la BD (las internas empiezan por '_')."""
+    return sorted(
+        name for name in get_db().list_collection_names()
+        if not name.startswith(("_", "system."))
+    )
 
-    db = get_db()
-    collection = db[collection_name]
-    
-    # Asegurar unicidad estricta por si acaso, aunque min_id debería manejarlo
-    # creando un índice si no existe
-    collection.create_index([("id", ASCENDING)], unique=True)
+
+def upsert_messages(collection_name, messages):
+    """
+    Escribe una lista de mensajes (dicts) con upserts no ordenados usando el 'id' del
+    mensaje como _id. Los mensajes que ya existen no se modifican y cuentan como
+    duplicados, así que reejecutar una sincronización o solapar rangos es idempotente.
+    No modifica los dicts recibidos. Devuelve un `FlushResult`.
+    """
+    if not messages:
+        return FlushResult.EMPTY
+
+    ensure_indexes(collection_name)
+    requests = [
+        UpdateOne(
+            {"_id": msg["id"]},
+            {"$setOnInsert": {k: v for k, v in msg.items() if k != "_id"}},
+            upsert=True,
+        )
+        for msg in messages
+    ]
 
     try:
-        # ordered=False permite continuar la inserción incluso si algunos documentos fallan (ej. duplicados)
-        # Sin embargo, como obtenemos con min_id, no deberíamos tener muchos duplicados a menos que haya una condición de carrera o solapamiento.
-        # Nos quedaremos con insert_many simple por ahora o manejaremos uno por uno si se necesita deduplicación robusta.
-        # Dado que el prompt pide un mecanismo para prevenir procesar mensajes ya insertados,
-        # usar 'id' como índice único es la aplicación a nivel de base de datos.
-        
-        # Necesitamos convertir objetos Telethon a dicts si no lo son ya.
-        # Asumiendo que el llamador pasa dicts o los convertimos aquí.
-        # Por simplicidad, asumamos que el llamador pasa dicts.
-        
-        for msg in messages:
-            msg['_id'] = msg['id']
-        
-        collection.insert_many(messages, ordered=False)
-        print(f"Inserted {len(messages)} messages into {collection_name}")
-    except Exception as e:
-        print(f"Error inserting messages (some might be duplicates): {e}")
+        result = get_db()[collection_name].bulk_write(requests, ordered=False)
+        return FlushResult(result.upserted_count, result.matched_count, 0)
+    except BulkWriteError as e:
+        details = e.details
+        errors = details.get("writeErrors", [])
+        # Un choque con el índice único de 'id' también es un duplicado
+        failed_ids = tuple(
+            messages[err["index"]]["id"] for err in errors if err.get("code") != 11000
+        )
+        return FlushResult(
+            details.get("nUpserted", 0),
+            details.get("nMatched", 0) + len(errors) - len(failed_ids),
+            len(failed_ids),
+            failed_ids,
+        )
+
+
+def find_media(key):
+    """
+    Busca una entrada del índice del almacén de multimedia por su clave
+    (`photo:<id>`, `document:<id>` o `sha256:<hash>`). Devuelve None si no existe.
+    """
+    return get_db()[settings.MEDIA_INDEX_COLLECTION].find_one({"_id": key})
+
+
+def register_media(keys, path, size, sha256):
+    """
+    Registra (o actualiza) todas las claves que apuntan a un mismo blob del almacén.
+    `path` es relativo a la raíz del almacén.
+    """
+    entry = {"path": path, "size": size, "sha256": sha256}
+    get_db()[settings.MEDIA_INDEX_COLLECTION].bulk_write(
+        [UpdateOne({"_id": key}, {"$set": entry}, upsert=True) for key in keys],
+        ordered=False,
+    )
+
+
+def get_sync_state(collection_name):
+    """
+    Devuelve el estado de sincronización guardado de un canal (ver `checkpoint.py`),
+    o None si el canal nunca se ha sincronizado con checkpoints.
+    """
+    return get_db()[settings.SYNC_STATE_COLLECTION].find_one({"_id": collection_name})
+
+
+def save_sync_checkpoint(collection_name, committed_id):
+    """
+    Avanza el checkpoint de un canal en una única actualización atómica del documento.
+    `$max` garantiza que el ID confirmado nunca retrocede. Borra el `in_flight_media` que
+    guardaban las versiones anteriores.
+    """
+    get_db()[settings.SYNC_STATE_COLLECTION].update_one(
+        {"_id": collection_name},
+        {
+            "$max": {"last_committed_id": committed_id},
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+            "$unset": {"in_flight_media": ""},
+        },
+        upsert=True,
+    )
+
+
+def save_sync_run(collection_name, stats):
+    """Guarda las estadísticas de la última ejecución de un canal."""
+    update = {"last_run": stats, "updated_at": datetime.now(timezone.utc)}
+    get_db()[settings.SYNC_STATE_COLLECTION].update_one(
+        {"_id": collection_name}, {"$set": update}, upsert=True
+    )
+
+
+def iter_message_ids(collection_name):
+    """Recorre los IDs de los mensajes guardados en orden ascendente (solo el índice _id)."""
+    cursor = get_db()[collection_name].find({}, {"_id": 1}).sort("_id", ASCENDING)
+    for doc in cursor:
+        yield doc["_id"]
+
+
+def iter_documents(collection_name, after_id=0, since_date=None, batch_size=1000):
+    """
+    Recorre en orden de ID los mensajes guardados con ID mayor que `after_id` (y fecha
+    desde `since_date`) con un cursor, sin cargarlos todos en memoria.
+    """
+    query = {"_id": {"$gt": after_id or 0}}
+    if since_date is not None:
+        query["date"] = {"$gte": since_date}
+    cursor = get_db()[collection_name].find(query, batch_size=batch_size).sort("_id", ASCENDING)
+    with cursor:
+        yield from cursor
+
+
+def get_backfilled_segments(collection_name):
+    """Segmentos [lo, hi] de IDs que el backfill ya recorrió por completo en un canal."""
+    state = get_sync_state(collection_name) or {}
+    return [tuple(segment) for segment in state.get("backfilled_segments", [])]
+
 
+def add_backfilled_segment(collection_name, lo, hi):
+    """Registra un segmento de IDs recorrido por completo por el backfill."""
+    get_db()[settings.SYNC_STATE_COLLECTION].update_one(
+        {"_id": collection_name},
+        {"$addToSet": {"backfilled_segments": [lo, hi]}},
+        upsert=True,
+    )
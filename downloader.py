@@ -0,0 +1,426 @@
+"""
+Módulo de Descarga de Multimedia.
+
+Este módulo desacopla la descarga de archivos multimedia del bucle que recorre el historial
+del canal. `MediaDownloadPipeline` implementa un esquema productor/consumidor:
+el bucle de `iter_messages` encola trabajos y un grupo acotado de workers los descarga
+de forma concurrente. La cola tiene tamaño máximo, así que si los workers no dan abasto
+el productor se bloquea (backpressure) y la memoria se mantiene acotada.
+
+Los documentos grandes (a partir de LARGE_FILE_THRESHOLD_MB) no se descargan como un único
+flujo serie: `download_in_parts` pide varios rangos de bytes a la vez y los escribe en su
+posición dentro de un archivo preasignado.
+
+Estas descargas por partes son reanudables: junto al archivo se guarda un sidecar
+`<archivo>.partial.json` con el tamaño esperado y los bytes ya escritos (y sincronizados
+a disco) de cada parte. Si la sincronización se detiene o el proceso muere, la siguiente
+ejecución continúa desde el último offset verificado. Los archivos que ya están completos
+en disco no se vuelven a descargar, y los de una descarga simple interrumpida (sin sidecar
+y con otro tamaño) se borran antes de descargarlos de nuevo.
+
+Con MEDIA_DEDUP activo, la carpeta de cada mensaje es solo un área temporal: al terminar,
+el archivo pasa al almacén deduplicado de `media_store` y `saved_media_path` apunta al blob
+compartido.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from telethon.client.downloads import MAX_CHUNK_SIZE
+
+import media_store
+import metrics
+import ratelimit
+import settings
+
+# Tamaño de cada petición a Telegram. Las partes son múltiplos de este valor para que
+# todos los offsets queden alineados como exige upload.getFile.
+REQUEST_SIZE = MAX_CHUNK_SIZE
+
+PARTIAL_SUFFIX = ".partial.json"
+# Cada cuánto (segundos) se sincroniza el archivo a disco y se actualiza el sidecar
+PARTIAL_SAVE_INTERVAL = 1.0
+
+
+def media_download_path(collection_name, message_id):
+    """
+    Devuelve (y crea si no existe) la carpeta de descarga de un mensaje:
+    downloads/{channel}-{msg_id}/
+    """
+    base_downloads_path = os.path.abspath(settings.DOWNLOADS_DIR)
+    download_path = os.path.join(base_downloads_path, f"{collection_name}-{message_id}")
+    os.makedirs(download_path, exist_ok=True)
+    return download_path
+
+
+def storage_relative_path(saved_path):
+    """
+    Convierte la ruta absoluta de un archivo descargado en una ruta relativa a STORAGE_ROOT.
+    Si no es posible (p. ej. distinta unidad en Windows) devuelve la ruta original.
+    """
+    try:
+        return os.path.relpath(saved_path, settings.STORAGE_ROOT)
+    except ValueError:
+        return saved_path
+
+
+def media_file_name(message):
+    """Nombre de archivo para el documento de un mensaje (el original si lo tiene)."""
+    name = message.file.name
+    if name:
+        return os.path.basename(name)
+    return f"{message.id}{message.file.ext or ''}"
+
+
+def find_complete_download(download_path, expected_size):
+    """
+    Busca en la carpeta de un mensaje un archivo ya descargado por completo: sin sidecar
+    de descarga parcial y con el tamaño esperado. Devuelve su ruta o None.
+    """
+    if not expected_size or not os.path.isdir(download_path):
+        return None
+    for name in os.listdir(download_path):
+        if name.endswith(PARTIAL_SUFFIX):
+            continue
+        path = os.path.join(download_path, name)
+        if os.path.exists(path + PARTIAL_SUFFIX):
+            continue
+        if os.path.isfile(path) and os.path.getsize(path) == expected_size:
+            return path
+    return None
+
+
+def discard_incomplete_downloads(download_path, expected_size, log=None):
+    """
+    Borra de la carpeta de un mensaje los archivos a medias de una descarga simple
+    interrumpida: los que no tienen sidecar de descarga por partes y cuyo tamaño no es el
+    esperado. Si se dejaran, Telethon guardaría la nueva descarga como `nombre (1).ext`
+    junto a ellos y la carpeta temporal no se podría borrar nunca.
+    """
+    if not expected_size or not os.path.isdir(download_path):
+        return
+    for name in os.listdir(download_path):
+        path = os.path.join(download_path, name)
+        if (name.endswith(PARTIAL_SUFFIX) or os.path.exists(path + PARTIAL_SUFFIX)
+                or not os.path.isfile(path) or os.path.getsize(path) == expected_size):
+            continue
+        if log:
+            log(f"Removing incomplete download {path} "
+                f"({os.path.getsize(path)} of {expected_size} bytes)")
+        os.remove(path)
+
+
+class PartialDownloadState:
+    """
+    Estado en disco de una descarga por partes (sidecar `<archivo>.partial.json`).
+
+    Atributos:
+        expected_size (int): Tamaño final del archivo.
+        part_size (int): Tamaño de cada parte.
+        parts (dict): offset de la parte -> bytes escritos y sincronizados a disco.
+    """
+    def __init__(self, file_path, expected_size, part_size, parts=None):
+        self.path = file_path + PARTIAL_SUFFIX
+        self.expected_size = expected_size
+        self.part_size = part_size
+        self.parts = parts or {}
+        # Los checkpoints se guardan desde hilos: nunca dos a la vez sobre el mismo temporal
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, file_path, expected_size, part_size):
+        """
+        Carga el estado de una descarga anterior. Devuelve None si no hay sidecar, si no
+        corresponde al mismo tamaño/partición o si el archivo de datos no existe.
+        """
+        path = file_path + PARTIAL_SUFFIX
+        if not os.path.exists(path) or not os.path.exists(file_path):
+            return None
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("expected_size") != expected_size or data.get("part_size") != part_size:
+            return None
+        if os.path.getsize(file_path) != expected_size:
+            return None
+        parts = {int(offset): done for offset, done in data.get("parts", {}).items()}
+        return cls(file_path, expected_size, part_size, parts)
+
+    @property
+    def bytes_done(self):
+        return sum(self.parts.values())
+
+    def save(self, parts=None):
+        """
+        Guarda el sidecar con `parts` (por defecto las actuales). Desde un hilo se pasa una
+        copia tomada en el bucle, que es quien modifica `parts`.
+        """
+        parts = dict(self.parts) if parts is None else parts
+        # Escritura atómica: nunca dejamos un sidecar a medias
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "expected_size": self.expected_size,
+                    "part_size": self.part_size,
+                    "bytes_done": sum(parts.values()),
+                    "parts": {str(offset): done for offset, done in parts.items()},
+                }, f)
+            os.replace(tmp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def is_large_document(message):
+    """Indica si el multimedia del mensaje debe descargarse por partes en paralelo."""
+    return (
+        message.document is not None
+        and (message.file.size or 0) >= settings.LARGE_FILE_THRESHOLD_MB * 1024 * 1024
+    )
+
+
+async def download_in_parts(client, message, file_path, part_size=None, parallelism=None, log=None,
+                            rate=None, channel=None):
+    """
+    Descarga el documento de `message` en `file_path` pidiendo varias partes en paralelo.
+
+    El archivo se preasigna con su tamaño final y cada parte se escribe en su offset,
+    así que el orden en que terminan las partes no importa. Si existe un sidecar de una
+    descarga anterior compatible, solo se piden los bytes que faltan. Cada parte consume un
+    turno del controlador de ritmo `rate` (no cada bloque, para no limitar el ancho de banda
+    al ritmo de peticiones); un FloodWait en cualquier bloque pausa todas las peticiones y
+    la parte sigue desde el último bloque escrito. `channel` es la colección a la que se atribuyen los FloodWaits en las
+    métricas. Devuelve `file_path`.
+    """
+    rate = rate or ratelimit.default_controller()
+    document = message.document
+    size = message.file.size
+    part_size = part_size or settings.DOWNLOAD_PART_SIZE_KB * 1024
+    # Redondear al múltiplo de REQUEST_SIZE para no partir peticiones entre dos partes
+    part_size = max(REQUEST_SIZE, -(-part_size // REQUEST_SIZE) * REQUEST_SIZE)
+    parallelism = parallelism or settings.DOWNLOAD_PART_PARALLELISM
+
+    state = PartialDownloadState.load(file_path, size, part_size)
+    if state is None:
+        # El sidecar va antes que el archivo preasignado: un archivo del tamaño final sin
+        # sidecar pasaría por una descarga completa (ver `find_complete_download`)
+        state = PartialDownloadState(file_path, size, part_size)
+        state.save()
+        with open(file_path, "wb") as f:
+            f.truncate(size)
+    elif log:
+        log(f"Resuming download of message {message.id} at "
+            f"{state.bytes_done / (1024 * 1024):.1f}/{size / (1024 * 1024):.1f} MB")
+
+    parts = asyncio.Queue()
+    for offset in range(0, size, part_size):
+        length = min(part_size, size - offset)
+        if state.parts.get(offset, 0) < length:
+            parts.put_nowait((offset, length))
+
+    # Sin buffer: lo que se escribe va directo al SO, y un fsync de cualquier descriptor
+    # deja en disco los datos de todas las partes antes de actualizar el sidecar
+    data_file = open(file_path, "r+b", buffering=0)
+    last_save = time.monotonic()
+
+    def sync_to_disk(parts):
+        os.fsync(data_file.fileno())
+        state.save(parts)
+
+    async def checkpoint():
+        # fsync y el sidecar corren en un hilo para no parar el bucle mientras el disco
+        # sincroniza; la copia de las partes se toma aquí, después de sus pwrite
+        await asyncio.to_thread(sync_to_disk, dict(state.parts))
+
+    async def fetch_parts():
+        nonlocal last_save
+        while not parts.empty():
+            offset, length = parts.get_nowait()
+            # Siempre es múltiplo de REQUEST_SIZE: solo se cuentan peticiones completas
+            done = state.parts.get(offset, 0)
+            while done < length:
+                try:
+                    # Un turno del controlador por parte (como un archivo pequeño cuesta uno
+                    # por archivo): los bloques de la parte no esperan al ritmo del historial
+                    await rate.acquire()
+                    async for chunk in client.iter_download(
+                        document,
+                        offset=offset + done,
+                        request_size=REQUEST_SIZE,
+                        limit=-(-(length - done) // REQUEST_SIZE),
+                        file_size=size,
+                    ):
+                        os.pwrite(data_file.fileno(), chunk, offset + done)
+                        done += len(chunk)
+                        state.parts[offset] = done
+                        if time.monotonic() - last_save >= PARTIAL_SAVE_INTERVAL:
+                            # Antes de esperar, para que las otras partes no lo repitan
+                            last_save = time.monotonic()
+                            await checkpoint()
+                    rate.success()
+                except ratelimit.FLOOD_ERRORS as e:
+                    await rate.flood_wait(e.seconds, log=log, channel=channel)
+
+    try:
+        await asyncio.gather(*(fetch_parts() for _ in range(min(parallelism, parts.qsize()))))
+        await checkpoint()
+    except BaseException:
+        # Detenida o fallida: guardar lo que hay para reanudar en la próxima ejecución
+        await checkpoint()
+        raise
+    finally:
+        data_file.close()
+
+    if state.bytes_done != size or os.path.getsize(file_path) != size:
+        raise IOError(f"Incomplete download for message {message.id}: "
+                      f"{state.bytes_done}/{size} bytes")
+    state.delete()
+    return file_path
+
+
+class MediaDownloadPipeline:
+    """
+    Descarga concurrente de multimedia con un número fijo de workers.
+
+    Uso:
+        pipeline = MediaDownloadPipeline(collection_name, log=print)
+        pipeline.start()
+        future = await pipeline.submit(message, msg_dict)   # bloquea si la cola está llena
+        ...
+        await future            # msg_dict['saved_media_path'] ya está relleno
+        await pipeline.close()  # espera a que se vacíe la cola y para los workers
+
+    Atributos:
+        collection_name (str): Colección/canal al que pertenecen los mensajes.
+        workers (int): Número de descargas simultáneas.
+        log (callable): Función que recibe los mensajes de registro (print, signal.emit...).
+        store (MediaStore): Almacén deduplicado donde acaban los archivos. Por defecto el
+            compartido del proceso si MEDIA_DEDUP está activo; None descarga por mensaje.
+        rate (RateController): Controlador de ritmo de las peticiones a Telegram. Por
+            defecto el compartido del proceso.
+        on_downloaded (callable): Se llama con los bytes de cada archivo transferido.
+    """
+    def __init__(self, collection_name, workers=None, queue_size=None, log=print, store=None,
+                 rate=None, on_downloaded=None):
+        self.collection_name = collection_name
+        self.on_downloaded = on_downloaded
+        self.rate = rate or ratelimit.default_controller()
+        self.workers = workers or settings.DOWNLOAD_WORKERS
+        self.log = log
+        if store is None and settings.MEDIA_DEDUP:
+            store = media_store.default_store()
+        self.store = store
+        self._queue = asyncio.Queue(maxsize=queue_size or settings.DOWNLOAD_QUEUE_SIZE)
+        self._tasks = []
+        # Bytes realmente transferidos desde Telegram (no cuenta lo que ya estaba en disco)
+        self.bytes_downloaded = 0
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"media-download-{i}"))
+
+    async def submit(self, message, msg_dict):
+        """
+        Encola la descarga del multimedia de `message`. Devuelve un Future que se resuelve
+        cuando la descarga termina (con éxito o no); nunca propaga la excepción de la descarga.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, msg_dict, future))
+        return future
+
+    async def close(self, cancel=False):
+        """
+        Espera a que terminen todas las descargas encoladas y detiene los workers.
+        Con `cancel=True` no espera: interrumpe las descargas en curso (las descargas por
+        partes guardan su estado para reanudarse) y descarta las encoladas.
+        """
+        if cancel:
+            while not self._queue.empty():
+                _, msg_dict, future = self._queue.get_nowait()
+                future.set_result(msg_dict)
+                self._queue.task_done()
+        else:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            message, msg_dict, future = await self._queue.get()
+            try:
+                await self._download(message, msg_dict)
+            except Exception as e:
+                # Continuamos incluso si la descarga falla, registrando el error
+                self.log(f"Failed to download media for message {message.id}: {e}")
+            finally:
+                if not future.done():
+                    future.set_result(msg_dict)
+                self._queue.task_done()
+
+    async def _download(self, message, msg_dict):
+        if self.store is not None:
+            # El almacén solo llama a _fetch_file si el archivo no está ya indexado
+            saved_path = await self.store.fetch(
+                message, lambda: self._fetch_file(message), log=self.log
+            )
+        else:
+            saved_path = await self._fetch_file(message)
+
+        if saved_path:
+            msg_dict['saved_media_path'] = storage_relative_path(saved_path)
+            self.log(f"Media saved to: {saved_path}")
+
+    async def _fetch_file(self, message):
+        """
+        Descarga el multimedia en la carpeta del mensaje y devuelve su ruta. Los archivos
+        transferidos, sus bytes y su latencia se cuentan en `metrics`.
+        """
+        download_path = media_download_path(self.collection_name, message.id)
+        expected_size = message.file.size if message.file else None
+
+        existing = find_complete_download(download_path, expected_size)
+        if existing:
+            self.log(f"Media for message {message.id} already downloaded, skipping.")
+            return existing
+
+        started = time.monotonic()
+        if is_large_document(message):
+            self.log(f"Downloading media for message {message.id} in parallel parts "
+                     f"({message.file.size / (1024 * 1024):.1f} MB)...")
+            file_path = os.path.join(download_path, media_file_name(message))
+            saved_path = await download_in_parts(message.client, message, file_path, log=self.log,
+                                                 rate=self.rate, channel=self.collection_name)
+        else:
+            self.log(f"Downloading media for message {message.id}...")
+
+            async def attempt():
+                # Telethon crea el archivo antes de la primera petición: lo que dejó un
+                # intento cortado por un FloodWait se borra antes de repetirlo, para que no
+                # se guarde como `nombre (1).ext`
+                discard_incomplete_downloads(download_path, expected_size, log=self.log)
+                return await message.download_media(file=download_path)
+
+            # download_media devuelve la ruta al archivo; tras un FloodWait se reintenta entera
+            saved_path = await self.rate.call(attempt, log=self.log, channel=self.collection_name)
+        if saved_path:
+            size = os.path.getsize(saved_path)
+            metrics.DOWNLOAD_SECONDS.observe(time.monotonic() - started,
+                                             channel=self.collection_name)
+            metrics.MEDIA_DOWNLOADED.inc(channel=self.collection_name)
+            metrics.BYTES_DOWNLOADED.inc(size, channel=self.collection_name)
+            self.bytes_downloaded += size
+            if self.on_downloaded:
+                self.on_downloaded(size)
+        return saved_path
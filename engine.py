@@ -0,0 +1,141 @@
+"""
+Módulo del Motor de Sincronización.
+
+`sync_channel` es el único bucle de sincronización de la aplicación: lo usan la CLI
+(`main.py`) y la GUI (`worker.TelegramSyncService`). Recorre el historial de un canal desde
+su checkpoint y, para cada mensaje:
+
+1.  Construye el documento a guardar según STORAGE_SCHEMA (`schema.py`).
+2.  Encola la descarga de su multimedia en el pipeline concurrente (`downloader.py`).
+3.  Lo añade al escritor por lotes en segundo plano (`writer.py`), que lo guarda cuando
+    terminan las descargas de su lote y avanza el checkpoint (`checkpoint.py`).
+
+El motor no sabe nada de la interfaz: informa por callbacks (`log`, `on_flush` y un
+`scheduler.ChannelProgress` opcional), se detiene cuando `is_running()` devuelve False y se
+pausa mientras el `asyncio.Event` `resumed` esté sin activar.
+Solo necesita un cliente con `get_messages`, así que se puede probar y medir con un
+cliente de Telegram falso.
+"""
+from collections import namedtuple
+
+from telethon.tl.types import Message
+
+import checkpoint
+import downloader
+import ratelimit
+import schema
+import tuning
+from writer import MessageWriter
+
+# Resultado de sincronizar un canal: estado final ('done', 'stopped' o 'failed'),
+# db.FlushResult acumulado y archivos multimedia guardados
+SyncResult = namedtuple("SyncResult", ["state", "totals", "media"])
+
+
+def collection_name_for(channel_name):
+    """Nombre de la colección de un canal: el último tramo si es un enlace."""
+    return channel_name.strip().split('/')[-1]
+
+
+async def sync_channel(client, channel_name, log=print, progress=None, on_flush=None,
+                       is_running=None, resumed=None):
+    """
+    Sincroniza los mensajes nuevos de un canal con `client` (ya iniciado).
+
+    `on_flush(batch, result)` se llama tras escribir cada lote y `progress` se actualiza
+    con los mensajes y archivos guardados. Si `is_running()` pasa a False la sincronización
+    se detiene: los lotes sin escribir se descartan y las descargas en curso se interrumpen
+    (se reanudarán en la próxima ejecución). Si se pasa `resumed` y se desactiva, la lectura
+    del historial se pausa hasta que se vuelva a activar; las descargas y escrituras ya
+    encoladas terminan. Devuelve un `SyncResult`.
+    """
+    is_running = is_running or (lambda: True)
+    collection_name = collection_name_for(channel_name)
+
+    # Las descargas se hacen en segundo plano para no frenar la lectura del historial
+    on_downloaded = (lambda size: progress.add(bytes=size)) if progress is not None else None
+    pipeline = downloader.MediaDownloadPipeline(collection_name, log=log, on_downloaded=on_downloaded)
+    # El checkpoint del canal dice hasta qué ID está todo escrito en la BD
+    sync_checkpoint = checkpoint.SyncCheckpoint(collection_name)
+
+    log(f"Checking sync state for collection '{collection_name}'...")
+    min_id = await sync_checkpoint.load(log=log)
+    log(f"Last synced message ID: {min_id}")
+
+    log(f"Fetching messages from {channel_name} starting from ID {min_id}...")
+
+    media_saved = 0
+
+    def flushed(batch, result):
+        nonlocal media_saved
+        media = sum(1 for m in batch if 'saved_media_path' in m)
+        media_saved += media
+        if progress is not None:
+            progress.add(messages=result.inserted, media=media)
+        if on_flush is not None:
+            on_flush(batch, result)
+
+    # Tamaños de página y de lote (fijos o ajustados durante la ejecución con AUTO_TUNE)
+    tuner = tuning.SyncTuner(collection_name, log=log)
+
+    pipeline.start()
+    # Y las escrituras en MongoDB también: el bucle solo llena el buffer del escritor
+    writer = MessageWriter(collection_name, log=log, on_flush=flushed, checkpoint=sync_checkpoint,
+                           tuner=tuner)
+    writer.start()
+    if progress is not None:
+        progress.watch(lambda: {
+            "download_queue": pipeline.queue_depth,
+            "pending_flushes": writer.pending_flushes,
+        })
+
+    state = "failed"
+    try:
+        # ratelimit.iter_messages recorre de viejo a nuevo los mensajes con ID > min_id,
+        # respeta el ritmo compartido y, ante un FloodWait, espera lo que pide Telegram
+        # y continúa desde el último mensaje recibido
+        async for message in ratelimit.iter_messages(client, channel_name, min_id=min_id, log=log,
+                                                     tuner=tuner, channel=collection_name):
+            if resumed is not None and not resumed.is_set():
+                log("Sync paused.")
+                await resumed.wait()
+                if is_running():
+                    log("Sync resumed.")
+            if not is_running():
+                log("Sync stopped by user.")
+                break
+
+            if isinstance(message, Message):
+                # Construir el documento a guardar según STORAGE_SCHEMA: proyección
+                # compacta de los campos consultables o to_dict() completo comprimido
+                msg_dict = schema.message_document(message)
+
+                # Manejar Descarga de Multimedia: se encola y el pipeline rellena
+                # msg_dict['saved_media_path'] cuando termina
+                pending = None
+                if message.media:
+                    pending = await pipeline.submit(message, msg_dict)
+
+                # El escritor agrupa los mensajes en lotes y no escribe uno hasta que
+                # terminan las descargas de sus mensajes, para tener sus rutas.
+                await writer.add(msg_dict, pending=pending)
+        state = "done"
+    finally:
+        stopped = not is_running()
+        # Si se detuvo no se escriben los lotes pendientes: sus descargas pueden estar
+        # incompletas y así se vuelven a recorrer (y reanudar) en la próxima ejecución.
+        # Se descartan antes de cerrar el pipeline, que al cancelar resuelve sus Futures.
+        await writer.close(discard=stopped)
+        # Si se detiene, se interrumpen las descargas: las grandes guardan su estado
+        # en disco y se reanudarán en la próxima sincronización
+        await pipeline.close(cancel=stopped)
+        if stopped:
+            state = "stopped"
+        await sync_checkpoint.finish(state, writer.totals, media_saved)
+
+    totals = writer.totals
+    log(f"Inserted {totals.inserted} messages ({totals.duplicates} duplicates, "
+        f"{totals.failed} failed)")
+    log(f"Telegram requests: {ratelimit.format_rate(ratelimit.default_controller().snapshot())}")
+    log(tuner.summary())
+    return SyncResult(state, totals, media_saved)
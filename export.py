@@ -0,0 +1,307 @@
+"""
+Módulo de Exportación de Canales.
+
+Vuelca una colección de canal a archivos para analizarla fuera de MongoDB. Los mensajes se
+leen en orden de ID con un cursor y se escriben según llegan, así que la memoria usada no
+depende del tamaño del canal. La salida de cada canal va a `EXPORT_DIR/<colección>/`:
+
+- Archivos de datos de hasta EXPORT_CHUNK_SIZE mensajes, `<colección>-<primer ID>-<último
+  ID>.jsonl.gz` (JSON Lines con gzip) o `.parquet` (columnar, comprimido con zstd; necesita
+  `pyarrow`). Todos los mensajes salen con los campos del esquema 'compact'; los
+  documentos 'raw' y los archivados antes de STORAGE_SCHEMA llevan además su `to_dict()`
+  completo en `raw`.
+- Junto a cada archivo de datos, `<...>.media.jsonl` con los archivos multimedia de sus
+  mensajes (`saved_media_path`, si existe en disco y su tamaño).
+- `manifest.json`, con cada exportación hecha (criterios, archivos, recuentos) y el último
+  ID exportado, que usa la exportación incremental para seguir donde se quedó.
+
+Los archivos se escriben con un nombre temporal y se renombran al completarse: una
+exportación interrumpida no deja archivos a medias en el manifiesto.
+
+Varios canales se exportan en paralelo en hilos (`export_channels`): mientras uno espera
+a MongoDB o comprime, los demás avanzan.
+"""
+import base64
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import db
+import schema
+import search
+import settings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ("jsonl", "parquet")
+MANIFEST_NAME = "manifest.json"
+# Filas que se acumulan antes de escribir un row group de Parquet
+PARQUET_ROW_GROUP = 10000
+
+
+def json_default(value):
+    """Serializa para JSON los tipos de BSON que `json` no conoce."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def export_record(doc):
+    """
+    Documento listo para exportar, sin `_id`: los campos compactos y, si el documento es
+    'raw' o antiguo (ver `schema.is_legacy`), su to_dict() completo en `raw`.
+    """
+    if "raw" in doc:
+        raw = schema.decode_raw(doc)
+    elif schema.is_legacy(doc):
+        raw = {key: value for key, value in doc.items() if key not in ("_id", "saved_media_path")}
+    else:
+        return {key: value for key, value in doc.items() if key != "_id"}
+    record = schema.compact_from_dict(raw)
+    record["id"] = doc["id"]
+    if "saved_media_path" in doc:
+        record["saved_media_path"] = doc["saved_media_path"]
+    record["raw"] = raw
+    return record
+
+
+def media_entry(doc):
+    """Entrada del manifiesto de multimedia para un mensaje con `saved_media_path`."""
+    path = doc["saved_media_path"]
+    full_path = os.path.join(settings.STORAGE_ROOT, path)
+    exists = os.path.exists(full_path)
+    return {
+        "id": doc["id"],
+        "path": path,
+        "exists": exists,
+        "size": os.path.getsize(full_path) if exists else None,
+    }
+
+
+class _JsonlWriter:
+    extension = ".jsonl.gz"
+
+    def __init__(self, path):
+        self._file = gzip.open(path, "wt", encoding="utf-8",
+                               compresslevel=settings.EXPORT_COMPRESSION_LEVEL)
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=json_default))
+        self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    extension = ".parquet"
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        # Esquema fijo: los campos del esquema 'compact', la ruta del multimedia y, para
+        # los documentos 'raw' y antiguos, su to_dict() como texto JSON (ver `export_record`)
+        self.schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("date", pyarrow.timestamp("us", tz="UTC")),
+            ("text", pyarrow.string()),
+            ("sender_id", pyarrow.int64()),
+            ("views", pyarrow.int64()),
+            ("forwards", pyarrow.int64()),
+            ("reply_to", pyarrow.int64()),
+            ("grouped_id", pyarrow.int64()),
+            ("media_kind", pyarrow.string()),
+            ("media_size", pyarrow.int64()),
+            ("saved_media_path", pyarrow.string()),
+            ("raw", pyarrow.string()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        self._rows = []
+
+    def write(self, record):
+        row = {name: record.get(name) for name in self.schema.names}
+        if row["raw"] is not None:
+            row["raw"] = json.dumps(row["raw"], ensure_ascii=False, default=json_default)
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pyarrow.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+_WRITERS = {"jsonl": _JsonlWriter, "parquet": _ParquetWriter}
+
+
+class ExportChunk:
+    """
+    Un archivo de datos de la exportación y su lista de multimedia, escritos con nombres
+    temporales hasta `close()`.
+    """
+    def __init__(self, channel_dir, collection_name, fmt, first_id):
+        self.channel_dir = channel_dir
+        self.prefix = f"{collection_name}-{first_id:012d}"
+        self.first_id = first_id
+        self.last_id = first_id
+        self.messages = 0
+        self.media = 0
+        writer_class = _WRITERS[fmt]
+        self.extension = writer_class.extension
+        self._data_path = os.path.join(channel_dir, self.prefix + ".partial" + self.extension)
+        self._media_path = os.path.join(channel_dir, self.prefix + ".partial.media.jsonl")
+        self._data = writer_class(self._data_path)
+        self._media = open(self._media_path, "w", encoding="utf-8")
+
+    def add(self, doc):
+        self._data.write(export_record(doc))
+        if doc.get("saved_media_path"):
+            self._media.write(json.dumps(media_entry(doc)) + "\n")
+            self.media += 1
+        self.messages += 1
+        self.last_id = doc["id"]
+
+    def close(self):
+        """Cierra y renombra los archivos; devuelve su entrada del manifiesto."""
+        self._data.close()
+        self._media.close()
+        name = f"{self.prefix}-{self.last_id:012d}"
+        data_file = name + self.extension
+        data_path = os.path.join(self.channel_dir, data_file)
+        os.replace(self._data_path, data_path)
+        media_file = None
+        if self.media:
+            media_file = name + ".media.jsonl"
+            os.replace(self._media_path, os.path.join(self.channel_dir, media_file))
+        else:
+            os.remove(self._media_path)
+        return {
+            "file": data_file,
+            "media_file": media_file,
+            "first_id": self.first_id,
+            "last_id": self.last_id,
+            "messages": self.messages,
+            "media": self.media,
+            "bytes": os.path.getsize(data_path),
+        }
+
+    def discard(self):
+        """Cierra y borra los archivos temporales (exportación interrumpida)."""
+        for close in (self._data.close, self._media.close):
+            try:
+                close()
+            except Exception:
+                pass
+        for path in (self._data_path, self._media_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_manifest(channel_dir, collection_name):
+    path = os.path.join(channel_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"collection": collection_name, "last_id": 0, "exports": []}
+
+
+def save_manifest(channel_dir, manifest):
+    path = os.path.join(channel_dir, MANIFEST_NAME)
+    with open(path + ".partial", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".partial", path)
+
+
+def export_channel(collection_name, output_dir=None, fmt="jsonl", after_id=None, since_date=None,
+                   incremental=False, chunk_size=None, log=print):
+    """
+    Exporta los mensajes de `collection_name` con ID mayor que `after_id` y fecha desde
+    `since_date` ('YYYY-MM-DD' o datetime). Con `incremental` y sin `after_id`, continúa
+    desde el último ID de la exportación anterior. Devuelve la entrada añadida al manifiesto.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    channel_dir = os.path.join(output_dir or settings.EXPORT_DIR, collection_name)
+    os.makedirs(channel_dir, exist_ok=True)
+    manifest = load_manifest(channel_dir, collection_name)
+    if incremental and after_id is None:
+        after_id = manifest["last_id"]
+    since_date = search.parse_date(since_date)
+
+    run = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "format": fmt,
+        "after_id": after_id or 0,
+        "since_date": since_date.isoformat() if since_date else None,
+        "messages": 0,
+        "media": 0,
+        "chunks": [],
+    }
+    log(f"Exporting {collection_name} as {fmt} from ID {after_id or 0}"
+        + (f" and date {since_date:%Y-%m-%d}" if since_date else "") + "...")
+
+    chunk = None
+    try:
+        for doc in db.iter_documents(collection_name, after_id=after_id, since_date=since_date):
+            if chunk is None:
+                chunk = ExportChunk(channel_dir, collection_name, fmt, doc["id"])
+            chunk.add(doc)
+            if chunk.messages >= chunk_size:
+                run["chunks"].append(chunk.close())
+                chunk = None
+                log(f"Exported {sum(c['messages'] for c in run['chunks'])} messages so far...")
+        if chunk is not None:
+            run["chunks"].append(chunk.close())
+            chunk = None
+    finally:
+        if chunk is not None:
+            chunk.discard()
+
+    run["messages"] = sum(c["messages"] for c in run["chunks"])
+    run["media"] = sum(c["media"] for c in run["chunks"])
+    run["finished_at"] = datetime.now(timezone.utc).isoformat()
+    if run["chunks"]:
+        manifest["last_id"] = max(manifest["last_id"], run["chunks"][-1]["last_id"])
+    manifest["exports"].append(run)
+    save_manifest(channel_dir, manifest)
+
+    log(f"Export completed: {run['messages']} messages and {run['media']} media files "
+        f"in {len(run['chunks'])} files ({channel_dir})")
+    return run
+
+
+def export_channels(collection_names, concurrency=None, log=print, **options):
+    """
+    Exporta varios canales a la vez, hasta `concurrency` (EXPORT_CONCURRENCY) en paralelo,
+    con las opciones de `export_channel`. Devuelve {canal: entrada del manifiesto o la
+    excepción con la que falló}; un canal fallido no detiene a los demás.
+    """
+    concurrency = concurrency or settings.EXPORT_CONCURRENCY
+
+    def export_one(name):
+        prefixed = (lambda text: log(f"[{name}] {text}")) if len(collection_names) > 1 else log
+        return export_channel(name, log=prefixed, **options)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="export") as pool:
+        futures = {name: pool.submit(export_one, name) for name in collection_names}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
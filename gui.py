@@ -3,18 +3,28 @@ Módulo de Interfaz Gráfica de Usuario (GUI).
 
 Este módulo define la ventana principal de la aplicación utilizando PySide6 (Qt).
 Maneja la interacción del usuario, selección de canal y activación del proceso de sincronización.
-Utiliza `qasync` para integrar el bucle de eventos asyncio con el de Qt.
+La sincronización corre en el hilo del motor (`worker.EngineThread`); la ventana solo
+envía órdenes y recibe la telemetría como señales, así que nunca espera a la red ni a MongoDB.
+
+La pestaña "Search" consulta los mensajes ya archivados (ver `search.py`); las consultas
+también corren en el hilo del motor y sus páginas llegan por `search_signal`.
+
+La consola de logs es un `QPlainTextEdit` acotado a GUI_LOG_MAX_LINES líneas (las más
+antiguas se descartan) y el panel de progreso es una tabla por canal que se redibuja con
+cada snapshot, que el worker envía a ritmo fijo.
 """
 from PySide6.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-    QPushButton, QTextEdit, QLabel, QStatusBar, QComboBox, QMessageBox
+    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QTableWidget,
+    QTableWidgetItem, QHeaderView, QAbstractItemView, QTabWidget, QLineEdit,
+    QPushButton, QLabel, QStatusBar, QComboBox, QMessageBox
 )
 from PySide6.QtCore import Slot
+import html
 import settings
-import os
+import scheduler
+import schema
+import search
 from worker import TelegramSyncService
-import asyncio
-from qasync import asyncSlot
 
 class MainWindow(QMainWindow):
     """
@@ -23,6 +33,18 @@ class MainWindow(QMainWindow):
     Atributos:
         worker (TelegramSyncService): El servicio que maneja la lógica de sincronización de Telegram.
     """
+    # Columnas del panel de progreso: (título, función que da el texto a partir del canal)
+    PROGRESS_COLUMNS = [
+        ("Channel", lambda c: c["channel"]),
+        ("State", lambda c: c["state"]),
+        ("Messages", lambda c: str(c["messages"])),
+        ("Media", lambda c: str(c["media"])),
+        ("msg/s", lambda c: f"{c['messages_per_sec']:.1f}"),
+        ("MB/s", lambda c: f"{c['mb_per_sec']:.2f}"),
+        ("Download queue", lambda c: str(c["download_queue"])),
+        ("Pending writes", lambda c: str(c["pending_flushes"])),
+    ]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Telegram Recover GUI")
@@ -33,18 +55,24 @@ class MainWindow(QMainWindow):
         self.worker.status_signal.connect(self.update_status)
         self.worker.finished_signal.connect(self.on_sync_finished)
         self.worker.error_signal.connect(self.log_error)
+        self.worker.progress_signal.connect(self.on_sync_progress)
+        self.worker.search_signal.connect(self.on_search_results)
 
-
-        
-        self.abort_batch_sync = False
+        self._channel_states = {}
+        # Canal y criterios de la última búsqueda, e ID desde el que sigue ("More")
+        self._search_request = None
+        self._search_next = None
+        self._search_warning = None
 
         self.setup_ui()
         
     def setup_ui(self):
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        
-        layout = QVBoxLayout(central_widget)
+        tabs = QTabWidget()
+        self.setCentralWidget(tabs)
+
+        sync_tab = QWidget()
+        tabs.addTab(sync_tab, "Sync")
+        layout = QVBoxLayout(sync_tab)
         
         # Header Info
         info_layout = QHBoxLayout()
@@ -68,105 +96,271 @@ class MainWindow(QMainWindow):
         self.sync_all_btn = QPushButton("Sync All")
         self.sync_all_btn.clicked.connect(self.start_sync_all)
 
+        self.backfill_btn = QPushButton("Backfill")
+        self.backfill_btn.clicked.connect(self.start_backfill)
+
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setCheckable(True)
+        self.pause_btn.toggled.connect(self.toggle_pause)
+        self.pause_btn.setEnabled(False)
+
         self.stop_btn = QPushButton("Stop")
         self.stop_btn.clicked.connect(self.stop_sync)
         self.stop_btn.setEnabled(False)
         
         controls_layout.addWidget(self.start_btn)
         controls_layout.addWidget(self.sync_all_btn)
+        controls_layout.addWidget(self.backfill_btn)
+        controls_layout.addWidget(self.pause_btn)
         controls_layout.addWidget(self.stop_btn)
         controls_layout.addStretch()
         layout.addLayout(controls_layout)
         
+        # Progress Panel
+        layout.addWidget(QLabel("Progress:"))
+        self.progress_table = QTableWidget(0, len(self.PROGRESS_COLUMNS))
+        self.progress_table.setHorizontalHeaderLabels([title for title, _ in self.PROGRESS_COLUMNS])
+        self.progress_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.progress_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.progress_table.verticalHeader().setVisible(False)
+        self.progress_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.progress_table.setMaximumHeight(160)
+        layout.addWidget(self.progress_table)
+        self.progress_summary = QLabel("")
+        layout.addWidget(self.progress_summary)
+
         # Log Console
         layout.addWidget(QLabel("Logs:"))
-        self.log_console = QTextEdit()
+        self.log_console = QPlainTextEdit()
         self.log_console.setReadOnly(True)
+        # Búfer circular: Qt descarta las líneas más antiguas al superar el máximo
+        self.log_console.setMaximumBlockCount(settings.GUI_LOG_MAX_LINES)
         layout.addWidget(self.log_console)
-        
+
+        tabs.addTab(self.setup_search_tab(), "Search")
+
         # Status Bar
         self.setStatusBar(QStatusBar())
         self.update_status("Ready")
         
+    def setup_search_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        query_layout = QHBoxLayout()
+        self.search_channel = QComboBox()
+        self.search_channel.addItems(
+            [self.channel_combo.itemText(i) for i in range(self.channel_combo.count())]
+        )
+        self.search_text = QLineEdit()
+        self.search_text.setPlaceholderText('Words, "exact phrase", -excluded')
+        self.search_text.returnPressed.connect(self.run_search)
+        self.search_btn = QPushButton("Search")
+        self.search_btn.clicked.connect(self.run_search)
+        query_layout.addWidget(QLabel("<b>Channel:</b>"))
+        query_layout.addWidget(self.search_channel)
+        query_layout.addWidget(self.search_text, 1)
+        query_layout.addWidget(self.search_btn)
+        layout.addLayout(query_layout)
+
+        filters_layout = QHBoxLayout()
+        self.search_sender = QLineEdit()
+        self.search_sender.setPlaceholderText("Sender ID")
+        self.search_media = QComboBox()
+        self.search_media.addItems(["Any media"] + list(schema.MEDIA_KINDS) + ["other"])
+        self.search_since = QLineEdit()
+        self.search_since.setPlaceholderText("Since (YYYY-MM-DD)")
+        self.search_until = QLineEdit()
+        self.search_until.setPlaceholderText("Until (YYYY-MM-DD)")
+        self.more_btn = QPushButton("More")
+        self.more_btn.clicked.connect(self.search_more)
+        self.more_btn.setEnabled(False)
+        for widget in (self.search_sender, self.search_media, self.search_since,
+                       self.search_until, self.more_btn):
+            filters_layout.addWidget(widget)
+        layout.addLayout(filters_layout)
+
+        self.search_table = QTableWidget(0, len(search.RESULT_COLUMNS))
+        self.search_table.setHorizontalHeaderLabels(list(search.RESULT_COLUMNS))
+        header = self.search_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(len(search.RESULT_COLUMNS) - 1, QHeaderView.Stretch)
+        self.search_table.verticalHeader().setVisible(False)
+        self.search_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.search_table)
+        self.search_summary = QLabel("")
+        layout.addWidget(self.search_summary)
+        return tab
+
     def load_channels(self):
-        file_path = "canalles.txt"
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                channels = [line.strip() for line in f if line.strip()]
-            
-            if channels:
-                self.channel_combo.addItems(channels)
-            else:
-                 self.channel_combo.addItem(settings.CHANNEL_NAME or "")
+        channels = scheduler.read_channel_file(settings.CHANNELS_FILE)
+        if channels:
+            self.channel_combo.addItems(channels)
         else:
             self.channel_combo.addItem(settings.CHANNEL_NAME or "")
 
-    @asyncSlot()
-    async def start_sync(self):
+    def start_sync(self):
         channel_name = self.channel_combo.currentText()
         if not channel_name:
              QMessageBox.warning(self, "Error", "Please select a channel.")
              return
 
-        self.start_btn.setEnabled(False)
-        self.stop_btn.setEnabled(True)
+        self.set_running(True)
+        self.reset_progress()
         self.log_message(f"Starting sync process for {channel_name}...")
-        # Iniciamos la tarea asíncrona
-        await self.worker.start_sync(channel_name)
+        # La sincronización corre en el hilo del motor; el final llega con finished_signal
+        self.worker.start_sync(channel_name)
         
-    @asyncSlot()
-    async def start_sync_all(self):
+    def start_backfill(self):
+        channel_name = self.channel_combo.currentText()
+        if not channel_name:
+            QMessageBox.warning(self, "Error", "Please select a channel.")
+            return
+
+        self.set_running(True)
+        self.log_message(f"Starting backfill for {channel_name}...")
+        self.worker.start_backfill(channel_name)
+
+    def start_sync_all(self):
         count = self.channel_combo.count()
         if count == 0:
             QMessageBox.warning(self, "Error", "No channels to sync.")
             return
 
-        self.start_btn.setEnabled(False)
-        self.sync_all_btn.setEnabled(False)
-        self.stop_btn.setEnabled(True)
-        self.abort_batch_sync = False
-
-        self.log_message("Starting batch sync for all channels...")
-
-        for i in range(count):
-            if self.abort_batch_sync:
-                self.log_message("Batch sync aborted by user.")
-                break
-            
-            channel_name = self.channel_combo.itemText(i)
-            self.channel_combo.setCurrentIndex(i) # Retroalimentación visual
-            self.log_message(f"--- Processing channel {i+1}/{count}: {channel_name} ---")
-            
-            # ¿Esperar a que el worker termine este canal?
-            # worker.start_sync es async, así que esperar (await) debería esperar a que termine
-            # SI el worker fue diseñado para ser esperado correctamente.
-            # Mirando worker.py: async def start_sync(self, channel_name=None):
-            # Ejecuta un bucle.
-            
-            await self.worker.start_sync(channel_name)
-            
-            # Pequeña pausa entre canales
-            await asyncio.sleep(1)
-
-        self.start_btn.setEnabled(True)
-        self.sync_all_btn.setEnabled(True)
-        self.stop_btn.setEnabled(False)
-        self.update_status("Batch sync finished")
-        self.log_message("Batch sync process completed.")
+        self.set_running(True)
+        self.reset_progress()
+
+        channels = [self.channel_combo.itemText(i) for i in range(count)]
+        self.log_message(
+            f"Starting batch sync for all channels ({settings.SYNC_CONCURRENCY} at a time)..."
+        )
+
+        # El worker sincroniza los canales en paralelo y emite progress_signal
+        self.worker.start_sync_all(channels)
+
+    def set_running(self, running):
+        self.start_btn.setEnabled(not running)
+        self.sync_all_btn.setEnabled(not running)
+        self.backfill_btn.setEnabled(not running)
+        self.pause_btn.setEnabled(running)
+        self.stop_btn.setEnabled(running)
+        if not running:
+            self.pause_btn.setChecked(False)
+
+    def run_search(self):
+        channel_name = self.search_channel.currentText()
+        if not channel_name:
+            QMessageBox.warning(self, "Error", "Please select a channel.")
+            return
+        sender = self.search_sender.text().strip()
+        if sender and not sender.lstrip("-").isdigit():
+            QMessageBox.warning(self, "Error", "Sender ID must be a number.")
+            return
+
+        criteria = {
+            "text": self.search_text.text().strip() or None,
+            "sender_id": int(sender) if sender else None,
+            "media_kind": self.search_media.currentText() if self.search_media.currentIndex() else None,
+            "since": self.search_since.text().strip() or None,
+            "until": self.search_until.text().strip() or None,
+        }
+        self._search_request = (channel_name, criteria)
+        self.search_table.setRowCount(0)
+        self.request_search_page(None)
+
+    def search_more(self):
+        if self._search_request and self._search_next is not None:
+            self.request_search_page(self._search_next)
+
+    def request_search_page(self, before_id):
+        self.search_btn.setEnabled(False)
+        self.more_btn.setEnabled(False)
+        self.search_summary.setText("Searching...")
+        channel_name, criteria = self._search_request
+        self.worker.search(channel_name, criteria, before_id=before_id)
+
+    @Slot(dict)
+    def on_search_results(self, event):
+        self.search_btn.setEnabled(True)
+        if event.get("error"):
+            self.search_summary.setText(f"Search failed: {event['error']}")
+            return
+
+        rows = event["rows"]
+        first = self.search_table.rowCount() if event["append"] else 0
+        self.search_table.setRowCount(first + len(rows))
+        for offset, row in enumerate(rows):
+            for column, value in enumerate(row):
+                self.search_table.setItem(first + offset, column, QTableWidgetItem(value))
+
+        self._search_next = event["next_before_id"]
+        self.more_btn.setEnabled(self._search_next is not None)
+        summary = f"{self.search_table.rowCount()} results ({event['elapsed'] * 1000:.0f} ms)"
+        if self._search_next is not None:
+            summary += ", more available"
+        if event.get("warning"):
+            self._search_warning = event["warning"]
+        elif not event["append"]:
+            self._search_warning = None
+        if self._search_warning:
+            summary += f". {self._search_warning}"
+        self.search_summary.setText(summary)
+
+    def reset_progress(self):
+        self._channel_states = {}
+        self.progress_table.setRowCount(0)
+        self.progress_summary.setText("")
+
+    @Slot(dict)
+    def on_sync_progress(self, snapshot):
+        # Llega a ritmo fijo: redibujar el panel, registrar los cambios de estado de cada
+        # canal y mostrar el agregado en la barra de estado
+        channels = snapshot["channels"]
+        self.progress_table.setRowCount(len(channels))
+        for row, channel in enumerate(channels):
+            for column, (_, text) in enumerate(self.PROGRESS_COLUMNS):
+                value = text(channel)
+                item = self.progress_table.item(row, column)
+                if item is None:
+                    self.progress_table.setItem(row, column, QTableWidgetItem(value))
+                elif item.text() != value:
+                    item.setText(value)
+
+            state = channel["state"]
+            if self._channel_states.get(channel["channel"]) != state:
+                self._channel_states[channel["channel"]] = state
+                if state != "pending":
+                    self.log_message(
+                        f"--- {channel['channel']}: {state} ({channel['messages']} messages) ---"
+                    )
+        summary = scheduler.format_summary(snapshot)
+        self.progress_summary.setText(summary)
+        self.update_status(summary)
+
+    @Slot(bool)
+    def toggle_pause(self, paused):
+        self.pause_btn.setText("Resume" if paused else "Pause")
+        if not self.pause_btn.isEnabled():
+            return
+        if paused:
+            self.worker.pause_sync()
+        else:
+            self.worker.resume_sync()
 
     def stop_sync(self):
-        self.abort_batch_sync = True
         self.worker.stop_sync()
         self.log_message("Stopping sync...")
+        self.pause_btn.setEnabled(False)
         self.stop_btn.setEnabled(False)
         
     @Slot(str)
     def log_message(self, message):
-        self.log_console.append(message)
-        
+        # `message` puede ser un bloque de varias líneas (el worker agrupa los logs)
+        self.log_console.appendPlainText(message)
+
     @Slot(str)
     def log_error(self, message):
-        self.log_console.append(f"<font color='red'>{message}</font>")
+        self.log_console.appendHtml(f"<font color='red'>{html.escape(message)}</font>")
 
     @Slot(str)
     def update_status(self, status):
@@ -174,7 +368,11 @@ class MainWindow(QMainWindow):
         
     @Slot()
     def on_sync_finished(self):
-        self.start_btn.setEnabled(True)
-        self.stop_btn.setEnabled(False)
+        self.set_running(False)
         self.update_status("Finished")
         self.log_message("Sync process finished.")
+
+    def closeEvent(self, event):
+        # Detener el motor antes de cerrar: los lotes escritos quedan en el checkpoint
+        self.worker.shutdown()
+        super().closeEvent(event)
@@ -0,0 +1,237 @@
+"""
+Módulo del Modo Demonio (archivo en vivo).
+
+En lugar de relanzar la sincronización periódicamente (cron de `start.sh`), que paga en
+cada ejecución el inicio de sesión, la conexión MTProto y la lectura de los checkpoints,
+`run_daemon` mantiene un único cliente conectado y se suscribe a `events.NewMessage` de
+todos los canales:
+
+- Cada mensaje nuevo entra en `LiveChannel` de su canal y sigue el mismo camino que en la
+  sincronización: documento de `schema.py`, descarga en `MediaDownloadPipeline` y escritura
+  por lotes en `MessageWriter` (con un intervalo de escritura corto, DAEMON_FLUSH_INTERVAL,
+  para que llegue a la BD en segundos).
+- Al arrancar y cada DAEMON_CATCH_UP_INTERVAL segundos, cada canal hace una pasada de
+  recuperación con `engine.sync_channel` desde su checkpoint, que recoge lo que no llegó
+  por eventos (desconexiones, huecos de actualizaciones, canales a los que la cuenta no
+  está unida) y es la única que avanza el checkpoint. Antes de cada pasada se vacían las
+  escrituras y descargas en vivo, para que las dos no descarguen el mismo archivo a la
+  vez; lo que ya guardó el modo en vivo cuenta como duplicado.
+
+Los mensajes recibidos en vivo y su latencia desde la publicación hasta escribirse en la
+BD se cuentan en `metrics`.
+"""
+import asyncio
+import signal
+import time
+from datetime import datetime, timezone
+
+from telethon import events, functions, utils
+from telethon.tl.types import Message
+
+import downloader
+import engine
+import metrics
+import ratelimit
+import schema
+import settings
+from writer import MessageWriter
+
+
+class LiveChannel:
+    """
+    Archivo en vivo de un canal.
+
+    Uso:
+        live = LiveChannel(client, "mi_canal", log=print)
+        task = asyncio.create_task(live.run())   # recuperación inicial y después en vivo
+        live.push(event.message)                 # desde el manejador de eventos
+        ...
+        live.stop()
+        await task
+
+    Atributos:
+        channel_name (str): Canal tal como aparece en la lista.
+        collection_name (str): Colección donde se guarda.
+        catch_up_interval (float): Segundos entre pasadas de recuperación.
+        last_id (int): ID más alto ya recorrido, en vivo o por la recuperación; los mensajes
+            en vivo con un ID menor o igual se ignoran.
+        received (int): Mensajes recibidos en vivo.
+    """
+    def __init__(self, client, channel_name, log=print, catch_up_interval=None, slots=None):
+        self.client = client
+        self.channel_name = channel_name
+        self.collection_name = engine.collection_name_for(channel_name)
+        self.log = log
+        self.catch_up_interval = catch_up_interval or settings.DAEMON_CATCH_UP_INTERVAL
+        # Limita las pasadas de recuperación simultáneas entre todos los canales
+        self.slots = slots or asyncio.Semaphore(1)
+        self.last_id = 0
+        self.received = 0
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._pipeline = None
+        self._writer = None
+        # Fecha de publicación de los mensajes en vivo aún sin escribir, por ID
+        self._posted = {}
+
+    def is_running(self):
+        return not self._stopping
+
+    def push(self, message):
+        """Encola un mensaje recibido por eventos (se llama desde el bucle de eventos)."""
+        self._queue.put_nowait(message)
+
+    def stop(self):
+        """Termina `run()` tras escribir lo que ya se recibió."""
+        self._stopping = True
+        self._queue.put_nowait(None)
+
+    async def run(self):
+        """Recupera el canal y archiva en vivo, con recuperaciones periódicas, hasta `stop()`."""
+        next_catch_up = 0.0
+        try:
+            while self.is_running():
+                timeout = next_catch_up - time.monotonic()
+                if timeout <= 0:
+                    await self.catch_up()
+                    next_catch_up = time.monotonic() + self.catch_up_interval
+                    continue
+                try:
+                    message = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                if message is None:
+                    break
+                await self._archive(message)
+        finally:
+            await self._close()
+
+    async def catch_up(self):
+        """Pasada de recuperación desde el checkpoint del canal (ver `engine.sync_channel`)."""
+        # Lo recibido en vivo se escribe antes: así la recuperación no descarga a la vez
+        # los mismos archivos y encuentra en disco lo que ya se descargó
+        await self._close()
+
+        def flushed(batch, result):
+            if batch:
+                self.last_id = max(self.last_id, batch[-1]["id"])
+
+        async with self.slots:
+            if not self.is_running():
+                return
+            try:
+                await engine.sync_channel(self.client, self.channel_name, log=self.log,
+                                          on_flush=flushed, is_running=self.is_running)
+            except Exception as e:
+                # Un canal con problemas no detiene al resto; se reintenta en la próxima pasada
+                self.log(f"Catch-up failed, retrying in {self.catch_up_interval:.0f}s: {e}")
+
+    def _open(self):
+        self._pipeline = downloader.MediaDownloadPipeline(self.collection_name, log=self.log)
+        self._pipeline.start()
+        self._writer = MessageWriter(self.collection_name, log=self.log, on_flush=self._flushed,
+                                     flush_interval=settings.DAEMON_FLUSH_INTERVAL)
+        self._writer.start()
+
+    async def _close(self):
+        if self._writer is None:
+            return
+        await self._writer.close()
+        await self._pipeline.close()
+        self._writer = self._pipeline = None
+
+    async def _archive(self, message):
+        if not isinstance(message, Message) or message.id <= self.last_id:
+            return
+        if self._writer is None:
+            self._open()
+        self.last_id = message.id
+        self.received += 1
+        metrics.LIVE_MESSAGES.inc(channel=self.collection_name)
+        if message.date:
+            self._posted[message.id] = message.date
+
+        msg_dict = schema.message_document(message)
+        pending = None
+        if message.media:
+            pending = await self._pipeline.submit(message, msg_dict)
+        await self._writer.add(msg_dict, pending=pending)
+
+    def _flushed(self, batch, result):
+        now = datetime.now(timezone.utc)
+        for msg in batch:
+            posted = self._posted.pop(msg["id"], None)
+            if posted is not None:
+                metrics.LIVE_LATENCY.observe(max(0.0, (now - posted).total_seconds()),
+                                             channel=self.collection_name)
+
+
+async def run_daemon(client, channels, log=print, catch_up_interval=None, concurrency=None):
+    """
+    Archiva en vivo `channels` con `client` (ya iniciado) hasta recibir SIGINT/SIGTERM o
+    hasta que el cliente se desconecte sin poder reconectar. Las pasadas de recuperación
+    de los canales corren de `concurrency` en `concurrency` (SYNC_CONCURRENCY).
+    """
+    slots = asyncio.Semaphore(concurrency or settings.SYNC_CONCURRENCY)
+    rate = ratelimit.default_controller()
+    live_channels = {}
+    for channel_name in channels:
+        channel_log = (lambda name: lambda text: log(f"[{name}] {text}"))(channel_name)
+        try:
+            # Resolver un nombre de usuario es una petición a Telegram: pasa por el control
+            # de ritmo, que espera y reintenta los FloodWait en lugar de detener el demonio
+            entity = await rate.call(client.get_input_entity, channel_name, log=channel_log)
+        except (ValueError, TypeError) as e:
+            channel_log(f"Could not resolve channel, skipping it: {e}")
+            continue
+        live_channels[utils.get_peer_id(entity)] = LiveChannel(
+            client, channel_name, log=channel_log, catch_up_interval=catch_up_interval, slots=slots,
+        )
+    if not live_channels:
+        log("Error: none of the channels could be resolved")
+        return
+
+    async def on_new_message(event):
+        live = live_channels.get(event.chat_id)
+        if live is not None:
+            live.push(event.message)
+
+    new_messages = events.NewMessage(chats=list(live_channels))
+    client.add_event_handler(on_new_message, new_messages)
+
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop_requested.set)
+            signals.append(signum)
+        except (NotImplementedError, RuntimeError):
+            # Windows o fuera del hilo principal: se detiene con la cancelación de la tarea
+            pass
+
+    tasks = [asyncio.create_task(live.run(), name=f"live-{live.collection_name}")
+             for live in live_channels.values()]
+    log(f"Following {len(tasks)} channels, catching up every "
+        f"{catch_up_interval or settings.DAEMON_CATCH_UP_INTERVAL:.0f}s. Press Ctrl+C to stop.")
+    try:
+        # Pedir el estado de actualizaciones le indica a Telegram que queremos recibirlas
+        await rate.call(client, functions.updates.GetStateRequest(), log=log)
+        stop_waiter = asyncio.ensure_future(stop_requested.wait())
+        disconnected = asyncio.ensure_future(client.disconnected)
+        await asyncio.wait({stop_waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        stop_waiter.cancel()
+        if disconnected.done():
+            log("Disconnected from Telegram, stopping.")
+        else:
+            log("Stopping, writing what was already received...")
+    finally:
+        client.remove_event_handler(on_new_message, new_messages)
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+        for live in live_channels.values():
+            live.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    for live in live_channels.values():
+        log(f"  {live.channel_name}: {live.received} live messages, last ID {live.last_id}")
@@ -3,103 +3,173 @@ Punto de Entrada Principal de la Aplicación CLI.
 
 Este script ejecuta el proceso de recuperación de mensajes de Telegram a través de la línea de comandos.
 Realiza los siguientes pasos:
-1.  Conecta a la base de datos MongoDB para encontrar el último ID de mensaje sincronizado.
+1.  Lee de MongoDB el checkpoint del canal (el último ID escrito de forma contigua).
 2.  Conecta al Cliente de Telegram usando Telethon.
 3.  Itera a través del historial del canal comenzando desde el último ID sincronizado.
-4.  Descarga multimedia (imágenes/videos) y los guarda localmente.
-5.  Almacena los metadatos del mensaje y las rutas multimedia en MongoDB.
+4.  Descarga multimedia (imágenes/videos) en paralelo y los guarda localmente.
+5.  Almacena los metadatos del mensaje y las rutas multimedia en MongoDB, por lotes y en segundo plano.
+
+Con `--all` o `--channels-file` sincroniza en paralelo todos los canales de un archivo
+de lista (por defecto `canalles.txt`) sobre un único cliente de Telegram.
+
+Con `--backfill`, en lugar de avanzar desde el último ID, rellena los huecos del historial
+guardado recorriendo varios segmentos de IDs en paralelo.
+
+Con `--daemon` no termina: se queda conectado archivando en vivo los mensajes nuevos de
+los canales, con pasadas de recuperación periódicas (ver `live.py`).
+
+Con `--metrics-port` sirve las métricas de `metrics.py` a Prometheus mientras sincroniza,
+con `--metrics-json` guarda el resumen de la ejecución y con `--profile` perfila la
+sincronización (ver `profiling.py`).
 """
+import argparse
 import asyncio
-import os
 from telethon import TelegramClient
-from telethon.tl.types import Message
 import settings
 import db
-import sys
+import backfill
+import engine
+import live
+import metrics
+import profiling
+import ratelimit
+import scheduler
 
 # Initialize Telegram Client
 client = TelegramClient('telegram_session', settings.API_ID, settings.API_HASH)
 
-async def main():
-    channel_name = settings.CHANNEL_NAME
-    if not channel_name:
+async def sync_channel(channel_name, progress=None):
+    """
+    Sincroniza un único canal con el cliente global (que ya debe estar iniciado).
+    Si se pasa un `scheduler.ChannelProgress`, se va actualizando con los mensajes guardados.
+    """
+    # Con varios canales en paralelo prefijamos los logs con el canal
+    log = print if progress is None else (lambda text: print(f"[{channel_name}] {text}"))
+
+    # El bucle de sincronización (historial, descargas y escrituras) vive en engine.py
+    await engine.sync_channel(client, channel_name, log=log, progress=progress)
+    log("Sync completed.")
+
+
+async def backfill_channel(channel_name, progress=None):
+    """
+    Rellena los huecos del historial de un canal (ver `backfill.py`) con el cliente global.
+    """
+    log = print if progress is None else (lambda text: print(f"[{channel_name}] {text}"))
+    await backfill.backfill_channel(client, channel_name, log=log, progress=progress)
+
+
+async def sync_all(channels, concurrency=None, job=sync_channel):
+    """
+    Sincroniza (o, con `job=backfill_channel`, rellena) varios canales en paralelo sobre
+    el cliente global, mostrando periódicamente el progreso agregado. Devuelve la
+    instantánea final del planificador.
+    """
+    sync_scheduler = scheduler.ChannelSyncScheduler(job, concurrency=concurrency)
+    print(f"Syncing {len(channels)} channels with concurrency {sync_scheduler.concurrency}...")
+
+    async def report():
+        while True:
+            await asyncio.sleep(10)
+            print(scheduler.format_summary(sync_scheduler.snapshot()))
+
+    reporter = asyncio.create_task(report())
+    try:
+        snapshot = await sync_scheduler.run(channels)
+    finally:
+        reporter.cancel()
+
+    for channel in snapshot["channels"]:
+        line = (f"  {channel['channel']}: {channel['state']}, {channel['messages']} messages, "
+                f"{channel['media']} media, {channel['messages_per_sec']:.1f} msg/s")
+        if channel["error"]:
+            line += f" ({channel['error']})"
+        print(line)
+    print(scheduler.format_summary(snapshot))
+    return snapshot
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archive Telegram channels into MongoDB.")
+    parser.add_argument("--all", action="store_true",
+                        help=f"sync every channel listed in {settings.CHANNELS_FILE}")
+    parser.add_argument("--channels-file", metavar="PATH",
+                        help="sync every channel listed in PATH (one per line)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help=f"channels synced at once (default: {settings.SYNC_CONCURRENCY})")
+    parser.add_argument("--backfill", action="store_true",
+                        help="fill the gaps in the stored history (or fetch the whole history "
+                             "of an empty collection) with parallel segments")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay connected and archive new messages as they are posted, "
+                             "with a periodic catch-up pass")
+    parser.add_argument("--catch-up-interval", type=float, default=None, metavar="SECONDS",
+                        help=f"seconds between catch-up passes in daemon mode "
+                             f"(default: {settings.DAEMON_CATCH_UP_INTERVAL:.0f})")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help=f"serve Prometheus metrics on this port "
+                             f"(default: METRICS_PORT, {settings.METRICS_PORT or 'disabled'})")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="save a JSON summary of the run's metrics to PATH "
+                             "(default: a file in METRICS_DIR, if set)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profile the sync with cProfile and asyncio task timings "
+                             f"(saved to {settings.PROFILE_DIR})")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    channels = None
+    if args.all or args.channels_file:
+        channels = scheduler.read_channel_file(args.channels_file)
+        if not channels:
+            print(f"Error: no channels found in {args.channels_file or settings.CHANNELS_FILE}")
+            return
+    elif not settings.CHANNEL_NAME:
         print("Error: CHANNEL_NAME not set in settings or .env")
         return
 
-    # 1. Conectar a la BD y obtener el último ID sincronizado
-    # Usar el nombre del canal como nombre de la colección
-    # Sanitizar el nombre del canal para el nombre de la colección si es un enlace
-    collection_name = channel_name.strip().split('/')[-1]
-    
-    print(f"Checking database for existing messages in collection '{collection_name}'...")
-    min_id = db.get_latest_message_id(collection_name)
-    print(f"Last synced message ID: {min_id}")
+    connections_before = db.connections_opened()
+    metrics.serve(port=args.metrics_port)
+    run_summary = metrics.RunSummary()
 
-    # 2. Iniciar el cliente
+    # 2. Iniciar el cliente (una sola vez, compartido por todos los canales)
     await client.start(phone=settings.PHONE_NUMBER)
-    
-    print(f"Fetching messages from {channel_name} starting from ID {min_id}...")
-
-    messages_to_insert = []
-    
-    # 3. Obtener historial
-    # reverse=True obtiene de viejo a nuevo (útil si quisiéramos procesar en orden),
-    # pero iter_messages por defecto (reverse=False) es de nuevo a viejo.
-    # Si usamos min_id, obtenemos mensajes MÁS NUEVOS que min_id.
-    # Documentación de Telethon: min_id devuelve mensajes con ID > min_id.
-    
-    # Obtendremos todos los mensajes nuevos.
-    async for message in client.iter_messages(channel_name, min_id=min_id, reverse=True):
-        if isinstance(message, Message):
-            # Serializar el objeto mensaje a un diccionario
-            # message.to_dict() da una representación dict serializable en JSON completa
-            msg_dict = message.to_dict()
-            
-            # Manejar Descarga de Multimedia
-            if message.media:
-                try:
-                    # Crear estructura de directorios: downloads/{channel}-{msg_id}/
-                    base_downloads_path = os.path.abspath(settings.DOWNLOADS_DIR)
-                    folder_name = f"{collection_name}-{message.id}"
-                    download_path = os.path.join(base_downloads_path, folder_name)
-                    
-                    os.makedirs(download_path, exist_ok=True)
-                    
-                    print(f"Downloading media for message {message.id}...")
-                    saved_path = await message.download_media(file=download_path)
-                    
-                    if saved_path:
-                         # Inicio del cálculo de ruta relativa
-                        try:
-                            storage_root = settings.STORAGE_ROOT
-                            relative_path = os.path.relpath(saved_path, storage_root)
-                            msg_dict['saved_media_path'] = relative_path
-                        except ValueError:
-                             msg_dict['saved_media_path'] = saved_path
-
-                        print(f"Media saved to: {saved_path}")
-                        
-                except Exception as e:
-                     print(f"Failed to download media for message {message.id}: {e}")
-
-            # Asegurar que el campo 'date' se maneja correctamente si es necesario,
-            # usualmente mongo maneja objetos datetime bien.
-            # Los objetos Telethon a menudo tienen objetos datetime que PyMongo acepta.
-            
-            messages_to_insert.append(msg_dict)
-            
-            # Inserción por lotes para evitar saturación de memoria si hay millones,
-            # aunque para un volcado típico de canal, 1000 a la vez está bien.
-            if len(messages_to_insert) >= 100:
-                db.insert_messages(collection_name, messages_to_insert)
-                messages_to_insert = []
-
-    # Insertar restantes
-    if messages_to_insert:
-        db.insert_messages(collection_name, messages_to_insert)
-
-    print("Sync completed.")
+    ratelimit.attach(client)
+
+    job = backfill_channel if args.backfill else sync_channel
+    if args.daemon:
+        run = live.run_daemon(client, channels or [settings.CHANNEL_NAME],
+                              catch_up_interval=args.catch_up_interval,
+                              concurrency=args.concurrency)
+    elif channels:
+        run = sync_all(channels, concurrency=args.concurrency, job=job)
+    else:
+        run = job(settings.CHANNEL_NAME)
+
+    snapshot = None
+    if args.profile:
+        profiler = profiling.SyncProfiler()
+        try:
+            snapshot = await profiler.run(run)
+        finally:
+            profiler.save()
+    else:
+        snapshot = await run
+
+    print(f"MongoDB connections opened during sync: {db.connections_opened() - connections_before}")
+    extra = {"channels": channels or [settings.CHANNEL_NAME],
+             "rate": ratelimit.default_controller().snapshot()}
+    if snapshot:
+        extra["progress"] = snapshot
+    summary_path = run_summary.save(args.metrics_json, extra=extra)
+    if summary_path:
+        print(f"Metrics summary saved to {summary_path}")
 
 if __name__ == '__main__':
-    with client:
-        client.loop.run_until_complete(main())
+    args = parse_args()
+    try:
+        with client:
+            client.loop.run_until_complete(main(args))
+    finally:
+        db.close_client()
@@ -0,0 +1,71 @@
+"""
+Punto de Entrada de la Exportación de Canales.
+
+Exporta las colecciones de canal ya archivadas a JSONL comprimido o Parquet, con el
+manifiesto de sus archivos multimedia (ver `export.py`); no necesita conexión con Telegram.
+
+    python main_export.py --channel mi_canal
+    python main_export.py --all --format parquet --concurrency 4
+    python main_export.py --all --incremental            # solo lo nuevo desde la anterior
+    python main_export.py --channel mi_canal --since-date 2024-01-01 --output /tmp/entrega
+"""
+import argparse
+
+import db
+import engine
+import export
+import settings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export archived Telegram channels to files.")
+    parser.add_argument("--channel", action="append", metavar="NAME",
+                        help="channel to export (repeatable; default: CHANNEL_NAME)")
+    parser.add_argument("--all", action="store_true", help="export every archived channel")
+    parser.add_argument("--format", choices=export.EXPORT_FORMATS, default="jsonl",
+                        help="gzip-compressed JSON Lines or Parquet (needs pyarrow)")
+    parser.add_argument("--output", metavar="DIR", default=None,
+                        help=f"output directory (default: {settings.EXPORT_DIR})")
+    parser.add_argument("--since-id", type=int, metavar="ID",
+                        help="only messages with an ID greater than ID")
+    parser.add_argument("--since-date", metavar="DATE",
+                        help="only messages on or after DATE (YYYY-MM-DD)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="continue from the last ID of the previous export of each channel")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help=f"messages per file (default: {settings.EXPORT_CHUNK_SIZE})")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help=f"channels exported at once (default: {settings.EXPORT_CONCURRENCY})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.all:
+        collections = db.list_channel_collections()
+    else:
+        names = args.channel or ([settings.CHANNEL_NAME] if settings.CHANNEL_NAME else [])
+        collections = [engine.collection_name_for(name) for name in names]
+    if not collections:
+        print("Error: no channel given (use --channel, --all or set CHANNEL_NAME)")
+        return
+
+    try:
+        results = export.export_channels(
+            collections, concurrency=args.concurrency, output_dir=args.output, fmt=args.format,
+            after_id=args.since_id, since_date=args.since_date, incremental=args.incremental,
+            chunk_size=args.chunk_size,
+        )
+    finally:
+        db.close_client()
+
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"  {name}: failed ({result})")
+        else:
+            print(f"  {name}: {result['messages']} messages, {result['media']} media, "
+                  f"{len(result['chunks'])} files")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,19 @@
 import sys
-import asyncio
 from PySide6.QtWidgets import QApplication
-from qasync import QEventLoop
 from gui import MainWindow
-import settings
+import db
 
 def main():
     app = QApplication(sys.argv)
-    
-    # We use qasync to integrate asyncio with Qt's event loop
-    loop = QEventLoop(app)
-    asyncio.set_event_loop(loop)
-    
+
+    # El bucle de Qt solo atiende la interfaz: la sincronización corre en su propio
+    # hilo con un bucle asyncio (ver worker.EngineThread)
     window = MainWindow()
     window.show()
-    
-    with loop:
-        loop.run_forever()
+
+    app.exec()
+
+    db.close_client()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,120 @@
+"""
+Punto de Entrada de la Búsqueda Local.
+
+Busca en los mensajes ya archivados en MongoDB usando los índices de cada colección de
+canal (ver `search.py`); no necesita conexión con Telegram. Los resultados se imprimen
+página a página según llegan, de más nuevo a más viejo.
+
+    python main_search.py "palabra" --channel mi_canal
+    python main_search.py --all --media photo --since 2024-01-01 --pages 0
+    python main_search.py --build-indexes --all
+    python main_search.py --migrate --all
+
+Las colecciones archivadas antes de STORAGE_SCHEMA guardan el `to_dict()` tal cual, sin los
+campos que usan los filtros; `--migrate` las reescribe (ver `db.migrate_legacy_documents`).
+"""
+import argparse
+import time
+
+import db
+import engine
+import search
+import settings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Search the archived Telegram messages.")
+    parser.add_argument("text", nargs="?",
+                        help='words to search ("exact phrase", -excluded) in the text index')
+    parser.add_argument("--channel", action="append", metavar="NAME",
+                        help="channel to search (repeatable; default: CHANNEL_NAME)")
+    parser.add_argument("--all", action="store_true", help="search every archived channel")
+    parser.add_argument("--sender", type=int, metavar="ID", help="only messages from this sender")
+    parser.add_argument("--media", metavar="KIND",
+                        help="only messages with this media kind (photo, video, document...)")
+    parser.add_argument("--grouped-id", type=int, metavar="ID", help="only this album")
+    parser.add_argument("--since", metavar="DATE", help="messages on or after DATE (YYYY-MM-DD)")
+    parser.add_argument("--until", metavar="DATE", help="messages before DATE (YYYY-MM-DD)")
+    parser.add_argument("--before-id", type=int, metavar="ID",
+                        help="continue a previous search from this message ID")
+    parser.add_argument("--page-size", type=int, default=None,
+                        help=f"results per page (default: {settings.SEARCH_PAGE_SIZE})")
+    parser.add_argument("--pages", type=int, default=1,
+                        help="pages to show per channel (0 = all)")
+    parser.add_argument("--build-indexes", action="store_true",
+                        help="create the search indexes of the channels and exit")
+    parser.add_argument("--migrate", action="store_true",
+                        help="rewrite messages stored in the old format (before STORAGE_SCHEMA) "
+                             "so the text, sender and media filters find them, and exit")
+    return parser.parse_args(argv)
+
+
+def channels_for(args):
+    if args.all:
+        return db.list_channel_collections()
+    names = args.channel or ([settings.CHANNEL_NAME] if settings.CHANNEL_NAME else [])
+    return [engine.collection_name_for(name) for name in names]
+
+
+def build_indexes(collections):
+    for name in collections:
+        started = time.perf_counter()
+        db.ensure_search_indexes(name, log=print)
+        print(f"{name}: indexes ready ({time.perf_counter() - started:.1f}s)")
+
+
+def migrate(collections):
+    for name in collections:
+        started = time.perf_counter()
+        migrated = db.migrate_legacy_documents(name)
+        print(f"{name}: {migrated} documents migrated ({time.perf_counter() - started:.1f}s)")
+
+
+def run_search(collections, args):
+    criteria = {
+        "text": args.text,
+        "sender_id": args.sender,
+        "media_kind": args.media,
+        "grouped_id": args.grouped_id,
+        "since": args.since,
+        "until": args.until,
+    }
+    for name in collections:
+        print(f"--- {name} ---")
+        warning = search.legacy_warning(name)
+        if warning:
+            print(f"Warning: {warning}")
+        shown = 0
+        pages = search.iter_pages(name, page_size=args.page_size, before_id=args.before_id,
+                                  log=print, **criteria)
+        for number, page in enumerate(pages, start=1):
+            for doc in page.results:
+                print(search.format_result(doc))
+            shown += len(page.results)
+            print(f"({shown} results, page {number} in {page.elapsed * 1000:.0f} ms)")
+            if page.next_before_id is None:
+                break
+            if args.pages and number >= args.pages:
+                print(f"More results: --before-id {page.next_before_id}")
+                break
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    collections = channels_for(args)
+    if not collections:
+        print("Error: no channel given (use --channel, --all or set CHANNEL_NAME)")
+        return
+    try:
+        if args.migrate:
+            migrate(collections)
+        elif args.build_indexes:
+            build_indexes(collections)
+        else:
+            run_search(collections, args)
+    finally:
+        db.close_client()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Módulo de Almacén de Multimedia Deduplicado.
+
+Un mismo archivo reenviado a varios canales (o reposteado en el mismo) tiene la misma
+identidad en Telegram (`photo.id` / `document.id`). `MediaStore` guarda cada archivo una
+sola vez en un almacén direccionado por contenido (`MEDIA_STORE_DIR/ab/cd/<sha256><ext>`)
+y mantiene un índice en MongoDB (colección `MEDIA_INDEX_COLLECTION`) con dos tipos de clave:
+
+- `photo:<id>` / `document:<id>`: se consulta ANTES de descargar; si hay acierto no se
+  transfiere nada.
+- `sha256:<hash>`: respaldo para contenidos idénticos con distinta identidad en Telegram;
+  se consulta tras la descarga y, si hay acierto, se descarta la copia nueva.
+
+Las consultas y escrituras del índice se hacen con `db.run`, fuera del bucle asyncio.
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+
+import db
+import settings
+
+
+def media_identity(message):
+    """Clave de identidad de Telegram del multimedia de un mensaje, o None si no tiene."""
+    if message.photo is not None:
+        return f"photo:{message.photo.id}"
+    if message.document is not None:
+        return f"document:{message.document.id}"
+    return None
+
+
+def file_sha256(path):
+    """Hash SHA-256 de un archivo, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """
+    Almacén de blobs compartido por todos los canales.
+
+    Atributos:
+        root (str): Carpeta raíz del almacén.
+        log (callable): Función que recibe los mensajes de registro.
+    """
+    def __init__(self, root=None, log=print):
+        self.root = os.path.abspath(root or settings.MEDIA_STORE_DIR)
+        self.log = log
+        # Descargas en curso por identidad, para que dos mensajes con el mismo archivo
+        # en vuelo a la vez no lo descarguen dos veces
+        self._inflight = {}
+
+    def blob_path(self, relative_path):
+        return os.path.join(self.root, relative_path)
+
+    def lookup(self, key):
+        """Ruta absoluta del blob indexado con `key` si existe en disco, o None."""
+        if key is None:
+            return None
+        entry = db.find_media(key)
+        if entry:
+            path = self.blob_path(entry["path"])
+            if os.path.exists(path):
+                return path
+        return None
+
+    async def fetch(self, message, download, log=None):
+        """
+        Devuelve la ruta absoluta del blob para el multimedia de `message`.
+
+        `download` es una corrutina sin argumentos que descarga el archivo a una ruta
+        temporal y la devuelve; solo se llama si el índice no tiene ya el archivo.
+        """
+        log = log or self.log
+        key = media_identity(message)
+        path = await db.run(self.lookup, key)
+        if path:
+            log(f"Media for message {message.id} already in store ({key}), skipping download.")
+            return path
+
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._inflight[key] = future
+        try:
+            downloaded = await download()
+            path = await self._store(key, downloaded, log) if downloaded else None
+            future.set_result(path)
+            return path
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evitar el aviso de "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _store(self, key, downloaded, log):
+        """Mueve un archivo recién descargado al almacén (o lo descarta si ya existía)."""
+        sha256 = await asyncio.to_thread(file_sha256, downloaded)
+        size = os.path.getsize(downloaded)
+
+        existing = await db.run(self.lookup, f"sha256:{sha256}")
+        if existing:
+            os.remove(downloaded)
+            path = existing
+            log(f"Identical content already in store, reusing {path}")
+        else:
+            ext = os.path.splitext(downloaded)[1].lower()
+            relative = os.path.join(sha256[:2], sha256[2:4], sha256 + ext)
+            path = self.blob_path(relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Con MEDIA_STORE_DIR en otro sistema de archivos, mover es copiar el archivo
+            # entero: fuera del bucle, como el hash
+            await asyncio.to_thread(shutil.move, downloaded, path)
+
+        keys = [f"sha256:{sha256}"] + ([key] if key else [])
+        await db.run(db.register_media, keys, os.path.relpath(path, self.root), size, sha256)
+
+        # La carpeta temporal del mensaje ya no hace falta si quedó vacía
+        try:
+            os.rmdir(os.path.dirname(downloaded))
+        except OSError:
+            pass
+        return path
+
+
+_default_store = None
+
+
+def default_store():
+    """Almacén compartido por todos los pipelines del proceso."""
+    global _default_store
+    if _default_store is None:
+        _default_store = MediaStore()
+    return _default_store
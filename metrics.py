@@ -0,0 +1,293 @@
+"""
+Módulo de Métricas.
+
+Contadores e histogramas del proceso, con la etiqueta `channel` (la colección del canal),
+que actualizan las distintas etapas de la sincronización:
+
+- `ratelimit.iter_messages`: mensajes recibidos del historial.
+- `downloader`: archivos y bytes descargados, y latencia de cada descarga.
+- `writer`: mensajes insertados, duplicados y fallidos, y latencia de cada escritura.
+- `ratelimit.RateController`: FloodWaits y segundos esperados por ellos.
+- `live`: mensajes recibidos en vivo y su latencia desde la publicación hasta la BD.
+
+Se pueden leer de tres formas:
+
+- `REGISTRY.render()`: formato de texto de Prometheus, servido por `serve()` en
+  `http://METRICS_HOST:METRICS_PORT/metrics` (y en JSON en `/metrics.json`).
+- `REGISTRY.to_dict()`: los valores actuales como diccionario.
+- `RunSummary`: lo que cambió durante una ejecución, guardado como JSON en METRICS_DIR.
+
+Los valores se acumulan durante toda la vida del proceso (como espera Prometheus), y se
+pueden actualizar desde cualquier hilo.
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import settings
+
+# Límites de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_key(labelnames, labels):
+    return tuple("" if labels.get(name) is None else str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Valor que solo crece (mensajes, bytes, segundos...) por combinación de etiquetas."""
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in sorted(self.samples().items())]
+
+
+class Histogram:
+    """Distribución de valores (latencias) en cubetas acumuladas, con su suma y recuento."""
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1),
+                                             "sum": 0.0, "count": 0}
+            state["counts"][bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            return {key: {"counts": list(state["counts"]), "sum": state["sum"],
+                          "count": state["count"]}
+                    for key, state in self._values.items()}
+
+    def render(self):
+        lines = []
+        for key, state in sorted(self.samples().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {"le": str(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {state['sum']}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas del proceso."""
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help, labelnames=("channel",)):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=("channel",), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """
+        {métrica: {canal: valor}}; en los histogramas el valor es {count, sum, buckets}.
+        Con más de una etiqueta la clave es 'valor1,valor2'.
+        """
+        result = {}
+        for metric in self.metrics.values():
+            values = {}
+            for key, sample in metric.samples().items():
+                if metric.type == "histogram":
+                    sample = {"count": sample["count"], "sum": sample["sum"],
+                              "buckets": dict(zip(map(str, metric.buckets + ("+Inf",)),
+                                                  sample["counts"]))}
+                values[",".join(key)] = sample
+            result[metric.name] = values
+        return result
+
+
+REGISTRY = Registry()
+
+MESSAGES_FETCHED = REGISTRY.counter(
+    "telegram_messages_fetched_total", "Messages received from the channel history.")
+MESSAGES_INSERTED = REGISTRY.counter(
+    "telegram_messages_inserted_total", "Messages inserted into MongoDB.")
+MESSAGES_DUPLICATE = REGISTRY.counter(
+    "telegram_messages_duplicate_total", "Messages skipped because they were already stored.")
+MESSAGES_FAILED = REGISTRY.counter(
+    "telegram_messages_failed_total", "Messages that could not be written.")
+FLUSH_SECONDS = REGISTRY.histogram(
+    "telegram_flush_seconds", "Latency of each batch write to MongoDB.")
+MEDIA_DOWNLOADED = REGISTRY.counter(
+    "telegram_media_downloaded_total", "Media files downloaded.")
+BYTES_DOWNLOADED = REGISTRY.counter(
+    "telegram_media_bytes_total", "Media bytes downloaded.")
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "telegram_media_download_seconds", "Latency of each media file transferred from Telegram.")
+FLOOD_WAITS = REGISTRY.counter(
+    "telegram_flood_waits_total", "FloodWait errors received.")
+FLOOD_WAIT_SECONDS = REGISTRY.counter(
+    "telegram_flood_wait_seconds_total", "Seconds requests spent waiting because of FloodWaits.")
+LIVE_MESSAGES = REGISTRY.counter(
+    "telegram_live_messages_total", "Messages received as live updates (daemon mode).")
+LIVE_LATENCY = REGISTRY.histogram(
+    "telegram_live_latency_seconds", "Time from a live message being posted to being stored.")
+
+
+class RunSummary:
+    """
+    Resumen de una ejecución: la diferencia de las métricas entre `RunSummary()` y
+    `finish()`, por métrica y canal.
+
+    Uso:
+        summary = RunSummary()
+        ...
+        path = summary.save(extra={"snapshot": scheduler_snapshot})
+    """
+    def __init__(self, registry=None):
+        self.registry = registry or REGISTRY
+        self.started_at = datetime.now(timezone.utc)
+        self._before = self.registry.to_dict()
+
+    def finish(self, extra=None):
+        after = self.registry.to_dict()
+        metrics = {}
+        for name, values in after.items():
+            before = self._before.get(name, {})
+            changed = {}
+            for key, value in values.items():
+                delta = _subtract(value, before.get(key))
+                if delta:
+                    changed[key] = delta
+            metrics[name] = changed
+        summary = {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "metrics": metrics,
+        }
+        if extra:
+            summary.update(extra)
+        return summary
+
+    def save(self, path=None, extra=None):
+        """
+        Guarda el resumen como JSON en `path` o, si no se indica, en
+        METRICS_DIR/run-<fecha>.json. Devuelve la ruta, o None si no hay dónde guardarlo.
+        """
+        if path is None:
+            if not settings.METRICS_DIR:
+                return None
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            path = os.path.join(settings.METRICS_DIR,
+                                f"run-{self.started_at:%Y%m%d-%H%M%S}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.finish(extra), f, indent=2, default=str)
+        return path
+
+
+def _subtract(after, before):
+    if isinstance(after, dict):
+        before = before or {"count": 0, "sum": 0.0, "buckets": {}}
+        if after["count"] == before["count"]:
+            return None
+        return {
+            "count": after["count"] - before["count"],
+            "sum": after["sum"] - before["sum"],
+            "buckets": {bound: count - before["buckets"].get(bound, 0)
+                        for bound, count in after["buckets"].items()},
+        }
+    return (after - (before or 0)) or None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path in ("/", "/metrics"):
+            body = REGISTRY.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(REGISTRY.to_dict()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sin una línea por petición en la consola
+        pass
+
+
+_server = None
+
+
+def serve(port=None, host=None, log=print):
+    """
+    Sirve las métricas por HTTP en un hilo propio (una sola vez por proceso). Sin puerto
+    (METRICS_PORT=0) no hace nada. Devuelve el servidor o None.
+    """
+    global _server
+    port = settings.METRICS_PORT if port is None else port
+    if not port or _server is not None:
+        return _server
+    host = host or settings.METRICS_HOST
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    log(f"Serving metrics on http://{host}:{port}/metrics")
+    return _server
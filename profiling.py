@@ -0,0 +1,155 @@
+"""
+Módulo de Perfilado de una Sincronización.
+
+`SyncProfiler` es un modo opcional (`main.py --profile`, `benchmarks/sync.py --profile`)
+que, durante una sola sincronización, recoge:
+
+- Un perfil de cProfile del hilo del bucle de eventos, guardado como `.pstats`
+  (`python -m pstats archivo`, snakeviz...). Las escrituras en MongoDB corren en el pool de
+  hilos de `db.run` y no aparecen en él: su latencia está en `metrics.FLUSH_SECONDS`.
+- Los tiempos de las tareas asyncio, agrupadas por corrutina (`Clase.metodo`): cuántas
+  tareas hubo, cuánto tiempo ocuparon el bucle entre dos `await` (tiempo propio, que es lo
+  que frena a las demás) y su paso más largo. Se guardan como JSON.
+
+Uso:
+    profiler = SyncProfiler()
+    await profiler.run(engine.sync_channel(client, canal))
+    profiler.save(log=print)
+"""
+import asyncio
+import cProfile
+import collections.abc
+import io
+import json
+import os
+import pstats
+import time
+from datetime import datetime
+
+import settings
+
+
+class TaskStats:
+    """Tiempos acumulados de las tareas de una misma corrutina."""
+    def __init__(self):
+        self.tasks = 0
+        self.steps = 0
+        self.busy = 0.0
+        self.max_step = 0.0
+        self.wall = 0.0
+
+    def to_dict(self):
+        return {"tasks": self.tasks, "steps": self.steps, "busy_seconds": self.busy,
+                "max_step_seconds": self.max_step, "wall_seconds": self.wall}
+
+
+class _TimedCoroutine(collections.abc.Coroutine):
+    """Envuelve una corrutina y cronometra cada paso que da en el bucle."""
+    def __init__(self, coro, stats):
+        self._coro = coro
+        self._stats = stats
+        self._started = time.perf_counter()
+
+    def _step(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        except BaseException:
+            # Fin de la corrutina (StopIteration incluido) o error: se cierra su tiempo total
+            self._stats.wall += time.perf_counter() - self._started
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stats.steps += 1
+            self._stats.busy += elapsed
+            self._stats.max_step = max(self._stats.max_step, elapsed)
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+
+def _coroutine_name(coro):
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+class SyncProfiler:
+    """
+    Perfil de cProfile y tiempos de tareas asyncio de una sincronización.
+
+    Atributos:
+        output_dir (str): Carpeta donde `save()` deja los resultados (PROFILE_DIR).
+        tasks (dict): {corrutina: TaskStats}.
+        elapsed (float): Segundos que duró `run()`.
+    """
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir or settings.PROFILE_DIR
+        self.tasks = {}
+        self.elapsed = 0.0
+        self.started_at = datetime.now()
+        self._profile = cProfile.Profile()
+
+    def _task_factory(self, loop, coro, **kwargs):
+        stats = self.tasks.get(_coroutine_name(coro))
+        if stats is None:
+            stats = self.tasks[_coroutine_name(coro)] = TaskStats()
+        stats.tasks += 1
+        return asyncio.Task(_TimedCoroutine(coro, stats), loop=loop, **kwargs)
+
+    async def run(self, coro):
+        """
+        Ejecuta `coro` como una tarea propia con el perfilado activo y devuelve su
+        resultado. Solo se perfilan las tareas creadas mientras dura.
+        """
+        loop = asyncio.get_running_loop()
+        previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        started = time.perf_counter()
+        self._profile.enable()
+        try:
+            return await loop.create_task(coro)
+        finally:
+            self._profile.disable()
+            self.elapsed = time.perf_counter() - started
+            loop.set_task_factory(previous_factory)
+
+    def task_report(self):
+        """Tiempos por corrutina, de mayor a menor tiempo propio en el bucle."""
+        return {name: stats.to_dict() for name, stats in
+                sorted(self.tasks.items(), key=lambda item: item[1].busy, reverse=True)}
+
+    def top_functions(self, limit=20, sort="cumulative"):
+        """Las `limit` funciones más costosas del perfil, como texto de pstats."""
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def save(self, log=print):
+        """
+        Guarda el perfil (`profile-<fecha>.pstats`) y los tiempos de las tareas
+        (`tasks-<fecha>.json`) en `output_dir`, y resume lo más costoso en `log`.
+        Devuelve las dos rutas.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = f"{self.started_at:%Y%m%d-%H%M%S}"
+        profile_path = os.path.join(self.output_dir, f"profile-{stamp}.pstats")
+        tasks_path = os.path.join(self.output_dir, f"tasks-{stamp}.json")
+        self._profile.dump_stats(profile_path)
+        report = self.task_report()
+        with open(tasks_path, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_seconds": self.elapsed, "tasks": report}, f, indent=2)
+
+        log(f"Profiled {self.elapsed:.2f}s. Event loop time by coroutine:")
+        for name, stats in list(report.items())[:10]:
+            log(f"  {name}: {stats['tasks']} tasks, {stats['busy_seconds']:.3f}s busy, "
+                f"longest step {stats['max_step_seconds'] * 1000:.1f} ms")
+        log(f"Profile saved to {profile_path}, task timings to {tasks_path}")
+        return profile_path, tasks_path
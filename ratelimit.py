@@ -0,0 +1,179 @@
+"""
+Módulo de Control de Ritmo ante FloodWait.
+
+Telegram limita el número de peticiones por cuenta y, cuando se supera, responde con
+un `FloodWaitError` que indica cuántos segundos hay que esperar. `RateController` es un
+controlador compartido por el bucle del historial y los workers de descarga que:
+
+- Espacia las peticiones según un ritmo (peticiones/segundo) que aprende: sube poco a poco
+  mientras no hay errores y se reduce a la mitad con cada FloodWait (AIMD).
+- Ante un FloodWait pausa TODAS las peticiones exactamente los segundos que pide Telegram
+  y después reintenta la llamada que falló, sin perder la posición.
+- Expone el ritmo actual y el tiempo de espera como métricas (`snapshot()`), y cuenta los
+  FloodWaits y los segundos esperados de cada canal en `metrics`.
+
+Para que los FloodWait lleguen al controlador en lugar de dormirse dentro de Telethon,
+`attach()` pone el `flood_sleep_threshold` del cliente a 0 (se llama tras iniciar sesión).
+"""
+import asyncio
+import time
+
+from telethon.errors import FloodPremiumWaitError, FloodWaitError
+
+import metrics
+import settings
+
+FLOOD_ERRORS = (FloodWaitError, FloodPremiumWaitError)
+
+
+class RateController:
+    """
+    Controlador de ritmo compartido.
+
+    Atributos:
+        rate (float): Ritmo actual permitido, en peticiones por segundo.
+        min_rate (float), max_rate (float): Límites del ritmo.
+        increase (float): Peticiones/segundo que se ganan por cada segundo sin FloodWait.
+        requests (int): Peticiones realizadas.
+        flood_waits (int): FloodWaits recibidos.
+        flood_wait_seconds (float): Segundos totales esperados por FloodWait.
+    """
+    def __init__(self, rate=None, min_rate=None, max_rate=None, increase=None, log=print):
+        self.rate = rate or settings.RATE_INITIAL
+        self.min_rate = min_rate or settings.RATE_MIN
+        self.max_rate = max_rate or settings.RATE_MAX
+        self.increase = increase or settings.RATE_INCREASE
+        self.log = log
+        self.requests = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self._next_slot = 0.0
+        self._resume_at = 0.0
+
+    @property
+    def wait_remaining(self):
+        """Segundos que quedan de la pausa por FloodWait en curso (0 si no hay)."""
+        return max(0.0, self._resume_at - time.monotonic())
+
+    async def acquire(self):
+        """Espera al turno de la siguiente petición (y al final de cualquier FloodWait)."""
+        while True:
+            now = time.monotonic()
+            if now < self._resume_at:
+                await asyncio.sleep(self._resume_at - now)
+                continue
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # Si mientras esperábamos llegó un FloodWait, volver a esperar
+            if time.monotonic() >= self._resume_at:
+                break
+        self.requests += 1
+
+    def success(self):
+        """Registra una petición correcta: el ritmo sube ~`increase` por segundo."""
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    async def flood_wait(self, seconds, log=None, channel=None):
+        """
+        Registra un FloodWait de `seconds`: reduce el ritmo a la mitad y pausa todas las
+        peticiones hasta que pase ese tiempo. Vuelve cuando se puede reintentar.
+        `channel` es la colección a la que se atribuye la espera en las métricas.
+        """
+        log = log or self.log
+        started = time.monotonic()
+        resume_at = started + seconds
+        self.flood_waits += 1
+        metrics.FLOOD_WAITS.inc(channel=channel)
+        # Varias peticiones pueden recibir el mismo FloodWait: solo cuenta la espera nueva
+        self.flood_wait_seconds += max(0.0, resume_at - max(self._resume_at, time.monotonic()))
+        if resume_at > self._resume_at:
+            # Solo un FloodWait recibido fuera de una pausa reduce el ritmo: los de las
+            # peticiones que estaban en vuelo a la vez son el mismo aviso
+            if started >= self._resume_at:
+                self.rate = max(self.min_rate, self.rate / 2)
+                log(f"FloodWait: sleeping {seconds}s, request rate lowered to {self.rate:.2f}/s")
+            self._resume_at = resume_at
+        try:
+            await asyncio.sleep(self.wait_remaining)
+        finally:
+            metrics.FLOOD_WAIT_SECONDS.inc(time.monotonic() - started, channel=channel)
+
+    async def call(self, func, *args, log=None, channel=None, **kwargs):
+        """Ejecuta `await func(*args, **kwargs)` respetando el ritmo y reintentando tras FloodWait."""
+        while True:
+            await self.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            except FLOOD_ERRORS as e:
+                await self.flood_wait(e.seconds, log=log, channel=channel)
+            else:
+                self.success()
+                return result
+
+    def snapshot(self):
+        return {
+            "rate": self.rate,
+            "requests": self.requests,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "wait_remaining": self.wait_remaining,
+        }
+
+
+def format_rate(snapshot):
+    """Resumen de una línea de las métricas del controlador."""
+    line = (f"{snapshot['rate']:.2f} req/s, {snapshot['flood_waits']} flood waits "
+            f"({snapshot['flood_wait_seconds']:.0f}s)")
+    if snapshot["wait_remaining"]:
+        line += f", waiting {snapshot['wait_remaining']:.0f}s"
+    return line
+
+
+async def iter_messages(client, entity, min_id=0, max_id=0, controller=None, log=None, tuner=None,
+                        channel=None):
+    """
+    Recorre los mensajes de `entity` de viejo a nuevo con `min_id < id < max_id`
+    (`max_id=0` sin límite), pidiendo una página con `client.get_messages` por petición.
+
+    Cada página pasa por el controlador de ritmo; ante un FloodWait se espera lo indicado
+    y se repite la misma página, sin perder la posición. El tamaño de página y la pausa
+    entre páginas salen de `tuner` (un `tuning.SyncTuner`) o de la configuración.
+    Los mensajes recibidos y los FloodWaits se cuentan en `metrics` bajo `channel`.
+    """
+    controller = controller or default_controller()
+    while True:
+        page_size = tuner.page_size if tuner else settings.HISTORY_PAGE_SIZE
+        page = await controller.call(
+            client.get_messages, entity, limit=page_size, min_id=min_id, max_id=max_id,
+            reverse=True, log=log, channel=channel,
+        )
+        metrics.MESSAGES_FETCHED.inc(len(page), channel=channel)
+        if tuner:
+            tuner.record_page(len(page))
+        for message in page:
+            min_id = message.id
+            yield message
+        # Como Telethon: una página incompleta es el final del historial
+        if len(page) < page_size:
+            return
+        page_delay = tuner.page_delay if tuner else settings.HISTORY_PAGE_DELAY
+        if page_delay:
+            await asyncio.sleep(page_delay)
+
+
+def attach(client):
+    """Hace que los FloodWait del cliente se propaguen al controlador en vez de dormirse."""
+    client.flood_sleep_threshold = 0
+
+
+_default_controller = None
+
+
+def default_controller():
+    """Controlador compartido por todo el proceso (historial y descargas)."""
+    global _default_controller
+    if _default_controller is None:
+        _default_controller = RateController()
+    return _default_controller
@@ -0,0 +1,199 @@
+"""
+Módulo de Planificación de Sincronizaciones Multi-Canal.
+
+Este módulo permite sincronizar varios canales a la vez sobre un único cliente de Telethon.
+`ChannelSyncScheduler` lanza una tarea por canal limitando cuántas se ejecutan en paralelo,
+mantiene el progreso de cada canal (`ChannelProgress`) y calcula el rendimiento agregado.
+Lo usan tanto la CLI (`main.py --all`) como el botón "Sync All" de la GUI.
+"""
+import asyncio
+import os
+import time
+
+import ratelimit
+import settings
+
+
+def read_channel_file(file_path=None):
+    """
+    Lee la lista de canales de un archivo de texto (uno por línea).
+    Ignora las líneas vacías y las que empiezan por '#'.
+    Devuelve una lista vacía si el archivo no existe.
+    """
+    file_path = file_path or settings.CHANNELS_FILE
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+class ChannelProgress:
+    """
+    Progreso de la sincronización de un canal.
+
+    Atributos:
+        channel (str): Nombre del canal.
+        state (str): 'pending', 'running', 'done', 'failed' o 'stopped'.
+        messages (int): Mensajes guardados hasta ahora.
+        media (int): Archivos multimedia descargados hasta ahora.
+        bytes (int): Bytes de multimedia transferidos hasta ahora.
+        error (str): Último error, si lo hubo.
+    """
+    def __init__(self, channel, on_change=None):
+        self.channel = channel
+        self.state = "pending"
+        self.messages = 0
+        self.media = 0
+        self.bytes = 0
+        self.error = None
+        self._gauges = None
+        self.started_at = None
+        self.finished_at = None
+        self._on_change = on_change
+
+    def add(self, messages=0, media=0, bytes=0):
+        self.messages += messages
+        self.media += media
+        self.bytes += bytes
+        self._changed()
+
+    def watch(self, gauges):
+        """
+        Registra un callable que devuelve las profundidades de cola actuales del canal
+        (`download_queue`, `pending_flushes`); se lee en cada `to_dict()`.
+        """
+        self._gauges = gauges
+
+    def set_state(self, state, error=None):
+        self.state = state
+        if state == "running":
+            self.started_at = time.monotonic()
+        elif state in ("done", "failed", "stopped"):
+            self.finished_at = time.monotonic()
+            self._gauges = None
+        if error is not None:
+            self.error = str(error)
+        self._changed()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def messages_per_sec(self):
+        elapsed = self.elapsed
+        return self.messages / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def mb_per_sec(self):
+        elapsed = self.elapsed
+        return self.bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        gauges = self._gauges() if self._gauges else {}
+        return {
+            "channel": self.channel,
+            "state": self.state,
+            "messages": self.messages,
+            "media": self.media,
+            "bytes": self.bytes,
+            "messages_per_sec": self.messages_per_sec,
+            "mb_per_sec": self.mb_per_sec,
+            "download_queue": gauges.get("download_queue", 0),
+            "pending_flushes": gauges.get("pending_flushes", 0),
+            "elapsed": self.elapsed,
+            "error": self.error,
+        }
+
+    def _changed(self):
+        if self._on_change:
+            self._on_change(self)
+
+
+class ChannelSyncScheduler:
+    """
+    Ejecuta la sincronización de varios canales en paralelo con un límite de concurrencia.
+
+    `sync_channel` es una corrutina `sync_channel(channel_name, progress)` que sincroniza
+    un canal y va actualizando `progress` (un `ChannelProgress`). Todos los canales comparten
+    el cliente de Telegram que use esa corrutina.
+
+    Atributos:
+        concurrency (int): Número máximo de canales sincronizándose a la vez.
+        on_progress (callable): Se llama con un `snapshot()` cada vez que cambia el progreso.
+    """
+    def __init__(self, sync_channel, concurrency=None, on_progress=None):
+        self.sync_channel = sync_channel
+        self.concurrency = concurrency or settings.SYNC_CONCURRENCY
+        self.on_progress = on_progress
+        self.channels = {}
+        self._stopped = False
+        self._started_at = None
+
+    async def run(self, channel_names):
+        """
+        Sincroniza todos los canales indicados y devuelve el último `snapshot()`.
+        Los fallos de un canal se registran en su progreso y no detienen al resto.
+        """
+        self._stopped = False
+        self._started_at = time.monotonic()
+        self.channels = {
+            name: ChannelProgress(name, on_change=self._notify) for name in channel_names
+        }
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(progress):
+            async with semaphore:
+                if self._stopped:
+                    progress.set_state("stopped")
+                    return
+                progress.set_state("running")
+                try:
+                    await self.sync_channel(progress.channel, progress)
+                except Exception as e:
+                    progress.set_state("failed", error=e)
+                else:
+                    progress.set_state("stopped" if self._stopped else "done")
+
+        await asyncio.gather(*(run_one(p) for p in self.channels.values()))
+        return self.snapshot()
+
+    def stop(self):
+        """Evita que arranquen los canales pendientes. Los que ya corren deben pararse aparte."""
+        self._stopped = True
+
+    def snapshot(self):
+        """Estado de todos los canales más el rendimiento agregado."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        total_messages = sum(p.messages for p in self.channels.values())
+        total_media = sum(p.media for p in self.channels.values())
+        total_bytes = sum(p.bytes for p in self.channels.values())
+        finished = sum(1 for p in self.channels.values() if p.state in ("done", "failed", "stopped"))
+        return {
+            "channels": [p.to_dict() for p in self.channels.values()],
+            "finished": finished,
+            "total": len(self.channels),
+            "messages": total_messages,
+            "media": total_media,
+            "bytes": total_bytes,
+            "elapsed": elapsed,
+            "messages_per_sec": total_messages / elapsed if elapsed > 0 else 0.0,
+            "mb_per_sec": total_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+            "rate_limit": ratelimit.default_controller().snapshot(),
+        }
+
+    def _notify(self, progress):
+        if self.on_progress:
+            self.on_progress(self.snapshot())
+
+
+def format_summary(snapshot):
+    """Resumen de una línea del rendimiento agregado, para logs y barras de estado."""
+    return (
+        f"{snapshot['finished']}/{snapshot['total']} channels done | "
+        f"{snapshot['messages']} messages, {snapshot['media']} media | "
+        f"{snapshot['messages_per_sec']:.1f} msg/s, {snapshot['mb_per_sec']:.2f} MB/s | "
+        f"{ratelimit.format_rate(snapshot['rate_limit'])}"
+    )
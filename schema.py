@@ -0,0 +1,214 @@
+"""
+Módulo de Esquema de Almacenamiento.
+
+Define qué documento se guarda en MongoDB por cada mensaje. Hay dos modos (STORAGE_SCHEMA):
+
+- `compact` (por defecto): proyección plana con solo los campos que se consultan
+  (id, fecha, texto, vistas, reenvíos, respuesta, remitente, álbum y tipo/tamaño/ruta
+  del multimedia). Sin los árboles de tipos de Telethon con sus etiquetas `_`.
+- `raw`: el `message.to_dict()` completo codificado en BSON y comprimido con zlib en un
+  único campo binario `raw`, junto a los pocos campos que necesita la sincronización.
+  `decode_raw()` recupera el diccionario original.
+
+En ambos modos el pipeline de descargas añade `saved_media_path` al documento.
+
+Las colecciones archivadas antes de STORAGE_SCHEMA guardan el `to_dict()` tal cual (con su
+etiqueta `_`). `compact_fields()` lee los campos compactos de un documento de cualquiera de
+los tres formatos, y `upgrade_legacy()` reescribe un documento antiguo sin perder nada
+(ver `db.migrate_legacy_documents`).
+"""
+import zlib
+
+import bson
+from bson.binary import Binary
+
+import settings
+
+STORAGE_SCHEMAS = ("compact", "raw")
+
+# Valores de `media_kind` (además de 'other'). El orden importa: un GIF o un sticker
+# animado también es un documento de vídeo
+MEDIA_KINDS = ("photo", "sticker", "gif", "video_note", "video", "voice", "audio",
+               "document", "web_preview", "poll", "geo", "contact", "dice")
+
+
+def media_kind(message):
+    """Tipo de multimedia de un mensaje ('photo', 'video', 'sticker'...) o None."""
+    if not message.media:
+        return None
+    for kind in MEDIA_KINDS:
+        if getattr(message, kind, None) is not None:
+            return kind
+    return "other"
+
+
+def compact_document(message):
+    """Proyección plana de los campos consultables de un mensaje."""
+    reply_to = message.reply_to
+    return {
+        "id": message.id,
+        "date": message.date,
+        "text": message.message,
+        "sender_id": message.sender_id,
+        "views": message.views,
+        "forwards": message.forwards,
+        "reply_to": getattr(reply_to, "reply_to_msg_id", None),
+        "grouped_id": message.grouped_id,
+        "media_kind": media_kind(message),
+        "media_size": message.file.size if message.file else None,
+    }
+
+
+def raw_document(message, level=None):
+    """Documento con el `to_dict()` completo comprimido en el campo binario `raw`."""
+    level = settings.RAW_COMPRESSION_LEVEL if level is None else level
+    return {
+        "id": message.id,
+        "date": message.date,
+        "grouped_id": message.grouped_id,
+        "raw": Binary(zlib.compress(bson.encode(message.to_dict()), level)),
+    }
+
+
+def decode_raw(document):
+    """Devuelve el `to_dict()` original guardado en un documento en modo `raw`."""
+    return bson.decode(zlib.decompress(document["raw"]))
+
+
+def _peer_id(peer):
+    """ID marcado (como `telethon.utils.get_peer_id`) de un Peer serializado con to_dict()."""
+    kind = (peer or {}).get("_")
+    if kind == "PeerUser":
+        return peer["user_id"]
+    if kind == "PeerChat":
+        return -peer["chat_id"]
+    if kind == "PeerChannel":
+        return -(1000000000000 + peer["channel_id"])
+    return None
+
+
+def _sender_id(data):
+    # Como Message.sender_id: from_id o, en publicaciones de canal y chats privados
+    # recibidos, el propio chat
+    sender = _peer_id(data.get("from_id"))
+    peer = data.get("peer_id") or {}
+    if sender is None and (data.get("post") or (not data.get("out") and peer.get("_") == "PeerUser")):
+        sender = _peer_id(peer)
+    return sender
+
+
+def _media_parts(media):
+    """(documento, foto) de un multimedia serializado, incluida la vista previa web."""
+    media = media or {}
+    webpage = media.get("webpage") or {}
+    if media.get("_") == "MessageMediaWebPage" and webpage.get("_") == "WebPage":
+        document, photo = webpage.get("document"), webpage.get("photo")
+    else:
+        document, photo = media.get("document"), media.get("photo")
+    document = document if (document or {}).get("_") == "Document" else None
+    photo = photo if (photo or {}).get("_") == "Photo" else None
+    return document, photo
+
+
+def _dict_media_kind(media):
+    """`media_kind` a partir del multimedia serializado, con las mismas reglas que Telethon."""
+    if not media:
+        return None
+    kind = media.get("_")
+    document, photo = _media_parts(media)
+    attributes = {}
+    for attribute in (document or {}).get("attributes") or []:
+        attributes.setdefault(attribute.get("_"), attribute)
+    video = attributes.get("DocumentAttributeVideo")
+    audio = attributes.get("DocumentAttributeAudio")
+    checks = {
+        "photo": photo is not None,
+        "sticker": "DocumentAttributeSticker" in attributes,
+        "gif": "DocumentAttributeAnimated" in attributes,
+        "video_note": bool(video and video.get("round_message")),
+        "video": video is not None,
+        "voice": bool(audio and audio.get("voice")),
+        "audio": bool(audio and not audio.get("voice")),
+        "document": document is not None,
+        "web_preview": kind == "MessageMediaWebPage" and (media.get("webpage") or {}).get("_") == "WebPage",
+        "poll": kind == "MessageMediaPoll",
+        "geo": kind in ("MessageMediaGeo", "MessageMediaGeoLive", "MessageMediaVenue"),
+        "contact": kind == "MessageMediaContact",
+        "dice": kind == "MessageMediaDice",
+    }
+    return next((k for k in MEDIA_KINDS if checks[k]), "other")
+
+
+def _dict_media_size(media):
+    document, photo = _media_parts(media)
+    if document is not None:
+        return document.get("size")
+    if photo is not None:
+        # El tamaño más grande de la foto, como message.file.size
+        sizes = [max(size.get("sizes") or [0]) if "sizes" in size else size.get("size") or 0
+                 for size in photo.get("sizes") or []]
+        return max(sizes, default=None) or None
+    return None
+
+
+def compact_from_dict(data):
+    """Campos de `compact_document` a partir de un `message.to_dict()`."""
+    media = data.get("media")
+    return {
+        "id": data.get("id"),
+        "date": data.get("date"),
+        "text": data.get("message"),
+        "sender_id": _sender_id(data),
+        "views": data.get("views"),
+        "forwards": data.get("forwards"),
+        "reply_to": (data.get("reply_to") or {}).get("reply_to_msg_id"),
+        "grouped_id": data.get("grouped_id"),
+        "media_kind": _dict_media_kind(media),
+        "media_size": _dict_media_size(media),
+    }
+
+
+def is_legacy(document):
+    """Indica si es un documento de antes de STORAGE_SCHEMA (el `to_dict()` tal cual)."""
+    return "_" in document and "raw" not in document
+
+
+def compact_fields(document):
+    """
+    Campos compactos (y `saved_media_path`) de un documento guardado con cualquier esquema:
+    'compact', 'raw' o antiguo.
+    """
+    if "raw" in document and "text" not in document:
+        fields = compact_from_dict(decode_raw(document))
+    elif is_legacy(document):
+        fields = compact_from_dict(document)
+    else:
+        return document
+    fields["id"] = document["id"]
+    if "saved_media_path" in document:
+        fields["saved_media_path"] = document["saved_media_path"]
+    return fields
+
+
+def upgrade_legacy(document, level=None):
+    """
+    Reescribe un documento antiguo con los campos compactos y el `to_dict()` original
+    comprimido en `raw`, así que no se pierde nada. Conserva `saved_media_path`.
+    """
+    level = settings.RAW_COMPRESSION_LEVEL if level is None else level
+    data = {k: v for k, v in document.items() if k not in ("_id", "saved_media_path")}
+    upgraded = compact_from_dict(data)
+    upgraded["raw"] = Binary(zlib.compress(bson.encode(data), level))
+    if "saved_media_path" in document:
+        upgraded["saved_media_path"] = document["saved_media_path"]
+    return upgraded
+
+
+def message_document(message, schema=None):
+    """Documento a guardar para `message` según el esquema indicado (o STORAGE_SCHEMA)."""
+    schema = schema or settings.STORAGE_SCHEMA
+    if schema == "compact":
+        return compact_document(message)
+    if schema == "raw":
+        return raw_document(message)
+    raise ValueError(f"Unknown storage schema '{schema}', expected one of {STORAGE_SCHEMAS}")
@@ -0,0 +1,143 @@
+"""
+Módulo de Búsqueda Local.
+
+Consulta los mensajes ya archivados en MongoDB sin recorrer la colección entera. Cada
+colección de canal tiene (ver `db.ensure_search_indexes`) índices sobre `date`, `sender_id`,
+`media_kind` y `grouped_id` y un índice de texto sobre `text`. Se crean la primera vez que
+se busca en la colección (o con `python main_search.py --build-indexes`), nunca al
+sincronizar, y a partir de ahí MongoDB los mantiene con cada inserción.
+
+Los resultados se devuelven de más nuevo a más viejo, en páginas de SEARCH_PAGE_SIZE
+mensajes. La paginación es por ID (`id < último ID de la página anterior`), así que pedir la
+página 1000 cuesta lo mismo que pedir la primera, e `iter_pages` las va entregando según
+llegan en lugar de esperar a tener todos los resultados.
+
+Con STORAGE_SCHEMA='raw' solo `date`, `grouped_id` e `id` están fuera del blob comprimido:
+los filtros por texto, remitente o tipo de multimedia solo encuentran documentos 'compact'.
+Lo mismo pasa con los documentos archivados antes de STORAGE_SCHEMA (el `to_dict()` tal
+cual): `legacy_warning` avisa de ellos y `python main_search.py --migrate` los reescribe
+(ver `db.migrate_legacy_documents`). `result_row` muestra bien los de cualquier formato.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from pymongo import DESCENDING
+
+import db
+import schema
+import settings
+
+# Página de resultados: documentos (de más nuevo a más viejo), ID desde el que pedir la
+# siguiente (None si no hay más) y segundos que tardó la consulta
+SearchPage = namedtuple("SearchPage", ["results", "next_before_id", "elapsed"])
+
+# Columnas de `result_row`
+RESULT_COLUMNS = ("ID", "Date", "Sender", "Media", "Text")
+
+
+def parse_date(value):
+    """Fecha 'YYYY-MM-DD' (o ISO completa) como datetime en UTC; None si no hay valor."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = datetime.fromisoformat(value)
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def build_filter(text=None, sender_id=None, media_kind=None, grouped_id=None, since=None,
+                 until=None, before_id=None):
+    """
+    Filtro de MongoDB para los criterios dados (los que son None no filtran).
+
+    `text` usa el índice de texto (palabras, "frases entre comillas" y -exclusiones), `since`
+    es inclusivo y `until` exclusivo.
+    """
+    query = {}
+    if text:
+        query["$text"] = {"$search": text}
+    if sender_id is not None:
+        query["sender_id"] = int(sender_id)
+    if media_kind:
+        query["media_kind"] = media_kind
+    if grouped_id is not None:
+        query["grouped_id"] = int(grouped_id)
+    since, until = parse_date(since), parse_date(until)
+    if since or until:
+        query["date"] = {}
+        if since:
+            query["date"]["$gte"] = since
+        if until:
+            query["date"]["$lt"] = until
+    if before_id:
+        query["id"] = {"$lt": before_id}
+    return query
+
+
+def search_page(collection_name, page_size=None, before_id=None, log=None, **criteria):
+    """
+    Devuelve una `SearchPage` con los mensajes de `collection_name` que cumplen `criteria`
+    (ver `build_filter`) y tienen ID menor que `before_id`. Es bloqueante: desde código
+    asíncrono se llama con `db.run`. Con `log` avisa si antes tiene que crear los índices.
+    """
+    page_size = page_size or settings.SEARCH_PAGE_SIZE
+    db.ensure_search_indexes(collection_name, log=log)
+    started = time.perf_counter()
+    # Se pide un documento de más para saber si hay otra página sin contar los resultados.
+    # allow_disk_use: una búsqueda de texto muy común ordena muchas coincidencias por ID
+    cursor = db.get_db()[collection_name].find(
+        build_filter(before_id=before_id, **criteria), allow_disk_use=True,
+    ).sort("id", DESCENDING).limit(page_size + 1)
+    results = list(cursor)
+    elapsed = time.perf_counter() - started
+    next_before_id = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        next_before_id = results[-1]["id"]
+    return SearchPage(results, next_before_id, elapsed)
+
+
+def iter_pages(collection_name, page_size=None, before_id=None, log=None, **criteria):
+    """Genera las páginas de resultados una a una, pidiendo cada una al consumir la anterior."""
+    while True:
+        page = search_page(collection_name, page_size=page_size, before_id=before_id, log=log,
+                           **criteria)
+        yield page
+        if page.next_before_id is None:
+            return
+        before_id = page.next_before_id
+
+
+def legacy_warning(collection_name):
+    """
+    Aviso (o None) si la colección aún tiene documentos de antes de STORAGE_SCHEMA, que los
+    filtros por texto, remitente y tipo de multimedia no encuentran.
+    """
+    if not db.has_legacy_documents(collection_name):
+        return None
+    return (f"{collection_name} has messages stored in the old format: text, sender and media "
+            f"filters skip them until you run: python main_search.py --migrate")
+
+
+def result_row(doc):
+    """Texto de cada columna de `RESULT_COLUMNS` para un documento de cualquier esquema."""
+    fields = schema.compact_fields(doc)
+    text, sender, media = fields.get("text"), fields.get("sender_id"), fields.get("media_kind")
+    date = doc.get("date")
+    return (
+        str(doc["id"]),
+        date.strftime("%Y-%m-%d %H:%M") if date else "",
+        "" if sender is None else str(sender),
+        media or "",
+        " ".join((text or "").split()),
+    )
+
+
+def format_result(doc, width=100):
+    """Línea de texto con un resultado, para la CLI."""
+    message_id, date, sender, media, text = result_row(doc)
+    if len(text) > width:
+        text = text[:width - 3] + "..."
+    return f"{message_id:>8}  {date:<16}  {sender:>12}  {media:<10}  {text}"
@@ -19,5 +19,96 @@ DB_NAME = os.getenv("DB_NAME", "telegram")
 DOWNLOADS_DIR = os.getenv("DOWNLOADS_DIR", os.path.join(os.getcwd(), "downloads"))
 STORAGE_ROOT = os.getenv("STORAGE_ROOT", os.getcwd())
 
+# Pool de conexiones de MongoDB (un único cliente compartido por todo el proceso)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+
+# Hilos que ejecutan las llamadas a MongoDB fuera del bucle asyncio y llamadas que pueden
+# esperar turno antes de que quien llama tenga que esperar
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+DB_EXECUTOR_QUEUE = int(os.getenv("DB_EXECUTOR_QUEUE", "64"))
+
+# Descargas de multimedia concurrentes
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "32"))
+
+# Descarga por partes en paralelo de archivos grandes
+LARGE_FILE_THRESHOLD_MB = int(os.getenv("LARGE_FILE_THRESHOLD_MB", "50"))
+DOWNLOAD_PART_SIZE_KB = int(os.getenv("DOWNLOAD_PART_SIZE_KB", "8192"))
+DOWNLOAD_PART_PARALLELISM = int(os.getenv("DOWNLOAD_PART_PARALLELISM", "4"))
+
+# Almacén de multimedia deduplicado (un archivo por contenido, compartido entre canales)
+MEDIA_DEDUP = os.getenv("MEDIA_DEDUP", "true").lower() in ("1", "true", "yes")
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", os.path.join(DOWNLOADS_DIR, "store"))
+MEDIA_INDEX_COLLECTION = os.getenv("MEDIA_INDEX_COLLECTION", "_media_index")
+
+# Páginas del historial: mensajes por petición (máximo 100) y pausa entre páginas
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_PAGE_DELAY = float(os.getenv("HISTORY_PAGE_DELAY", "1"))
+
+# Ajuste automático de página, pausa y tamaño de escritura según el rendimiento medido
+AUTO_TUNE = os.getenv("AUTO_TUNE", "false").lower() in ("1", "true", "yes")
+AUTO_TUNE_WINDOW = float(os.getenv("AUTO_TUNE_WINDOW", "10"))
+FLUSH_TARGET_LATENCY = float(os.getenv("FLUSH_TARGET_LATENCY", "0.5"))
+
+# Escritura de mensajes por lotes en segundo plano
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "5"))
+MAX_PENDING_FLUSHES = int(os.getenv("MAX_PENDING_FLUSHES", "4"))
+
+# Colección con el checkpoint de sincronización de cada canal
+SYNC_STATE_COLLECTION = os.getenv("SYNC_STATE_COLLECTION", "_sync_state")
+
+# Relleno de huecos (backfill): segmentos de IDs recorridos en paralelo
+BACKFILL_SEGMENT_SIZE = int(os.getenv("BACKFILL_SEGMENT_SIZE", "5000"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+
+# Esquema de los documentos de mensajes: 'compact' (campos planos) o 'raw' (to_dict comprimido)
+STORAGE_SCHEMA = os.getenv("STORAGE_SCHEMA", "compact").lower()
+RAW_COMPRESSION_LEVEL = int(os.getenv("RAW_COMPRESSION_LEVEL", "6"))
+
+# Control de ritmo de las peticiones a Telegram (peticiones/segundo, se ajusta con los FloodWait)
+RATE_INITIAL = float(os.getenv("RATE_INITIAL", "3"))
+RATE_MIN = float(os.getenv("RATE_MIN", "0.1"))
+RATE_MAX = float(os.getenv("RATE_MAX", "30"))
+RATE_INCREASE = float(os.getenv("RATE_INCREASE", "0.1"))
+
+# Búsqueda local: resultados por página e idioma del índice de texto ('none' = sin
+# stemming ni palabras vacías, válido para cualquier idioma)
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "50"))
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "none")
+
+# Exportación de canales: carpeta de salida, mensajes por archivo, compresión y canales
+# exportados a la vez
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.getcwd(), "exports"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "100000"))
+EXPORT_COMPRESSION_LEVEL = int(os.getenv("EXPORT_COMPRESSION_LEVEL", "6"))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+
+# Métricas: puerto del endpoint HTTP de Prometheus (0 = desactivado), interfaz donde
+# escucha y carpeta del resumen JSON de cada ejecución (vacía = no se guarda)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+
+# Perfilado opcional de una sincronización (main.py --profile)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getcwd(), "profiles"))
+
+# GUI: cada cuántos segundos se envían logs y progreso, y líneas máximas de la consola
+GUI_REFRESH_INTERVAL = float(os.getenv("GUI_REFRESH_INTERVAL", "0.5"))
+GUI_LOG_MAX_LINES = int(os.getenv("GUI_LOG_MAX_LINES", "5000"))
+
+# Sincronización de varios canales en paralelo
+CHANNELS_FILE = os.getenv("CHANNELS_FILE", "canalles.txt")
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "3"))
+
+# Modo demonio (main.py --daemon): segundos entre pasadas de recuperación de cada canal y
+# segundos máximos que un mensaje en vivo espera en el buffer del escritor
+DAEMON_CATCH_UP_INTERVAL = float(os.getenv("DAEMON_CATCH_UP_INTERVAL", "600"))
+DAEMON_FLUSH_INTERVAL = float(os.getenv("DAEMON_FLUSH_INTERVAL", "1"))
+
 if not API_ID or not API_HASH:
     raise ValueError("API_ID and API_HASH must be set in the .env file")
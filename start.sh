@@ -42,4 +42,4 @@ fi
 
 # 5. Run Application
 echo "Starting Telegram Fetcher..."
-python main.py
+python main.py "$@"
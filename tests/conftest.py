@@ -0,0 +1,50 @@
+"""
+Configuración común de los tests.
+
+Los módulos del proyecto están en la raíz del repositorio y `settings` exige API_ID y
+API_HASH al importarse: aquí se añaden valores de prueba (si no hay otros en el entorno o
+en el .env) antes de que ningún test lo importe. Ningún test conecta con Telegram ni con
+MongoDB: usan `benchmarks/fake_client.py` y `benchmarks/memory_db.py`.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+
+# Después de preparar la ruta y el entorno
+import media_store
+import ratelimit
+import settings
+from benchmarks.memory_db import MemoryDB
+
+
+@pytest.fixture
+def memory_db():
+    """MongoDB en memoria instalado en `db` mientras dura el test."""
+    with MemoryDB().installed() as memory:
+        yield memory
+
+
+@pytest.fixture
+def sync_env(tmp_path, monkeypatch):
+    """
+    Descargas en una carpeta temporal, historial sin pausas entre páginas y un controlador
+    de ritmo propio y rápido (que el test puede inspeccionar).
+    """
+    monkeypatch.setattr(settings, "STORAGE_ROOT", str(tmp_path))
+    monkeypatch.setattr(settings, "DOWNLOADS_DIR", str(tmp_path / "downloads"))
+    monkeypatch.setattr(settings, "MEDIA_STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(settings, "HISTORY_PAGE_DELAY", 0)
+    monkeypatch.setattr(settings, "AUTO_TUNE", False)
+    monkeypatch.setattr(media_store, "_default_store", None)
+    controller = ratelimit.RateController(rate=1000, min_rate=100, max_rate=1000,
+                                          log=lambda text: None)
+    monkeypatch.setattr(ratelimit, "_default_controller", controller)
+    return controller
@@ -0,0 +1,55 @@
+"""Cálculo de huecos y relleno del historial (ver `backfill.py`)."""
+import asyncio
+
+import backfill
+from benchmarks.fake_client import FakeTelegramClient
+
+
+def test_missing_ranges():
+    assert backfill.missing_ranges([1, 2, 5, 6, 9], 10) == [(3, 4), (7, 8), (10, 10)]
+    assert backfill.missing_ranges([], 3) == [(1, 3)]
+    assert backfill.missing_ranges([1, 2, 3], 3) == []
+    # Los IDs por encima del límite no cuentan
+    assert backfill.missing_ranges([2, 20], 5) == [(1, 1), (3, 5)]
+
+
+def test_missing_ranges_skips_done_segments():
+    assert backfill.missing_ranges([5], 10, done=[(1, 2), (8, 10)]) == [(3, 4), (6, 7)]
+
+
+def test_subtract_ranges():
+    ranges = [(1, 10), (20, 30)]
+    assert backfill.subtract_ranges(ranges, []) == ranges
+    assert backfill.subtract_ranges(ranges, [(5, 6)]) == [(1, 4), (7, 10), (20, 30)]
+    assert backfill.subtract_ranges(ranges, [(8, 25)]) == [(1, 7), (26, 30)]
+    assert backfill.subtract_ranges(ranges, [(0, 40)]) == []
+    assert backfill.subtract_ranges(ranges, [(25, 30), (1, 1)]) == [(2, 10), (20, 24)]
+
+
+def test_split_segments():
+    segments = backfill.split_segments([(1, 3), (5, 12), (30, 30)], segment_size=5)
+    assert segments == [
+        (1, 5, [(1, 3), (5, 5)]),
+        (6, 10, [(6, 10)]),
+        (11, 12, [(11, 12)]),
+        (30, 30, [(30, 30)]),
+    ]
+    assert backfill.split_segments([], segment_size=5) == []
+
+
+def test_backfill_fills_gap(memory_db, sync_env):
+    client = FakeTelegramClient(300, media_ratio=0.1, media_size=4096)
+    collection = memory_db.collections.setdefault("canal", {})
+    for message_id in [*range(1, 100), *range(151, 301)]:
+        collection[message_id] = b""
+
+    totals = asyncio.run(backfill.backfill_channel(client, "canal", log=lambda text: None,
+                                                   segment_size=20))
+
+    assert totals.inserted == 51
+    assert sorted(collection) == list(range(1, 301))
+    assert sorted(memory_db.get_backfilled_segments("canal")) == [(100, 119), (120, 139), (140, 150)]
+    # Un segundo backfill no vuelve a pedir los segmentos ya recorridos
+    again = asyncio.run(backfill.backfill_channel(client, "canal", log=lambda text: None,
+                                                  segment_size=20))
+    assert again.inserted == 0
@@ -0,0 +1,61 @@
+"""Checkpoint del prefijo contiguo escrito (ver `checkpoint.py`)."""
+import asyncio
+
+import checkpoint
+import db
+import settings
+
+
+def batch(*ids):
+    return [{"id": message_id} for message_id in ids]
+
+
+def test_commit_advances_to_last_contiguous_id(memory_db):
+    sync_checkpoint = checkpoint.SyncCheckpoint("canal")
+    sync_checkpoint.commit(batch(1, 2, 3), db.FlushResult(3, 0, 0))
+    assert sync_checkpoint.committed_id == 3
+
+    # Un mensaje fallido corta el prefijo: se confirma hasta el anterior y ya no avanza
+    sync_checkpoint.commit(batch(4, 5, 6), db.FlushResult(2, 0, 1, (5,)))
+    assert sync_checkpoint.committed_id == 4
+    sync_checkpoint.commit(batch(7, 8), db.FlushResult(2, 0, 0))
+    assert sync_checkpoint.committed_id == 4
+    assert memory_db.sync_state["canal"]["last_committed_id"] == 4
+
+
+def test_abort_stops_the_checkpoint(memory_db):
+    sync_checkpoint = checkpoint.SyncCheckpoint("canal")
+    sync_checkpoint.commit(batch(1, 2), db.FlushResult(2, 0, 0))
+    sync_checkpoint.abort()
+    sync_checkpoint.commit(batch(3, 4), db.FlushResult(2, 0, 0))
+    assert sync_checkpoint.committed_id == 2
+    assert memory_db.sync_state["canal"]["last_committed_id"] == 2
+
+
+def test_load_resumes_from_checkpoint_or_latest_id(memory_db):
+    memory_db.collections["viejo"] = {1: b"", 7: b""}
+    memory_db.save_sync_checkpoint("canal", 40)
+    assert asyncio.run(checkpoint.SyncCheckpoint("canal").load(log=lambda text: None)) == 40
+    # Canal sincronizado antes de los checkpoints: el último ID guardado
+    assert asyncio.run(checkpoint.SyncCheckpoint("viejo").load(log=lambda text: None)) == 7
+
+
+class _StateCollection:
+    def __init__(self):
+        self.updates = []
+
+    def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update, upsert))
+
+
+def test_save_sync_checkpoint_never_moves_back(monkeypatch):
+    collection = _StateCollection()
+    monkeypatch.setattr(db, "get_db", lambda: {settings.SYNC_STATE_COLLECTION: collection})
+
+    db.save_sync_checkpoint("canal", 10)
+
+    query, update, upsert = collection.updates[0]
+    assert query == {"_id": "canal"} and upsert
+    # $max en la propia actualización: un commit más viejo que llega tarde no retrocede
+    assert update["$max"] == {"last_committed_id": 10}
+    assert update["$unset"] == {"in_flight_media": ""}
@@ -0,0 +1,40 @@
+"""Recuento de las escrituras por lotes (ver `db.upsert_messages`)."""
+from pymongo.errors import BulkWriteError
+
+import db
+
+
+class _Collection:
+    def __init__(self, error=None):
+        self.error = error
+
+    def create_index(self, keys, **options):
+        pass
+
+    def bulk_write(self, requests, ordered=True):
+        raise BulkWriteError(self.error)
+
+
+def test_upsert_messages_counts_bulk_write_errors(monkeypatch):
+    collection = _Collection({
+        "nUpserted": 2,
+        "nMatched": 1,
+        "writeErrors": [
+            # Choque con el índice único de `id`: cuenta como duplicado
+            {"index": 1, "code": 11000, "errmsg": "duplicate key"},
+            {"index": 3, "code": 121, "errmsg": "document failed validation"},
+        ],
+    })
+    monkeypatch.setattr(db, "get_db", lambda: {"canal": collection})
+    monkeypatch.setattr(db, "_indexed_collections", set())
+
+    result = db.upsert_messages("canal", [{"id": i} for i in range(1, 6)])
+
+    assert result == db.FlushResult(2, 2, 1, (4,))
+    assert (result.inserted, result.duplicates, result.failed) == (2, 2, 1)
+
+
+def test_flush_results_add_up():
+    total = db.FlushResult.EMPTY + db.FlushResult(3, 1, 1, (9,)) + db.FlushResult(2, 0, 1, (12,))
+    assert total == db.FlushResult(5, 1, 2, (9, 12))
+    assert db.upsert_messages("canal", []) == db.FlushResult.EMPTY
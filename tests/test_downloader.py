@@ -0,0 +1,88 @@
+"""Limpieza de descargas a medias (ver `downloader.py`)."""
+import asyncio
+import os
+
+import pytest
+from telethon.errors import FloodWaitError
+
+import downloader
+from benchmarks.fake_client import FakeTelegramClient
+from benchmarks.synthetic import synthetic_message
+
+
+class _InterruptedClient(FakeTelegramClient):
+    """
+    Como Telethon: abre el archivo de destino (con otro nombre si ya existe) antes de la
+    primera petición, y el primer intento se corta con un FloodWait.
+    """
+    async def download_media(self, message, file=None, **kwargs):
+        name = message.file.name or f"{message.id}{message.file.ext or ''}"
+        base, ext = os.path.splitext(name)
+        path, copy = os.path.join(file, name), 1
+        while os.path.exists(path):
+            path = os.path.join(file, f"{base} ({copy}){ext}")
+            copy += 1
+        with open(path, "wb") as f:
+            if self.requests == 0:
+                f.write(b"partial")
+                self.requests += 1
+                raise FloodWaitError(request=None, capture=0)
+        return await super().download_media(message, file=path, **kwargs)
+
+
+def test_discard_incomplete_downloads(tmp_path):
+    (tmp_path / "complete.jpg").write_bytes(b"x" * 10)
+    (tmp_path / "partial.jpg").write_bytes(b"x" * 4)
+    # Descarga por partes reanudable: se conserva aunque aún no tenga el tamaño final
+    (tmp_path / "large.mp4").write_bytes(b"x" * 4)
+    (tmp_path / ("large.mp4" + downloader.PARTIAL_SUFFIX)).write_text("{}")
+
+    downloader.discard_incomplete_downloads(str(tmp_path), 10)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "complete.jpg", "large.mp4", "large.mp4" + downloader.PARTIAL_SUFFIX]
+    assert downloader.find_complete_download(str(tmp_path), 10) == str(tmp_path / "complete.jpg")
+
+
+def test_discard_incomplete_downloads_without_size(tmp_path):
+    (tmp_path / "unknown.bin").write_bytes(b"x")
+    downloader.discard_incomplete_downloads(str(tmp_path), None)
+    downloader.discard_incomplete_downloads(str(tmp_path / "missing"), 10)
+    assert (tmp_path / "unknown.bin").exists()
+
+
+def test_flood_wait_retry_leaves_one_file(sync_env):
+    client = _InterruptedClient(1, media_size=4096)
+    message = synthetic_message(1, media_ratio=1, media_size=4096)
+    message._client = client
+    pipeline = downloader.MediaDownloadPipeline("canal", log=lambda text: None, store=None)
+
+    saved_path = asyncio.run(pipeline._fetch_file(message))
+
+    assert sync_env.flood_waits == 1
+    folder = os.path.dirname(saved_path)
+    assert os.listdir(folder) == [os.path.basename(saved_path)]
+    assert " (1)" not in saved_path
+    assert os.path.getsize(saved_path) == message.file.size
+
+
+def test_download_in_parts_writes_sidecar_before_preallocating(tmp_path, monkeypatch, sync_env):
+    client = FakeTelegramClient(1)
+    message = synthetic_message(3, media_ratio=1, media_size=3 * downloader.REQUEST_SIZE)
+    file_path = str(tmp_path / "video.mp4")
+
+    def crash(state):
+        raise KeyboardInterrupt("killed")
+
+    assert message.document is not None
+    # Muere justo al crear el sidecar: no puede quedar un archivo que parezca completo
+    with monkeypatch.context() as patch:
+        patch.setattr(downloader.PartialDownloadState, "save", crash)
+        with pytest.raises(KeyboardInterrupt):
+            asyncio.run(downloader.download_in_parts(client, message, file_path, rate=sync_env))
+    assert downloader.find_complete_download(str(tmp_path), message.file.size) is None
+
+    asyncio.run(downloader.download_in_parts(client, message, file_path,
+                                             part_size=downloader.REQUEST_SIZE, rate=sync_env))
+    assert os.listdir(tmp_path) == ["video.mp4"]
+    assert os.path.getsize(file_path) == message.file.size
@@ -0,0 +1,33 @@
+"""Sincronización completa con el cliente y la BD falsos (ver `engine.py`)."""
+import asyncio
+
+import engine
+from benchmarks.fake_client import FakeTelegramClient
+
+
+def test_sync_survives_flood_waits(memory_db, sync_env):
+    # Un FloodWait cada 4 peticiones (páginas y descargas)
+    client = FakeTelegramClient(450, media_ratio=0.2, media_size=4096, flood_every=4,
+                                flood_seconds=0)
+
+    result = asyncio.run(engine.sync_channel(client, "canal", log=lambda text: None))
+
+    assert result.state == "done"
+    assert client.flood_waits > 0
+    assert sync_env.flood_waits == client.flood_waits
+    assert result.totals.inserted == 450 and result.totals.failed == 0
+    assert sorted(memory_db.collections["canal"]) == list(range(1, 451))
+    state = memory_db.sync_state["canal"]
+    assert state["last_committed_id"] == 450
+    assert state["last_run"]["state"] == "done"
+
+
+def test_sync_resumes_from_checkpoint(memory_db, sync_env):
+    client = FakeTelegramClient(120, media_ratio=0)
+    asyncio.run(engine.sync_channel(client, "canal", log=lambda text: None))
+
+    client.count = 200
+    result = asyncio.run(engine.sync_channel(client, "canal", log=lambda text: None))
+
+    assert result.totals.inserted == 80 and result.totals.duplicates == 0
+    assert memory_db.sync_state["canal"]["last_committed_id"] == 200
@@ -0,0 +1,81 @@
+"""Exportación de documentos de cualquier formato (ver `export.py`)."""
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from telethon.tl import types
+
+import db
+import export
+import schema
+
+
+def baseline_message():
+    """Mensaje con respuesta, remitente y foto, como los guarda una colección antigua."""
+    photo = types.Photo(id=1, access_hash=2, file_reference=b"", dc_id=1,
+                        date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                        sizes=[types.PhotoSize(type="x", w=800, h=600, size=5000)])
+    return types.Message(
+        id=42, peer_id=types.PeerChannel(100), date=datetime(2024, 1, 2, tzinfo=timezone.utc),
+        message="hola mundo", from_id=types.PeerUser(7), views=10, forwards=2,
+        reply_to=types.MessageReplyHeader(reply_to_msg_id=41),
+        media=types.MessageMediaPhoto(photo=photo),
+    )
+
+
+def baseline_document(message):
+    # Lo que escribía la versión anterior: el to_dict() tal cual, con el ID como _id
+    return dict(message.to_dict(), _id=message.id, saved_media_path="downloads/42.jpg")
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    docs = []
+    monkeypatch.setattr(db, "iter_documents", lambda name, after_id=None, since_date=None: iter(docs))
+    return docs
+
+
+def test_export_record_normalises_every_format():
+    message = baseline_message()
+    expected = dict(schema.compact_document(message), saved_media_path="downloads/42.jpg")
+    compact = dict(expected, _id=message.id)
+    raw = dict(schema.raw_document(message), _id=message.id, saved_media_path="downloads/42.jpg")
+
+    assert export.export_record(compact) == expected
+    for doc in (raw, baseline_document(message)):
+        record = export.export_record(doc)
+        assert record.pop("raw")["message"] == "hola mundo"
+        # BSON guarda las fechas sin zona horaria
+        assert record.pop("date").replace(tzinfo=timezone.utc) == expected["date"]
+        assert record == {k: v for k, v in expected.items() if k != "date"}
+    assert expected["text"] == "hola mundo" and expected["reply_to"] == 41
+
+
+def test_jsonl_export_of_baseline_document(tmp_path, documents):
+    documents.append(baseline_document(baseline_message()))
+    run = export.export_channel("canal", output_dir=str(tmp_path), fmt="jsonl", log=lambda text: None)
+
+    with gzip.open(tmp_path / "canal" / run["chunks"][0]["file"], "rt", encoding="utf-8") as f:
+        record = json.loads(f.readline())
+    assert record["text"] == "hola mundo"
+    assert record["sender_id"] == 7
+    assert record["reply_to"] == 41
+    assert record["media_kind"] == "photo"
+    assert record["raw"]["_"] == "Message"
+
+
+def test_parquet_export_of_baseline_document(tmp_path, documents):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    documents.append(baseline_document(baseline_message()))
+    run = export.export_channel("canal", output_dir=str(tmp_path), fmt="parquet", log=lambda text: None)
+
+    table = pyarrow.parquet.read_table(tmp_path / "canal" / run["chunks"][0]["file"])
+    row = table.to_pylist()[0]
+    assert row["text"] == "hola mundo"
+    assert row["sender_id"] == 7
+    assert row["reply_to"] == 41
+    assert row["media_kind"] == "photo"
+    assert json.loads(row["raw"])["message"] == "hola mundo"
@@ -0,0 +1,60 @@
+"""Control de ritmo AIMD ante FloodWait (ver `ratelimit.py`)."""
+import asyncio
+
+import pytest
+from telethon.errors import FloodWaitError
+
+import ratelimit
+
+
+def controller(rate=10.0):
+    return ratelimit.RateController(rate=rate, min_rate=1.0, max_rate=20.0, increase=2.0,
+                                    log=lambda text: None)
+
+
+def test_success_increases_rate_additively():
+    rate = controller(rate=10.0)
+    rate.success()
+    # +increase por segundo: cada petición suma increase / rate
+    assert rate.rate == pytest.approx(10.2)
+    for _ in range(1000):
+        rate.success()
+    assert rate.rate == 20.0
+
+
+def test_flood_wait_halves_rate_down_to_minimum():
+    rate = controller(rate=10.0)
+    asyncio.run(rate.flood_wait(0))
+    assert rate.rate == 5.0
+    assert rate.flood_waits == 1
+    for _ in range(5):
+        asyncio.run(rate.flood_wait(0))
+    assert rate.rate == 1.0
+
+
+def test_concurrent_flood_waits_halve_once():
+    rate = controller(rate=10.0)
+
+    async def run():
+        await asyncio.gather(rate.flood_wait(0.05), rate.flood_wait(0.05), rate.flood_wait(0.01))
+
+    asyncio.run(run())
+    assert rate.rate == 5.0
+    assert rate.flood_waits == 3
+    assert rate.flood_wait_seconds == pytest.approx(0.05, abs=0.02)
+
+
+def test_call_retries_after_flood_wait():
+    rate = controller(rate=1000.0)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FloodWaitError(request=None, capture=0)
+        return "ok"
+
+    assert asyncio.run(rate.call(request)) == "ok"
+    assert len(attempts) == 2
+    assert rate.flood_waits == 1
+    assert rate.requests == 2
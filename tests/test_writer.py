@@ -0,0 +1,58 @@
+"""Orden de las escrituras por lotes (ver `writer.py`)."""
+import asyncio
+import time
+
+import db
+from writer import MessageWriter
+
+
+def test_batches_are_written_in_order(monkeypatch):
+    written = []
+
+    def upsert_messages(collection_name, messages):
+        # El primer lote es el más lento: aun así el segundo no se escribe antes
+        if messages[0]["id"] == 1:
+            time.sleep(0.05)
+        written.append([msg["id"] for msg in messages])
+        return db.FlushResult(len(messages), 0, 0)
+
+    monkeypatch.setattr(db, "upsert_messages", upsert_messages)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        download = loop.create_future()
+        flushed = []
+        writer = MessageWriter("canal", flush_size=2, flush_interval=60, log=lambda text: None,
+                               on_flush=lambda batch, result: flushed.append(batch[0]["id"]))
+        writer.start()
+        # El mensaje 2 espera a su descarga: su lote y los siguientes esperan con él
+        await writer.add({"id": 1})
+        await writer.add({"id": 2}, pending=download)
+        for message_id in range(3, 7):
+            await writer.add({"id": message_id})
+        await asyncio.sleep(0.1)
+        assert written == []
+        download.set_result("ruta")
+        await writer.close()
+        return writer, flushed
+
+    writer, flushed = asyncio.run(run())
+    assert written == [[1, 2], [3, 4], [5, 6]]
+    assert flushed == [1, 3, 5]
+    assert writer.totals == db.FlushResult(6, 0, 0)
+
+
+def test_close_with_discard_drops_waiting_batches(monkeypatch):
+    written = []
+    monkeypatch.setattr(db, "upsert_messages",
+                        lambda name, messages: written.append(messages) or db.FlushResult(0, 0, 0))
+
+    async def run():
+        writer = MessageWriter("canal", flush_size=1, flush_interval=60, log=lambda text: None)
+        writer.start()
+        await writer.add({"id": 1}, pending=asyncio.get_running_loop().create_future())
+        await writer.add({"id": 2})
+        await writer.close(discard=True)
+
+    asyncio.run(run())
+    assert written == []
@@ -0,0 +1,136 @@
+"""
+Módulo de Ajuste de Tamaños de Lote.
+
+`SyncTuner` guarda, para un canal, los parámetros del bucle de sincronización:
+
+- `page_size`: mensajes por petición de historial (HISTORY_PAGE_SIZE, máximo 100).
+- `page_delay`: pausa entre páginas del historial (HISTORY_PAGE_DELAY).
+- `flush_size`: mensajes por escritura en MongoDB (WRITE_BATCH_SIZE).
+
+Con AUTO_TUNE activo los ajusta durante la ejecución:
+
+- Página y pausa, por ascenso de colina sobre los mensajes/segundo medidos en ventanas
+  de AUTO_TUNE_WINDOW segundos: cada ventana prueba a mover un parámetro en su dirección
+  actual; si el ritmo empeora, deshace el cambio e invierte la dirección.
+- Tamaño de escritura, según la latencia de MongoDB: crece mientras los lotes llenos se
+  escriben muy por debajo de FLUSH_TARGET_LATENCY y se reduce si la superan.
+
+Los valores elegidos y los ritmos observados se registran con el `log` del canal.
+"""
+import time
+
+import settings
+
+# Límite de Telegram para GetHistoryRequest
+MAX_PAGE_SIZE = 100
+MIN_PAGE_SIZE = 10
+PAGE_SIZE_STEP = 20
+MAX_PAGE_DELAY = 5.0
+MIN_PAGE_DELAY = 0.05
+MIN_FLUSH_SIZE = 10
+MAX_FLUSH_SIZE = 5000
+
+
+class SyncTuner:
+    """
+    Parámetros de lote de la sincronización de un canal y su ajuste automático.
+
+    Atributos:
+        page_size (int), page_delay (float), flush_size (int): Valores actuales.
+        enabled (bool): Si se ajustan solos durante la ejecución.
+        messages (int): Mensajes recibidos del historial.
+        flushes (int), flush_seconds (float): Escrituras hechas y su tiempo total.
+    """
+    def __init__(self, name, enabled=None, window=None, target_latency=None, log=print):
+        self.name = name
+        self.enabled = settings.AUTO_TUNE if enabled is None else enabled
+        self.window = window or settings.AUTO_TUNE_WINDOW
+        self.target_latency = target_latency or settings.FLUSH_TARGET_LATENCY
+        self.log = log
+        self.page_size = max(MIN_PAGE_SIZE, min(MAX_PAGE_SIZE, settings.HISTORY_PAGE_SIZE))
+        self.page_delay = settings.HISTORY_PAGE_DELAY
+        self.flush_size = settings.WRITE_BATCH_SIZE
+        self.messages = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self._started = None
+        self._window_started = None
+        self._window_messages = 0
+        self._baseline = None
+        self._directions = {"page_size": 1, "page_delay": -1}
+        self._next_param = "page_size"
+        self._last_change = None
+
+    @property
+    def messages_per_sec(self):
+        if self._started is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return self.messages / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def avg_flush_latency(self):
+        return self.flush_seconds / self.flushes if self.flushes else 0.0
+
+    def record_page(self, count):
+        """Registra una página del historial con `count` mensajes."""
+        now = time.monotonic()
+        if self._started is None:
+            self._started = self._window_started = now
+        self.messages += count
+        self._window_messages += count
+        elapsed = now - self._window_started
+        if self.enabled and elapsed >= self.window:
+            self._tune_history(self._window_messages / elapsed)
+            self._window_started = now
+            self._window_messages = 0
+
+    def record_flush(self, count, seconds):
+        """Registra una escritura de `count` mensajes que tardó `seconds`."""
+        self.flushes += 1
+        self.flush_seconds += seconds
+        if not self.enabled:
+            return
+        if count >= self.flush_size and seconds < self.target_latency / 2:
+            self._set("flush_size", min(MAX_FLUSH_SIZE, int(self.flush_size * 1.5)),
+                      f"flush took {seconds:.2f}s")
+        elif seconds > self.target_latency:
+            self._set("flush_size", max(MIN_FLUSH_SIZE, int(self.flush_size / 1.5)),
+                      f"flush took {seconds:.2f}s")
+
+    def summary(self):
+        mode = "auto-tuned" if self.enabled else "fixed"
+        return (f"Batch sizes ({mode}): page_size={self.page_size}, "
+                f"page_delay={self.page_delay:.2f}s, flush_size={self.flush_size} | "
+                f"{self.messages_per_sec:.1f} msg/s, "
+                f"{self.avg_flush_latency * 1000:.0f} ms avg flush")
+
+    def _tune_history(self, rate):
+        # El ritmo de referencia decae poco a poco para adaptarse a cambios del entorno
+        if self._last_change and self._baseline and rate < self._baseline * 0.95:
+            name, previous = self._last_change
+            self._directions[name] *= -1
+            self._set(name, previous, f"{rate:.1f} msg/s < {self._baseline:.1f} msg/s, reverting")
+        else:
+            self._baseline = rate
+        self._baseline *= 0.98
+
+        name = self._next_param
+        self._next_param = "page_delay" if name == "page_size" else "page_size"
+        previous = getattr(self, name)
+        if name == "page_size":
+            value = previous + PAGE_SIZE_STEP * self._directions[name]
+            value = max(MIN_PAGE_SIZE, min(MAX_PAGE_SIZE, value))
+        elif self._directions[name] < 0:
+            value = previous / 2 if previous / 2 >= MIN_PAGE_DELAY else 0.0
+        else:
+            value = min(MAX_PAGE_DELAY, max(MIN_PAGE_DELAY, previous * 2))
+        self._last_change = (name, previous) if value != previous else None
+        self._set(name, value, f"measured {rate:.1f} msg/s")
+
+    def _set(self, name, value, reason):
+        if getattr(self, name) == value:
+            return
+        setattr(self, name, value)
+        shown = f"{value:.2f}s" if name == "page_delay" else value
+        self.log(f"Auto-tune {self.name}: {name}={shown} ({reason})")
@@ -1,135 +1,417 @@
-import asyncio
-import os
-from PySide6.QtCore import QObject, Signal
-from telethon import TelegramClient
-from telethon.tl.types import Message
 """
 Módulo de Hilo de Trabajo (Worker) para la GUI.
 
-Este módulo contiene el `TelegramSyncService`, un QObject diseñado para ejecutarse en un hilo separado
-para evitar congelar la GUI durante el proceso de sincronización de larga duración.
-Comunica el progreso de vuelta a la GUI usando señales Qt.
+La sincronización no corre en el bucle de eventos de Qt: `EngineThread` es un hilo con su
+propio bucle asyncio donde viven el cliente de Telegram y el motor (`engine.sync_channel`),
+de modo que las llamadas bloqueantes a MongoDB o la serialización de mensajes no congelan
+la ventana (ni la ventana frena la red de Telethon).
+
+La GUI y el hilo del motor solo se comunican por colas de mensajes:
+
+- Órdenes (GUI -> motor): `TelegramSyncService` envía tuplas `(orden, argumentos)`
+  ('sync', 'backfill', 'stop', 'pause', 'resume', 'search', 'quit') a una `asyncio.Queue`
+  del bucle del motor, de forma segura entre hilos.
+- Telemetría (motor -> GUI): `SyncRunner` deja eventos `(tipo, datos)` ('log', 'status',
+  'progress', 'error', 'search', 'finished') en una `queue.SimpleQueue`, que un `QTimer`
+  del servicio vacía cada GUI_REFRESH_INTERVAL y convierte en señales Qt.
+
+Para no saturar el hilo de la interfaz, los logs se acumulan y se envían en bloque, y el
+progreso se envía a ritmo fijo en lugar de una vez por evento.
+
+Con METRICS_PORT el hilo del motor sirve también las métricas de `metrics.py`, y con
+METRICS_DIR cada sincronización deja su resumen JSON.
 """
+import asyncio
+import queue
+import threading
+from collections import deque
+
+from PySide6.QtCore import QObject, QTimer, Signal
+from telethon import TelegramClient
 import settings
 import db
+import backfill
+import engine
+import metrics
+import ratelimit
+import scheduler
+import search
+
+
+class SyncRunner:
+    """
+    Ejecuta los trabajos de sincronización en el bucle asyncio del hilo del motor.
+
+    Todo su estado se toca solo desde ese bucle; hacia fuera solo escribe eventos en la
+    cola `events`.
+    """
+    def __init__(self, events):
+        self.events = events
+        self.client = None
+        self.is_running = False
+        self.scheduler = None
+        self.job = None
+        # Activado mientras no esté en pausa
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        # Los logs se acumulan aquí y se envían en bloque cada GUI_REFRESH_INTERVAL
+        self._log_buffer = deque(maxlen=settings.GUI_LOG_MAX_LINES)
+        self._log_dropped = 0
+        self._telemetry_task = None
+        self._run_summary = None
+        self._searches = set()
+
+    def emit(self, kind, payload=None):
+        self.events.put((kind, payload))
+
+    def log(self, text):
+        """Encola una línea de log; se envía junto con las demás en el próximo refresco."""
+        if len(self._log_buffer) == self._log_buffer.maxlen:
+            self._log_dropped += 1
+        self._log_buffer.append(text)
+
+    def error(self, text):
+        # Los errores se envían al momento, después de los logs que los preceden
+        self._flush_logs()
+        self.emit("error", text)
+
+    def handle(self, command, *args):
+        """Atiende una orden de la GUI."""
+        if command in ("sync", "backfill"):
+            if self.job is not None:
+                self.error("A sync is already running")
+                return
+            if command == "sync":
+                self.job = asyncio.create_task(self._run_channels(*args))
+            else:
+                self.job = asyncio.create_task(self._run_backfill(*args))
+            self.job.add_done_callback(lambda _: setattr(self, "job", None))
+        elif command == "search":
+            # Las búsquedas no usan Telegram: pueden correr a la vez que una sincronización
+            task = asyncio.create_task(self._search(*args))
+            self._searches.add(task)
+            task.add_done_callback(self._searches.discard)
+        elif command == "stop":
+            self.stop_sync()
+        elif command == "pause":
+            if self.is_running and self.resumed.is_set():
+                self.resumed.clear()
+                self.emit("status", "Paused")
+        elif command == "resume":
+            if not self.resumed.is_set():
+                self.resumed.set()
+                self.emit("status", "Syncing messages...")
+
+    def stop_sync(self):
+        self.is_running = False
+        # Una sincronización en pausa tiene que despertar para poder terminar
+        self.resumed.set()
+        if self.scheduler:
+            self.scheduler.stop()
+
+    async def shutdown(self):
+        """Detiene el trabajo en curso y desconecta el cliente."""
+        self.stop_sync()
+        if self.job is not None:
+            await asyncio.gather(self.job, return_exceptions=True)
+        if self.client is not None:
+            await self.client.disconnect()
+
+    async def _search(self, channel_name, before_id, criteria):
+        """Busca en los mensajes archivados de un canal y envía la página de resultados."""
+        collection_name = engine.collection_name_for(channel_name)
+
+        def query():
+            page = search.search_page(collection_name, before_id=before_id, log=self.log,
+                                      **criteria)
+            warning = search.legacy_warning(collection_name) if before_id is None else None
+            # Los documentos 'raw' y antiguos se descomprimen/convierten aquí, fuera del bucle
+            return page, [search.result_row(doc) for doc in page.results], warning
+
+        event = {"channel": channel_name, "append": before_id is not None}
+        try:
+            page, rows, warning = await db.run(query)
+        except Exception as e:
+            event["error"] = str(e)
+        else:
+            event.update(rows=rows, next_before_id=page.next_before_id, elapsed=page.elapsed,
+                         warning=warning)
+        self.emit("search", event)
+
+    async def _connect(self):
+        self.emit("status", "Connecting to Telegram...")
+        if self.client is None:
+            # El cliente se crea en el bucle del motor, que es el que lo va a usar
+            self.client = TelegramClient('telegram_session', settings.API_ID, settings.API_HASH)
+        await self.client.start(phone=settings.PHONE_NUMBER)
+        ratelimit.attach(self.client)
+
+    async def _run_backfill(self, channel_name):
+        """
+        Rellena los huecos del historial guardado de un canal recorriendo varios
+        segmentos de IDs en paralelo (ver `backfill.py`).
+        """
+        self._begin()
+        try:
+            await self._connect()
+
+            self.emit("status", "Backfilling history...")
+            await backfill.backfill_channel(
+                self.client, channel_name, log=self.log,
+                is_running=lambda: self.is_running, resumed=self.resumed,
+            )
+            self.emit("status", "Done." if self.is_running else "Stopped.")
+
+        except Exception as e:
+            self.error(f"An error occurred: {e}")
+            self.log(f"Error: {e}")
+        finally:
+            await self._end()
+
+    async def _run_channels(self, channels, concurrency=None):
+        """Sincroniza los canales indicados con el planificador."""
+        self._begin()
+        try:
+            connections_before = db.connections_opened()
+
+            await self._connect()
+
+            self.emit("status", "Syncing messages...")
+            # El progreso no se envía con cada cambio: lo envía la tarea de telemetría
+            # a ritmo fijo
+            self.scheduler = scheduler.ChannelSyncScheduler(self._sync_channel, concurrency=concurrency)
+            if len(channels) > 1:
+                self.log(f"Syncing {len(channels)} channels with concurrency {self.scheduler.concurrency}...")
+            snapshot = await self.scheduler.run(channels)
+
+            for channel in snapshot["channels"]:
+                if channel["state"] == "failed":
+                    self.error(f"[{channel['channel']}] An error occurred: {channel['error']}")
+            self.log(scheduler.format_summary(snapshot))
+            self.log(
+                f"MongoDB connections opened during sync: {db.connections_opened() - connections_before}"
+            )
+            self.emit("status", "Done." if self.is_running else "Stopped.")
+
+        except Exception as e:
+            self.error(f"An error occurred: {e}")
+            self.log(f"Error: {e}")
+        finally:
+            await self._end()
+            self.scheduler = None
+
+    async def _sync_channel(self, channel_name, progress=None):
+        """
+        Sincroniza un canal con el cliente ya iniciado y devuelve cuántos mensajes guardó.
+        Con varios canales en paralelo los logs se prefijan con el canal.
+        """
+        if self.scheduler is None or len(self.scheduler.channels) == 1:
+            log = self.log
+        else:
+            log = lambda text: self.log(f"[{channel_name}] {text}")
+
+        count = 0
+
+        def on_flush(batch, result):
+            nonlocal count
+            count += result.inserted
+            log(f"Synced {count} messages so far...")
+
+        # El bucle de sincronización (historial, descargas y escrituras) vive en engine.py
+        result = await engine.sync_channel(
+            self.client, channel_name, log=log, progress=progress, on_flush=on_flush,
+            is_running=lambda: self.is_running, resumed=self.resumed,
+        )
+        if result.state == "done":
+            log(f"Sync completed. Total new messages: {count}")
+        return count
+
+    def _begin(self):
+        self.is_running = True
+        self.resumed.set()
+        self._run_summary = metrics.RunSummary()
+        self._telemetry_task = asyncio.create_task(self._telemetry())
+
+    async def _end(self):
+        self.is_running = False
+        if self._telemetry_task:
+            self._telemetry_task.cancel()
+            await asyncio.gather(self._telemetry_task, return_exceptions=True)
+            self._telemetry_task = None
+        self._save_run_summary()
+        self._emit_telemetry()
+        self.emit("finished")
+
+    def _save_run_summary(self):
+        extra = {"rate": ratelimit.default_controller().snapshot()}
+        if self.scheduler:
+            extra["progress"] = self.scheduler.snapshot()
+        try:
+            path = self._run_summary.save(extra=extra)
+        except OSError as e:
+            self.log(f"Could not save metrics summary: {e}")
+        else:
+            if path:
+                self.log(f"Metrics summary saved to {path}")
+        self._run_summary = None
+
+    async def _telemetry(self):
+        # Logs y progreso se envían a la GUI a ritmo fijo, no con cada evento
+        while True:
+            await asyncio.sleep(settings.GUI_REFRESH_INTERVAL)
+            self._emit_telemetry()
+
+    def _emit_telemetry(self):
+        self._flush_logs()
+        if self.scheduler:
+            self.emit("progress", self.scheduler.snapshot())
+
+    def _flush_logs(self):
+        if self._log_dropped:
+            self._log_buffer.appendleft(f"... {self._log_dropped} log lines dropped ...")
+            self._log_dropped = 0
+        if self._log_buffer:
+            lines = list(self._log_buffer)
+            self._log_buffer.clear()
+            self.emit("log", "\n".join(lines))
+
+
+class EngineThread(threading.Thread):
+    """
+    Hilo con su propio bucle asyncio para el motor de sincronización.
+
+    `send()` se puede llamar desde cualquier hilo; las órdenes se atienden en orden en el
+    bucle del motor hasta recibir 'quit'.
+    """
+    def __init__(self, events):
+        super().__init__(name="sync-engine", daemon=True)
+        self.events = events
+        self.loop = asyncio.new_event_loop()
+        self.commands = asyncio.Queue()
+
+    def send(self, command, *args):
+        """Encola una orden para el motor (seguro entre hilos)."""
+        self.loop.call_soon_threadsafe(self.commands.put_nowait, (command, args))
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        runner = SyncRunner(self.events)
+        try:
+            metrics.serve(log=lambda text: runner.emit("log", text))
+        except OSError as e:
+            runner.error(f"Could not serve metrics on port {settings.METRICS_PORT}: {e}")
+        while True:
+            command, args = await self.commands.get()
+            if command == "quit":
+                await runner.shutdown()
+                return
+            runner.handle(command, *args)
+
 
 class TelegramSyncService(QObject):
     """
-    Maneja el proceso de sincronización de manera asíncrona.
-    
+    Fachada de la GUI sobre el hilo del motor: traduce los botones a órdenes y los eventos
+    de telemetría a señales Qt (emitidas siempre en el hilo de la GUI).
+
     Señales:
-        log_signal (str): Emite mensajes de registro para mostrar en la consola de la GUI.
+        log_signal (str): Emite bloques de mensajes de registro (una línea por mensaje) para
+            mostrar en la consola de la GUI.
         status_signal (str): Emite actualizaciones breves de estado para la barra de estado.
+        progress_signal (dict): Emite a ritmo fijo el progreso por canal y agregado
+            (ver `scheduler.ChannelSyncScheduler.snapshot`).
         finished_signal (): Emitida cuando el proceso de sincronización finaliza.
         error_signal (str): Emitida cuando ocurre un error crítico.
+        search_signal (dict): Emite cada página de resultados de `search()` (filas de
+            `search.RESULT_COLUMNS`, `next_before_id`, `elapsed` y, en la primera página,
+            el `warning` de `search.legacy_warning`) o su `error`.
     """
     log_signal = Signal(str)
     status_signal = Signal(str)
+    progress_signal = Signal(dict)
     finished_signal = Signal()
     error_signal = Signal(str)
+    search_signal = Signal(dict)
 
     def __init__(self):
         super().__init__()
-        self.client = TelegramClient('telegram_session', settings.API_ID, settings.API_HASH)
-        self.is_running = False
+        self._events = queue.SimpleQueue()
+        self._engine = EngineThread(self._events)
+        self._engine.start()
+        self._timer = QTimer(self)
+        self._timer.setInterval(int(settings.GUI_REFRESH_INTERVAL * 1000))
+        self._timer.timeout.connect(self._drain_events)
+        self._timer.start()
 
-    async def start_sync(self, channel_name=None):
-        self.is_running = True
-        try:
-            if not channel_name:
-                channel_name = settings.CHANNEL_NAME
-            
-            if not channel_name:
-                self.error_signal.emit("Error: No channel selected or CHANNEL_NAME not set")
-                return
+    def start_sync(self, channel_name=None):
+        if not channel_name:
+            channel_name = settings.CHANNEL_NAME
 
-            # Sanitizar el nombre de la colección
-            collection_name = channel_name.strip().split('/')[-1]
-            
-            self.log_signal.emit(f"Checking database for existing messages in collection '{collection_name}'...")
-            min_id = db.get_latest_message_id(collection_name)
-            self.log_signal.emit(f"Last synced message ID: {min_id}")
-
-            self.status_signal.emit("Connecting to Telegram...")
-            await self.client.start(phone=settings.PHONE_NUMBER)
-            
-            self.log_signal.emit(f"Fetching messages from {channel_name} starting from ID {min_id}...")
-            self.status_signal.emit("Syncing messages...")
-
-            messages_to_insert = []
-            count = 0
-            
-            # Obtener historial
-            async for message in self.client.iter_messages(channel_name, min_id=min_id, reverse=True):
-                if not self.is_running:
-                     self.log_signal.emit("Sync stopped by user.")
-                     break
-
-                    if isinstance(message, Message):
-                        msg_dict = message.to_dict()
-
-                        # Manejar Descarga de Multimedia
-                        if message.media:
-                            try:
-                                # Crear estructura de directorios: downloads/{channel}-{msg_id}/
-                                # Usar ruta absoluta para asegurar que sabemos dónde está
-                                # worker está en PROPIOS/RECUPERAR_TELEGRAM_GUI, así que downloads estará allí también por defecto
-                            base_downloads_path = os.path.abspath(settings.DOWNLOADS_DIR)
-                            folder_name = f"{collection_name}-{message.id}"
-                            download_path = os.path.join(base_downloads_path, folder_name)
-                            
-                            os.makedirs(download_path, exist_ok=True)
-                            
-                            self.log_signal.emit(f"Downloading media for message {message.id}...")
-                            # download_media returns the path to the file
-                            saved_path = await message.download_media(file=download_path)
-                            
-                            if saved_path:
-                                # Inicio del cálculo de ruta relativa
-                                # almacenamiento raíz es /mnt/local/datos/MENSAJES_RECUPERADOS_TELEGRAM
-                                # saved_path es /mnt/local/datos/MENSAJES_RECUPERADOS_TELEGRAM/downloads/...
-                                try:
-                                    # Queremos relativo a /mnt/local/datos/MENSAJES_RECUPERADOS_TELEGRAM
-                                    # Así que si el archivo es /mnt/local/datos/MENSAJES_RECUPERADOS_TELEGRAM/downloads/chn-123/img.jpg
-                                    # el relativo debería ser downloads/chn-123/img.jpg
-                                    storage_root = settings.STORAGE_ROOT
-                                    # Asegurar que estamos realmente dentro de esa raíz (solo una comprobación de seguridad, aunque lo forzamos vía settings)
-                                    # Por robustez, si por alguna razón no es relativo, recurrimos a saved_path
-                                    relative_path = os.path.relpath(saved_path, storage_root)
-                                    msg_dict['saved_media_path'] = relative_path
-                                except ValueError:
-                                     # En Windows problemas de división de disco o fallback válido
-                                     msg_dict['saved_media_path'] = saved_path
-                                
-                                self.log_signal.emit(f"Media saved to: {saved_path}")
-                                
-                        except Exception as e:
-                             self.log_signal.emit(f"Failed to download media for message {message.id}: {e}")
-                             # Continuamos incluso si la descarga falla, registrando el error
-
-                    messages_to_insert.append(msg_dict)
-                    
-                    if len(messages_to_insert) >= 100:
-                        db.insert_messages(collection_name, messages_to_insert)
-                        count += len(messages_to_insert)
-                        self.log_signal.emit(f"Synced {count} messages so far...")
-                        messages_to_insert = []
-
-            # Insertar restantes
-            if messages_to_insert:
-                db.insert_messages(collection_name, messages_to_insert)
-                count += len(messages_to_insert)
-
-            if self.is_running:
-                self.log_signal.emit(f"Sync completed. Total new messages: {count}")
-                self.status_signal.emit("Done.")
-            
-        except Exception as e:
-            self.error_signal.emit(f"An error occurred: {e}")
-            self.log_signal.emit(f"Error: {e}")
-        finally:
-            self.is_running = False
+        if not channel_name:
+            self.error_signal.emit("Error: No channel selected or CHANNEL_NAME not set")
             self.finished_signal.emit()
+            return
+
+        self._engine.send("sync", [channel_name], 1)
+
+    def start_sync_all(self, channels, concurrency=None):
+        """
+        Sincroniza varios canales en paralelo sobre el mismo cliente de Telegram.
+        Emite `progress_signal` con el estado de cada canal y el rendimiento agregado.
+        """
+        self._engine.send("sync", list(channels), concurrency)
+
+    def start_backfill(self, channel_name):
+        self._engine.send("backfill", channel_name)
 
     def stop_sync(self):
-        self.is_running = False
+        self._engine.send("stop")
+
+    def search(self, channel_name, criteria, before_id=None):
+        """Pide una página de resultados (ver `search.search_page`); llega por `search_signal`."""
+        self._engine.send("search", channel_name, before_id, criteria)
+
+    def pause_sync(self):
+        self._engine.send("pause")
+
+    def resume_sync(self):
+        self._engine.send("resume")
+
+    def shutdown(self, timeout=10):
+        """Detiene la sincronización en curso y espera (hasta `timeout` s) al hilo del motor."""
+        self._timer.stop()
+        self._engine.send("quit")
+        self._engine.join(timeout)
+        self._drain_events()
+
+    def _drain_events(self):
+        signals = {
+            "log": self.log_signal,
+            "status": self.status_signal,
+            "error": self.error_signal,
+            "search": self.search_signal,
+        }
+        # Solo cuenta el último progreso de cada tanda
+        progress = None
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                progress = payload
+                continue
+            if progress is not None:
+                self.progress_signal.emit(progress)
+                progress = None
+            if kind == "finished":
+                self.finished_signal.emit()
+            else:
+                signals[kind].emit(payload)
+        if progress is not None:
+            self.progress_signal.emit(progress)
@@ -0,0 +1,177 @@
+"""
+Módulo de Escritura por Lotes en Segundo Plano (write-behind).
+
+`MessageWriter` acumula los mensajes que produce el bucle de sincronización y los escribe
+en MongoDB en lotes cuando se alcanza un tamaño (WRITE_BATCH_SIZE) o un tiempo máximo
+(WRITE_FLUSH_INTERVAL). Cada escritura corre en segundo plano, en el pool de hilos de la BD
+(`db.run`), así que el bucle de `iter_messages` no espera a los round trips de Mongo.
+
+Las escrituras se aplican en el mismo orden en que se produjeron los lotes: un lote no se
+escribe hasta que el anterior ha terminado y hasta que han terminado las descargas de
+multimedia de sus propios mensajes. Así lo guardado en la BD es siempre un prefijo de lo
+recorrido, que es lo que necesita la reanudación. Con un `checkpoint.SyncCheckpoint` el
+checkpoint del canal se avanza en el mismo hilo justo después de escribir cada lote.
+
+Cada escritura se cuenta en `metrics`: su latencia y los mensajes insertados, duplicados y
+fallidos.
+"""
+import asyncio
+import time
+
+import db
+import metrics
+import settings
+
+
+class MessageWriter:
+    """
+    Escritor por lotes de una colección de mensajes.
+
+    Uso:
+        writer = MessageWriter(collection_name, log=print)
+        writer.start()
+        await writer.add(msg_dict, pending=download_future)  # puede bloquear (backpressure)
+        ...
+        await writer.close()    # escribe lo que queda y espera a todas las escrituras
+
+    Atributos:
+        flush_size (int): Mensajes por lote.
+        flush_interval (float): Segundos máximos que un mensaje espera en el buffer.
+        totals (db.FlushResult): Recuento acumulado de todas las escrituras.
+        on_flush (callable): Se llama con (lote, FlushResult) tras escribir cada lote.
+        checkpoint (SyncCheckpoint): Si se indica, se avanza tras escribir cada lote.
+        tuner (SyncTuner): Si se indica, fija el tamaño de lote y recibe la latencia de
+            cada escritura (ver `tuning.py`).
+    """
+    def __init__(self, collection_name, flush_size=None, flush_interval=None,
+                 max_pending_flushes=None, log=print, on_flush=None, checkpoint=None, tuner=None):
+        self.collection_name = collection_name
+        self.checkpoint = checkpoint
+        self.tuner = tuner
+        self._flush_size = flush_size or settings.WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.WRITE_FLUSH_INTERVAL
+        self.log = log
+        self.on_flush = on_flush
+        self.totals = db.FlushResult.EMPTY
+        self._buffer = []
+        self._pending = []
+        self._buffer_started = None
+        # Limita los lotes en vuelo (esperando descargas o escribiendo) para acotar memoria
+        self._slots = asyncio.Semaphore(max_pending_flushes or settings.MAX_PENDING_FLUSHES)
+        self._last_flush = None
+        self._flushes = set()
+        self._ticker = None
+
+    @property
+    def flush_size(self):
+        return self.tuner.flush_size if self.tuner else self._flush_size
+
+    @property
+    def pending_flushes(self):
+        return len(self._flushes)
+
+    def start(self):
+        self._ticker = asyncio.create_task(self._tick(), name=f"writer-tick-{self.collection_name}")
+
+    async def add(self, msg_dict, pending=None):
+        """
+        Añade un mensaje al buffer. `pending` es el Future de su descarga de multimedia,
+        si la tiene; el lote no se escribe hasta que se resuelva.
+        """
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.append(msg_dict)
+        if pending is not None:
+            self._pending.append(pending)
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        """Lanza en segundo plano la escritura de lo que haya en el buffer."""
+        if not self._buffer:
+            return
+        batch, pending = self._buffer, self._pending
+        self._buffer, self._pending = [], []
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._write(batch, pending, self._last_flush))
+        self._last_flush = task
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def close(self, discard=False):
+        """
+        Escribe lo que queda y espera a que terminen todas las escrituras.
+        Con `discard=True` descarta el buffer y cancela los lotes que aún esperaban
+        descargas, de modo que la BD se queda en el último prefijo completo.
+        """
+        if self._ticker:
+            self._ticker.cancel()
+            self._ticker = None
+        if discard:
+            self._buffer, self._pending = [], []
+            for task in list(self._flushes):
+                task.cancel()
+        else:
+            await self.flush()
+        await asyncio.gather(*list(self._flushes), return_exceptions=True)
+
+    async def _tick(self):
+        # Escribe los mensajes que llevan demasiado tiempo en el buffer aunque el lote
+        # no esté lleno (p. ej. si el historial va lento o está esperando un FloodWait)
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+            if self._buffer and time.monotonic() - self._buffer_started >= self.flush_interval:
+                await self.flush()
+
+    async def _write(self, batch, pending, previous):
+        try:
+            if previous is not None:
+                # Si el lote anterior se canceló, este también (await propaga la cancelación)
+                await previous
+            if pending:
+                # shield: cancelar el lote no debe cancelar los Futures del pipeline
+                await asyncio.gather(*(asyncio.shield(p) for p in pending))
+
+            started = time.monotonic()
+            try:
+                result = await db.run(self._write_batch, batch)
+            except Exception as e:
+                self.log(f"Error inserting messages into {self.collection_name}: {e}")
+                result = db.FlushResult(0, 0, len(batch), tuple(msg["id"] for msg in batch))
+            else:
+                elapsed = time.monotonic() - started
+                metrics.FLUSH_SECONDS.observe(elapsed, channel=self.collection_name)
+                self.log(
+                    f"Flushed {len(batch)} messages into {self.collection_name} in "
+                    f"{elapsed:.2f}s: {result.inserted} inserted, "
+                    f"{result.duplicates} duplicates, {result.failed} failed"
+                )
+                if self.tuner:
+                    self.tuner.record_flush(len(batch), elapsed)
+
+            self.totals += result
+            metrics.MESSAGES_INSERTED.inc(result.inserted, channel=self.collection_name)
+            metrics.MESSAGES_DUPLICATE.inc(result.duplicates, channel=self.collection_name)
+            metrics.MESSAGES_FAILED.inc(result.failed, channel=self.collection_name)
+            if self.on_flush:
+                self.on_flush(batch, result)
+        finally:
+            self._slots.release()
+
+    def _write_batch(self, batch):
+        # Corre en un hilo: escribe el lote y, solo después, avanza el checkpoint
+        try:
+            result = db.upsert_messages(self.collection_name, batch)
+        except Exception:
+            if self.checkpoint:
+                self.checkpoint.abort()
+            raise
+        if self.checkpoint:
+            try:
+                self.checkpoint.commit(batch, result)
+            except Exception as e:
+                # El lote sí está escrito; solo se pierde el checkpoint de esta ejecución
+                self.checkpoint.abort()
+                self.log(f"Error saving sync checkpoint for {self.collection_name}: {e}")
+        return result